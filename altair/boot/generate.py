@@ -15,7 +15,7 @@ _linker = '''OUTPUT_ARCH(riscv)
 ENTRY(boot_start)
 
 MEMORY {
-       mem : ORIGIN = $ROM_START, LENGTH = 0x00000100
+       mem : ORIGIN = $ROM_START, LENGTH = $ROM_SIZE
 }
 
 SECTIONS {
@@ -44,17 +44,17 @@ all: boot.elf
 '''
 
 def generate_and_load(path: str, start: int, target: int, size: int):
-    _generate_bootrom(path=path, start=start, target=target)
-    return _load_elf(elffile=f'{path}/boot/boot.elf', start=start, size=size)
+    _generate_bootrom(path=path, start=start, target=target, size=size)
+    return load_elf(elffile=f'{path}/boot/boot.elf', start=start, size=size)
 
 
-def _generate_bootrom(path: str, start: int, target: int):
+def _generate_bootrom(path: str, start: int, target: int, size: int):
         outfolder = f'{path}/boot'
         print(f'Create files for boot ROM')
         os.makedirs(outfolder, exist_ok=True)
         # create the files
         code_dict   = dict(RAM_START=f'{target:#010x}')
-        linker_dict = dict(ROM_START=f'{start:#010x}')
+        linker_dict = dict(ROM_START=f'{start:#010x}', ROM_SIZE=f'{4 * size:#010x}')
 
         code   = Template(_boot_code).substitute(code_dict)
         linker = Template(_linker).substitute(linker_dict)
@@ -76,23 +76,27 @@ def _generate_bootrom(path: str, start: int, target: int):
             raise error
 
 
-def _load_elf(elffile: str, start: int, size: int):
-    img = [0 for _ in range(size)]
+def load_elf(elffile: str, start: int, size: int):
+    """Load the segments of an ELF file inside the window [start, start + 4*size) (size in words)"""
+    img = bytearray(4 * size)
     with open(elffile, 'rb') as f:
         e = ELFFile(f)
         # get the number of program headers
         phnum = e.header['e_phnum']
         # get the entries
-        print(f'Loading boot ROM: {elffile}')
+        print(f'Loading image: {elffile}')
         for idx in range(phnum):
             segment = e.get_segment(idx)
-            data    = segment.data()
+            if segment.header['p_type'] != 'PT_LOAD':
+                continue
+            data    = segment.data()[:segment.header['p_filesz']]
             begin   = segment.header['p_paddr']
             end     = begin + segment.header['p_filesz']
+            if begin < start or end > start + len(img):
+                print(f'  - Segment {idx}: Begin = {hex(begin)}. End = {hex(end)}. Outside [{hex(start)}, {hex(start + len(img))}): skip')
+                continue
             print(f'  - Segment {idx}: Begin = {hex(begin)}. End = {hex(end)}')
             # copy to array
-            b = begin - start
-            e = (end - start) >> 2
-            img[b:e] = [int.from_bytes(data[i:i + 4], 'little') for i in range(0, len(data), 4)]
+            img[begin - start:end - start] = data
 
-    return img
+    return [int.from_bytes(img[i:i + 4], 'little') for i in range(0, len(img), 4)]
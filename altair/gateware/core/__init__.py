@@ -1,2 +1,6 @@
 from altair.gateware.core.core import Core as Core
+from altair.gateware.core.pipeline import PipelinedCore as PipelinedCore
 from altair.gateware.core.lrsc import LRSC as LRSC
+from altair.gateware.core.amo import AMOUnit as AMOUnit
+from altair.gateware.core.accelerator import Popcount as Popcount
+from altair.gateware.core.accelerator import CRC32 as CRC32
@@ -0,0 +1,177 @@
+from amaranth import Cat
+from amaranth import Mux
+from amaranth import Repl
+from amaranth import Const
+from amaranth import Record
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Elaboratable
+from amaranth.hdl.rec import DIR_FANIN
+from amaranth.hdl.rec import DIR_FANOUT
+from amaranth.build import Platform
+
+"""
+Accelerator port: custom-0..3 instructions (R-type, RoCC style)
+
+    31      25 24  20 19  15 14  13  12  11   7 6       0
+    | funct7 |  rs2 |  rs1 | xd | xs1 | xs2 | rd | opcode |
+
+The core sends the command (decoded fields and the rs1/rs2 values) when the instruction is
+not speculative anymore. Commands with `xd` expect a response with the value of rd, and
+the core waits for it. Commands without `xd` do not have a response: the core continues
+as soon as the command is accepted.
+"""
+
+accelerator_port_layout = [
+    ('cmd', [
+        ('valid',   1, DIR_FANOUT),
+        ('ready',   1, DIR_FANIN),
+        ('opcode',  2, DIR_FANOUT),  # custom-0..3
+        ('funct7',  7, DIR_FANOUT),
+        ('xd',      1, DIR_FANOUT),
+        ('xs1',     1, DIR_FANOUT),
+        ('xs2',     1, DIR_FANOUT),
+        ('rd',      5, DIR_FANOUT),
+        ('rs1',    32, DIR_FANOUT),
+        ('rs2',    32, DIR_FANOUT)
+    ]),
+    ('resp', [
+        ('valid',   1, DIR_FANIN),
+        ('ready',   1, DIR_FANOUT),
+        ('rd',      5, DIR_FANIN),
+        ('data',   32, DIR_FANIN)
+    ])
+]
+
+
+class Popcount(Elaboratable):
+    """Population count. One command per cycle, the response in the next cycle.
+
+    - funct7 = 0: rd = number of bits set in rs1.
+    - funct7 = 1: rd = number of bits set in rs1 ^ rs2 (Hamming distance).
+    """
+    POPCOUNT = 0
+    HAMMING  = 1
+
+    def __init__(self) -> None:
+        # IO
+        self.port = Record(accelerator_port_layout, name='popcount')
+
+    def _popcount(self, value):
+        # adder tree
+        nodes = [value[idx] for idx in range(len(value))]
+        while len(nodes) > 1:
+            pairs = [a + b for a, b in zip(nodes[0::2], nodes[1::2])]
+            if len(nodes) & 1:
+                pairs.append(nodes[-1])
+            nodes = pairs
+        return nodes[0]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        cmd     = self.port.cmd
+        resp    = self.port.resp
+        operand = Signal(32)
+
+        m.d.comb += [
+            operand.eq(Mux(cmd.funct7 == Popcount.HAMMING, cmd.rs1 ^ cmd.rs2, cmd.rs1)),
+            cmd.ready.eq(~resp.valid | resp.ready)
+        ]
+        with m.If(cmd.valid & cmd.ready):
+            m.d.sync += [
+                resp.valid.eq(cmd.xd),
+                resp.rd.eq(cmd.rd),
+                resp.data.eq(self._popcount(operand))
+            ]
+        with m.Elif(resp.ready):
+            m.d.sync += resp.valid.eq(0)
+
+        return m
+
+
+class CRC32(Elaboratable):
+    """CRC-32 (IEEE 802.3, reflected, polynomial 0xEDB88320), `bytes_per_cycle` bytes per cycle.
+
+    The CRC is a register of the unit: the data is sent without waiting for a response.
+
+    - funct7 = 0: crc = rs1 (usually, 0xFFFFFFFF).
+    - funct7 = 1: update the CRC with the word in rs1 (little-endian: 4 bytes, LSB first).
+    - funct7 = 2: update the CRC with the byte in rs1[7:0].
+    - funct7 = 3: rd = crc (the final XOR is done by software).
+    """
+    INIT = 0
+    WORD = 1
+    BYTE = 2
+    READ = 3
+    POLY = 0xEDB88320
+
+    def __init__(self, bytes_per_cycle: int = 1) -> None:
+        if bytes_per_cycle not in [1, 2, 4]:
+            raise ValueError(f'Invalid CRC32 bytes per cycle: {bytes_per_cycle}. Valid options: 1, 2, 4')
+        # config
+        self._bytes = bytes_per_cycle
+        # IO
+        self.port = Record(accelerator_port_layout, name='crc32')
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        cmd    = self.port.cmd
+        resp   = self.port.resp
+        crc    = Signal(32)
+        data   = Signal(32)
+        nbytes = Signal(range(5))  # bytes left
+        busy   = Signal()
+        nbits  = 8 * self._bytes
+
+        # CRC of the next `nbits` bits of data, one bit at a time
+        steps = [crc]
+        for idx in range(nbits):
+            prev = steps[-1]
+            step = Signal(32, name=f'crc_step{idx}')
+            m.d.comb += step.eq((prev >> 1) ^ (Const(CRC32.POLY, 32) & Repl(prev[0] ^ data[idx], 32)))
+            steps.append(step)
+
+        m.d.comb += [
+            busy.eq(nbytes != 0),
+            cmd.ready.eq(~busy & (~resp.valid | resp.ready))
+        ]
+        with m.If(busy):
+            m.d.sync += [
+                crc.eq(steps[-1]),
+                data.eq(data >> nbits),
+                nbytes.eq(nbytes - self._bytes)
+            ]
+            if self._bytes > 1:
+                # byte command: do not go past the end
+                with m.If(nbytes < self._bytes):
+                    m.d.sync += [
+                        crc.eq(steps[8]),
+                        data.eq(data >> 8),
+                        nbytes.eq(nbytes - 1)
+                    ]
+
+        with m.If(resp.ready):
+            m.d.sync += resp.valid.eq(0)
+        with m.If(cmd.valid & cmd.ready):
+            m.d.sync += [
+                resp.valid.eq(cmd.xd),
+                resp.rd.eq(cmd.rd),
+                resp.data.eq(crc)
+            ]
+            with m.Switch(cmd.funct7):
+                with m.Case(CRC32.INIT):
+                    m.d.sync += crc.eq(cmd.rs1)
+                with m.Case(CRC32.WORD):
+                    m.d.sync += [
+                        data.eq(cmd.rs1),
+                        nbytes.eq(4)
+                    ]
+                with m.Case(CRC32.BYTE):
+                    m.d.sync += [
+                        data.eq(Cat(cmd.rs1[:8], Const(0, 24))),
+                        nbytes.eq(1)
+                    ]
+
+        return m
@@ -0,0 +1,107 @@
+from amaranth import Mux
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Elaboratable
+from amaranth.build import Platform
+from amaranth_soc.wishbone.bus import Interface
+from amaranth_soc.wishbone.bus import CycleType
+from amaranth_soc.wishbone.bus import BurstTypeExt
+from altair.gateware.core.isa import Funct5
+from typing import List
+
+
+class AMOUnit(Elaboratable):
+    """Near-memory atomic memory operations.
+
+    Sits between the master(s) and a slave. An AMO is a single locked write from the core:
+    `dat_w` is the source operand (rs2), and the operation (funct5) is in the `op` sideband.
+    The unit reads the word, writes the result, and answers the master with the old value.
+    The slave is not released between the read and the write, so the operation is atomic
+    for all the masters accessing the slave.
+
+    Other accesses, including LR/SC (also locked), are passed through.
+    """
+    def __init__(self, addr_width: int = 30, features: List[str] = ['err', 'lock']) -> None:
+        # IO
+        self.cpu = Interface(addr_width=addr_width, data_width=32, granularity=8, features=features, name='amo_cpu')
+        self.bus = Interface(addr_width=addr_width, data_width=32, granularity=8, features=features, name='amo')
+        self.op  = Signal(Funct5)  # input
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        amo    = Signal()
+        rdata  = Signal(32)
+        wdata  = Signal(32)
+        result = Signal(32)
+        error  = Signal()
+        if hasattr(self.bus, 'err'):
+            m.d.comb += error.eq(self.bus.err)
+
+        m.d.comb += amo.eq(self.cpu.cyc & self.cpu.stb & self.cpu.lock & self.cpu.we & (self.op != Funct5.SC))
+
+        # ----------------------------------------------------------------------
+        # ALU: old value (bus) and source operand (cpu)
+        old = self.bus.dat_r
+        src = self.cpu.dat_w
+        with m.Switch(self.op):
+            with m.Case(Funct5.AMOADD):
+                m.d.comb += result.eq(old + src)
+            with m.Case(Funct5.AMOAND):
+                m.d.comb += result.eq(old & src)
+            with m.Case(Funct5.AMOMAX):
+                m.d.comb += result.eq(Mux(old.as_signed() > src.as_signed(), old, src))
+            with m.Case(Funct5.AMOMAXU):
+                m.d.comb += result.eq(Mux(old > src, old, src))
+            with m.Case(Funct5.AMOMIN):
+                m.d.comb += result.eq(Mux(old.as_signed() > src.as_signed(), src, old))
+            with m.Case(Funct5.AMOMINU):
+                m.d.comb += result.eq(Mux(old > src, src, old))
+            with m.Case(Funct5.AMOSWAP):
+                m.d.comb += result.eq(src)
+            with m.Case(Funct5.AMOXOR):
+                m.d.comb += result.eq(old ^ src)
+            with m.Case(Funct5.AMOOR):
+                m.d.comb += result.eq(old | src)
+
+        # ----------------------------------------------------------------------
+        # single accesses for the read/write
+        def access(we, data):
+            m.d.comb += [
+                self.bus.adr.eq(self.cpu.adr),
+                self.bus.dat_w.eq(data),
+                self.bus.sel.eq(0b1111),
+                self.bus.we.eq(we),
+                self.bus.cyc.eq(1),
+                self.bus.stb.eq(1),
+                self.bus.lock.eq(1)
+            ]
+            if hasattr(self.bus, 'cti'):
+                m.d.comb += self.bus.cti.eq(CycleType.CLASSIC)
+            if hasattr(self.bus, 'bte'):
+                m.d.comb += self.bus.bte.eq(BurstTypeExt.LINEAR)
+            if hasattr(self.cpu, 'err'):
+                m.d.comb += self.cpu.err.eq(error)
+
+        with m.FSM(name='amo'):
+            with m.State('IDLE'):
+                with m.If(amo):
+                    access(0, 0)
+                    with m.If(self.bus.ack):
+                        m.d.sync += [
+                            rdata.eq(self.bus.dat_r),
+                            wdata.eq(result)
+                        ]
+                        m.next = 'WRITE'
+                with m.Else():
+                    m.d.comb += self.cpu.connect(self.bus)
+            with m.State('WRITE'):
+                access(1, wdata)
+                m.d.comb += [
+                    self.cpu.dat_r.eq(rdata),
+                    self.cpu.ack.eq(self.bus.ack)
+                ]
+                with m.If(self.bus.ack | error):
+                    m.next = 'IDLE'
+
+        return m
@@ -0,0 +1,235 @@
+from amaranth import Signal
+from amaranth import Memory
+from amaranth import Record
+from amaranth import Elaboratable
+from amaranth_soc.wishbone.bus import Arbiter
+from amaranth_soc.wishbone.bus import Interface
+from typing import List
+from altair.gateware.core.isa import Funct5
+from altair.gateware.core.isa import CSRIndex
+from altair.gateware.core.csr import CSRFile
+from altair.gateware.core.lsu import LoadStoreUnit
+from altair.gateware.core.decoder import DecoderUnit
+from altair.gateware.core.exception import ExceptionUnit
+from altair.gateware.core.dcache import DataCache
+from altair.gateware.core.divider import Divider
+from altair.gateware.core.icache import InstructionCache
+from altair.gateware.core.multiplier import Multiplier
+from altair.gateware.core.bitmanip import BitManipUnit
+from altair.gateware.core.compressed import Realigner
+from altair.gateware.core.counters import PerformanceCounters
+from altair.gateware.core.predictor import BranchPredictor
+from altair.gateware.core.prefetch import PrefetchBuffer
+from altair.gateware.core.storebuffer import StoreBuffer
+from altair.gateware.core.tcm import TightlyCoupledMemory
+from altair.gateware.core.accelerator import accelerator_port_layout
+from altair.gateware.debug.trigger import TriggerModule
+
+
+class CoreBase(Elaboratable):
+    """Configuration, units and IO shared by the cores. The cores implement `elaborate`.
+
+    Class attributes:
+    - GPRF_TRANSPARENT: the register file read ports see the write in the same cycle.
+    - BRANCH_PREDICTOR: the core can use the branch predictor.
+    """
+    GPRF_TRANSPARENT = False
+    BRANCH_PREDICTOR = False
+
+    def __init__(self,
+                 # Reset
+                 reset_address: int = 0x8000_0000,
+                 # ISA
+                 enable_rv32m: bool = False,
+                 enable_rv32a: bool = False,
+                 enable_rv32c: bool = False,
+                 enable_zba: bool = False,
+                 enable_zbb: bool = False,
+                 enable_extra_csr: bool = False,
+                 enable_user_mode: bool = False,
+                 hpm_counters: int = 0,
+                 mul_latency: int = 4,
+                 mul_iterative: bool = False,
+                 div_mode: str = 'radix2',
+                 div_early_termination: bool = False,
+                 enable_misaligned_access: bool = False,
+                 enable_near_memory_amo: bool = False,
+                 # Instruction cache
+                 enable_icache: bool = False,
+                 icache_size: int = 4096,
+                 icache_nwords: int = 4,
+                 icache_nways: int = 1,
+                 icache_replacement: str = 'lru',
+                 # Prefetch buffer
+                 enable_prefetch: bool = False,
+                 prefetch_depth: int = 2,
+                 # Data cache
+                 enable_dcache: bool = False,
+                 dcache_size: int = 4096,
+                 dcache_nwords: int = 4,
+                 dcache_nways: int = 1,
+                 dcache_replacement: str = 'lru',
+                 dcache_uncached: List = [],
+                 # Store buffer
+                 enable_store_buffer: bool = False,
+                 store_buffer_depth: int = 4,
+                 # Tightly-coupled memory
+                 enable_tcm: bool = False,
+                 tcm_address: int = 0x0,
+                 tcm_size: int = 4096,
+                 tcm_init: List = [],
+                 # Accelerator (custom-0..3 opcodes)
+                 enable_accelerator: bool = False,
+                 # Branch predictor
+                 enable_branch_predictor: bool = False,
+                 bp_btb_entries: int = 32,
+                 bp_bht_entries: int = 256,
+                 bp_history: int = 0,
+                 bp_ras_depth: int = 4,
+                 # Trigger
+                 enable_triggers: bool = False,
+                 ntriggers: int = 4,
+                 # Debug
+                 debug_enable: bool = False,
+                 # Identification
+                 hartid: int = 0
+                 ) -> None:
+        # ----------------------------------------------------------------------
+        # configuration
+        self.reset_address     = reset_address
+        self.enable_rv32m      = enable_rv32m
+        self.enable_rv32a      = enable_rv32a
+        self.enable_rv32c      = enable_rv32c
+        self.enable_zba        = enable_zba
+        self.enable_zbb        = enable_zbb
+        self.enable_extra_csr  = enable_extra_csr
+        self.enable_user_mode  = enable_user_mode
+        self.hpm_counters      = hpm_counters
+        self.enable_misaligned = enable_misaligned_access
+        self.enable_near_amo   = enable_near_memory_amo
+        self.enable_icache     = enable_icache
+        self.enable_prefetch   = enable_prefetch
+        self.enable_fetchunit  = enable_icache or enable_prefetch
+        self.enable_dcache     = enable_dcache
+        self.enable_sbuffer    = enable_store_buffer
+        self.enable_tcm        = enable_tcm
+        self.enable_accel      = enable_accelerator
+        self.enable_predictor  = enable_branch_predictor
+        self._bp_history       = bp_history if enable_branch_predictor else 0
+        self.enable_trigger    = enable_triggers
+        self.trigger_ntriggers = ntriggers
+        self.debug_enable      = debug_enable
+        if self.enable_predictor and not self.BRANCH_PREDICTOR:
+            raise ValueError('The branch predictor is only available in the pipelined core')
+        if self.enable_near_amo and not self.enable_rv32a:
+            raise ValueError('Near-memory AMOs require the RV32A extension')
+        features = ['err', 'cti', 'bte', 'lock'] if enable_rv32a else ['err', 'cti', 'bte']
+        # Instantiate units
+        self._lsu        = LoadStoreUnit(features=features, misaligned=enable_misaligned_access)
+        self._decoder    = DecoderUnit(self.enable_rv32m,
+                                       self.enable_rv32a,
+                                       enable_custom=self.enable_accel,
+                                       enable_zba=self.enable_zba,
+                                       enable_zbb=self.enable_zbb)
+        self._csr        = CSRFile()
+        self._exceptunit = ExceptionUnit(csrf=self._csr,
+                                         hartid=hartid,
+                                         enable_rv32m=self.enable_rv32m,
+                                         enable_rv32c=self.enable_rv32c,
+                                         enable_extra_csr=self.enable_extra_csr,
+                                         enable_user_mode=self.enable_user_mode,
+                                         reset_address=self.reset_address)
+        if self.enable_rv32a:
+            # failed SCs: contention on the reservations
+            self._mscfail = self._csr.add_register('mscfail', CSRIndex.MSCFAIL)
+        if self.enable_extra_csr:
+            # cycles waiting for the interconnect (arbitration)
+            self._mbuswait = self._csr.add_register('mbuswait', CSRIndex.MBUSWAIT)
+        if self.hpm_counters:
+            if not self.enable_extra_csr:
+                raise ValueError('The performance counters require the extra CSRs (mcountinhibit)')
+            self._hpm = PerformanceCounters(csrf=self._csr, ncounters=self.hpm_counters)
+        gprf           = Memory(width=32, depth=32)
+        self._gprf_rp1 = gprf.read_port(transparent=self.GPRF_TRANSPARENT)
+        self._gprf_rp2 = gprf.read_port(transparent=self.GPRF_TRANSPARENT)
+        self._gprf_wp  = gprf.write_port()
+        if self.enable_rv32m:
+            self._multiplier = Multiplier(latency=mul_latency, iterative=mul_iterative)
+            self._divider    = Divider(mode=div_mode, early_termination=div_early_termination)
+        if self.enable_zbb:
+            self._bitmanip = BitManipUnit()
+        if self.enable_rv32c:
+            self._realigner = Realigner()
+        if self.enable_tcm:
+            self._tcm = TightlyCoupledMemory(address=tcm_address,
+                                             size=tcm_size,
+                                             init=tcm_init,
+                                             amo=self.enable_near_amo,
+                                             features=features)
+            # the TCM is never cached
+            dcache_uncached = [*dcache_uncached, [tcm_address, self._tcm.addr_width]]
+        dport = self._lsu.mport
+        if self.enable_sbuffer:
+            # the uncached windows are the I/O regions
+            self._sbuffer = StoreBuffer(depth=store_buffer_depth, io=dcache_uncached, features=features)
+            dport         = self._sbuffer.bus
+        if self.enable_dcache:
+            self._dcache = DataCache(size=dcache_size,
+                                     nwords=dcache_nwords,
+                                     nways=dcache_nways,
+                                     replacement=dcache_replacement,
+                                     uncached=dcache_uncached,
+                                     features=features)
+            dport        = self._dcache.bus
+        if self.enable_icache and self.enable_prefetch:
+            raise ValueError('The instruction cache and the prefetch buffer are mutually exclusive')
+        if self.enable_icache:
+            self._fetchunit = InstructionCache(size=icache_size,
+                                               nwords=icache_nwords,
+                                               nways=icache_nways,
+                                               replacement=icache_replacement,
+                                               features=features)
+        elif self.enable_prefetch:
+            self._fetchunit = PrefetchBuffer(depth=prefetch_depth, features=features)
+        if self.enable_fetchunit:
+            self._arbiter = Arbiter(addr_width=30, data_width=32, granularity=8, features=features)
+            self._arbiter.add(self._fetchunit.bus)
+            self._arbiter.add(dport)
+        self._dport = dport
+        if self.enable_predictor:
+            self._predictor = BranchPredictor(csrf=self._csr,
+                                              btb_entries=bp_btb_entries,
+                                              bht_entries=bp_bht_entries,
+                                              history=bp_history,
+                                              ras_depth=bp_ras_depth,
+                                              enable_rv32c=self.enable_rv32c)
+        if self.enable_trigger:
+            self._trigger = TriggerModule(privmode=self._exceptunit.m_privmode,
+                                          ntriggers=self.trigger_ntriggers,
+                                          csrf=self._csr,
+                                          enable_user_mode=self.enable_user_mode)
+        # IO
+        self.wbport             = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='wbport')
+        self.external_interrupt = Signal()  # input
+        self.timer_interrupt    = Signal()  # input
+        self.software_interrupt = Signal()  # input
+        self.bus_wait           = Signal()  # input: waiting for the grant of the interconnect
+        if self.enable_near_amo:
+            self.amo_op = Signal(Funct5)  # output: AMO operation, sideband of wbport
+        if self.enable_accel:
+            self.accelerator = Record(accelerator_port_layout, name='accelerator')  # custom instructions
+
+    def port_list(self) -> List:
+        mport = [getattr(self.wbport, name) for name, _, _ in self.wbport.layout]
+        if self.enable_near_amo:
+            mport.append(self.amo_op)
+        if self.enable_accel:
+            mport += [*self.accelerator.cmd.fields.values(), *self.accelerator.resp.fields.values()]
+
+        return [
+            *mport,
+            self.external_interrupt,
+            self.timer_interrupt,
+            self.software_interrupt,
+            self.bus_wait
+        ]
@@ -0,0 +1,101 @@
+from enum import IntEnum
+from amaranth import Cat
+from amaranth import Mux
+from amaranth import Repl
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Elaboratable
+from amaranth.build import Platform
+
+
+class BitManipOp(IntEnum):
+    CLZ   = 0
+    CTZ   = 1
+    CPOP  = 2
+    SEXTB = 3
+    SEXTH = 4
+    ZEXTH = 5
+    REV8  = 6
+    ORCB  = 7
+    MIN   = 8
+    MINU  = 9
+    MAX   = 10
+    MAXU  = 11
+
+
+class BitManipUnit(Elaboratable):
+    """Zbb operations that do not fit in the adder, logic or shift units (combinational):
+    count leading/trailing zeros, population count, sign/zero extension, byte reverse,
+    OR-combine and min/max.
+
+    The other Zba/Zbb instructions use the ALU: shNadd (adder, rs1 shifted), andn/orn/xnor
+    (logic, rs2 inverted) and rotates (shifter).
+    """
+    def __init__(self) -> None:
+        # IO
+        self.op     = Signal(BitManipOp)  # input
+        self.dat1   = Signal(32)  # input
+        self.dat2   = Signal(32)  # input
+        self.result = Signal(32)  # output
+
+    def _clz(self, value):
+        # (leading zeros, all zeros), by halves
+        if len(value) == 1:
+            return value[0] == 0, value[0] == 0
+        half              = len(value) // 2
+        lo_count, lo_zero = self._clz(value[:half])
+        hi_count, hi_zero = self._clz(value[half:])
+        return Mux(hi_zero, half + lo_count, hi_count), hi_zero & lo_zero
+
+    def _cpop(self, value):
+        # adder tree
+        nodes = [value[idx] for idx in range(len(value))]
+        while len(nodes) > 1:
+            pairs = [a + b for a, b in zip(nodes[0::2], nodes[1::2])]
+            if len(nodes) & 1:
+                pairs.append(nodes[-1])
+            nodes = pairs
+        return nodes[0]
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        dat1     = self.dat1
+        dat2     = self.dat2
+        dat1_rev = Cat(dat1[idx] for idx in range(31, -1, -1))
+        byte     = [dat1[8 * idx:8 * (idx + 1)] for idx in range(4)]
+        lt       = Signal()
+        ltu      = Signal()
+
+        m.d.comb += [
+            lt.eq(dat1.as_signed() < dat2.as_signed()),
+            ltu.eq(dat1 < dat2)
+        ]
+
+        with m.Switch(self.op):
+            with m.Case(BitManipOp.CLZ):
+                m.d.comb += self.result.eq(self._clz(dat1)[0])
+            with m.Case(BitManipOp.CTZ):
+                m.d.comb += self.result.eq(self._clz(dat1_rev)[0])
+            with m.Case(BitManipOp.CPOP):
+                m.d.comb += self.result.eq(self._cpop(dat1))
+            with m.Case(BitManipOp.SEXTB):
+                m.d.comb += self.result.eq(Cat(dat1[:8], Repl(dat1[7], 24)))
+            with m.Case(BitManipOp.SEXTH):
+                m.d.comb += self.result.eq(Cat(dat1[:16], Repl(dat1[15], 16)))
+            with m.Case(BitManipOp.ZEXTH):
+                m.d.comb += self.result.eq(dat1[:16])
+            with m.Case(BitManipOp.REV8):
+                m.d.comb += self.result.eq(Cat(*byte[::-1]))
+            with m.Case(BitManipOp.ORCB):
+                m.d.comb += self.result.eq(Cat(Repl(b.any(), 8) for b in byte))
+            with m.Case(BitManipOp.MIN):
+                m.d.comb += self.result.eq(Mux(lt, dat1, dat2))
+            with m.Case(BitManipOp.MINU):
+                m.d.comb += self.result.eq(Mux(ltu, dat1, dat2))
+            with m.Case(BitManipOp.MAX):
+                m.d.comb += self.result.eq(Mux(lt, dat2, dat1))
+            with m.Case(BitManipOp.MAXU):
+                m.d.comb += self.result.eq(Mux(ltu, dat2, dat1))
+
+        return m
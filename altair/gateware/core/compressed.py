@@ -0,0 +1,256 @@
+from amaranth import Cat
+from amaranth import Mux
+from amaranth import Repl
+from amaranth import Const
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Elaboratable
+from amaranth.build import Platform
+from altair.gateware.core.isa import Opcode
+from altair.gateware.core.isa import Funct3
+from altair.gateware.core.isa import Funct7
+from altair.gateware.core.isa import Funct12
+
+"""
+RV32C: compressed instructions
+
+The realigner turns the stream of 32-bit words into instructions at 16-bit boundaries, and
+the expander replaces each 16-bit instruction with the equivalent 32-bit instruction, so the
+decoder and the rest of the core only see 32-bit instructions.
+"""
+
+
+def _r(funct7, rs2, rs1, funct3, rd, opcode):
+    return Cat(Const(opcode, 7), rd, Const(funct3, 3), rs1, rs2, Const(funct7, 7))
+
+
+def _i(imm, rs1, funct3, rd, opcode):
+    return Cat(Const(opcode, 7), rd, Const(funct3, 3), rs1, imm)
+
+
+def _s(imm, rs2, rs1, funct3, opcode):
+    return Cat(Const(opcode, 7), imm[0:5], Const(funct3, 3), rs1, rs2, imm[5:12])
+
+
+def _b(imm, rs2, rs1, funct3, opcode):
+    return Cat(Const(opcode, 7), imm[11], imm[1:5], Const(funct3, 3), rs1, rs2, imm[5:11], imm[12])
+
+
+def _u(imm, rd, opcode):
+    return Cat(Const(opcode, 7), rd, imm)
+
+
+def _j(imm, rd, opcode):
+    return Cat(Const(opcode, 7), rd, imm[12:20], imm[11], imm[1:11], imm[20])
+
+
+class Expander(Elaboratable):
+    """16-bit to 32-bit instruction expansion (combinational). RV32C without the
+    floating-point instructions.
+
+    Reserved encodings, and the floating-point loads/stores, expand to zero (illegal
+    instruction).
+    """
+    def __init__(self) -> None:
+        # IO
+        self.instruction = Signal(16)  # input
+        self.expanded    = Signal(32)  # output
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        inst   = self.instruction
+        op     = inst[0:2]
+        funct3 = inst[13:16]
+        rd     = inst[7:12]  # also rs1
+        rs2    = inst[2:7]
+        rd_p   = Cat(inst[2:5], Const(0b01, 2))  # x8-x15
+        rs1_p  = Cat(inst[7:10], Const(0b01, 2))
+        rs2_p  = rd_p
+        x0     = Const(0, 5)
+        ra     = Const(1, 5)
+        sp     = Const(2, 5)
+        # immediates
+        imm6      = Cat(inst[2:7], Repl(inst[12], 7))
+        shamt     = Cat(inst[2:7], Const(0, 7))
+        shamt_sra = Cat(inst[2:7], Const(Funct7.SRA, 7))
+        imm_4spn  = Cat(Const(0, 2), inst[6], inst[5], inst[11:13], inst[7:11], Const(0, 2))
+        imm_lw    = Cat(Const(0, 2), inst[6], inst[10:13], inst[5], Const(0, 5))
+        imm_16sp  = Cat(Const(0, 4), inst[6], inst[2], inst[5], inst[3:5], Repl(inst[12], 3))
+        imm_lui   = Cat(inst[2:7], Repl(inst[12], 15))
+        imm_j     = Cat(Const(0, 1), inst[3:6], inst[11], inst[2], inst[7], inst[6], inst[9:11], inst[8], Repl(inst[12], 10))
+        imm_b     = Cat(Const(0, 1), inst[3:5], inst[10:12], inst[2], inst[5:7], Repl(inst[12], 5))
+        imm_lwsp  = Cat(Const(0, 2), inst[4:7], inst[12], inst[2:4], Const(0, 4))
+        imm_swsp  = Cat(Const(0, 2), inst[9:13], inst[7:9], Const(0, 4))
+
+        # default: illegal
+        m.d.comb += self.expanded.eq(0)
+
+        with m.Switch(Cat(op, funct3)):  # funct3, quadrant
+            # ------------------------------------------------------------------
+            # Quadrant 0
+            with m.Case('000 00'):  # c.addi4spn
+                with m.If(imm_4spn.any()):
+                    m.d.comb += self.expanded.eq(_i(imm_4spn, sp, Funct3.ADD, rd_p, Opcode.OP_IMM))
+            with m.Case('010 00'):  # c.lw
+                m.d.comb += self.expanded.eq(_i(imm_lw, rs1_p, Funct3.W, rd_p, Opcode.LOAD))
+            with m.Case('110 00'):  # c.sw
+                m.d.comb += self.expanded.eq(_s(imm_lw, rs2_p, rs1_p, Funct3.W, Opcode.STORE))
+            # ------------------------------------------------------------------
+            # Quadrant 1
+            with m.Case('000 01'):  # c.addi, c.nop
+                m.d.comb += self.expanded.eq(_i(imm6, rd, Funct3.ADD, rd, Opcode.OP_IMM))
+            with m.Case('001 01'):  # c.jal
+                m.d.comb += self.expanded.eq(_j(imm_j, ra, Opcode.JAL))
+            with m.Case('010 01'):  # c.li
+                m.d.comb += self.expanded.eq(_i(imm6, x0, Funct3.ADD, rd, Opcode.OP_IMM))
+            with m.Case('011 01'):  # c.addi16sp, c.lui
+                with m.If(rd == 2):
+                    with m.If(imm_16sp.any()):
+                        m.d.comb += self.expanded.eq(_i(imm_16sp, sp, Funct3.ADD, sp, Opcode.OP_IMM))
+                with m.Elif(imm6.any()):
+                    m.d.comb += self.expanded.eq(_u(imm_lui, rd, Opcode.LUI))
+            with m.Case('100 01'):  # c.srli, c.srai, c.andi, c.sub, c.xor, c.or, c.and
+                with m.Switch(inst[10:12]):
+                    with m.Case(0b00):
+                        with m.If(~inst[12]):
+                            m.d.comb += self.expanded.eq(_i(shamt, rs1_p, Funct3.SR, rs1_p, Opcode.OP_IMM))
+                    with m.Case(0b01):
+                        with m.If(~inst[12]):
+                            m.d.comb += self.expanded.eq(_i(shamt_sra, rs1_p, Funct3.SR, rs1_p, Opcode.OP_IMM))
+                    with m.Case(0b10):
+                        m.d.comb += self.expanded.eq(_i(imm6, rs1_p, Funct3.AND, rs1_p, Opcode.OP_IMM))
+                    with m.Case(0b11):
+                        with m.If(~inst[12]):
+                            with m.Switch(inst[5:7]):
+                                with m.Case(0b00):
+                                    m.d.comb += self.expanded.eq(_r(Funct7.SUB, rs2_p, rs1_p, Funct3.ADD, rs1_p, Opcode.OP))
+                                with m.Case(0b01):
+                                    m.d.comb += self.expanded.eq(_r(0, rs2_p, rs1_p, Funct3.XOR, rs1_p, Opcode.OP))
+                                with m.Case(0b10):
+                                    m.d.comb += self.expanded.eq(_r(0, rs2_p, rs1_p, Funct3.OR, rs1_p, Opcode.OP))
+                                with m.Case(0b11):
+                                    m.d.comb += self.expanded.eq(_r(0, rs2_p, rs1_p, Funct3.AND, rs1_p, Opcode.OP))
+            with m.Case('101 01'):  # c.j
+                m.d.comb += self.expanded.eq(_j(imm_j, x0, Opcode.JAL))
+            with m.Case('110 01'):  # c.beqz
+                m.d.comb += self.expanded.eq(_b(imm_b, x0, rs1_p, Funct3.BEQ, Opcode.BRANCH))
+            with m.Case('111 01'):  # c.bnez
+                m.d.comb += self.expanded.eq(_b(imm_b, x0, rs1_p, Funct3.BNE, Opcode.BRANCH))
+            # ------------------------------------------------------------------
+            # Quadrant 2
+            with m.Case('000 10'):  # c.slli
+                with m.If(~inst[12]):
+                    m.d.comb += self.expanded.eq(_i(shamt, rd, Funct3.SLL, rd, Opcode.OP_IMM))
+            with m.Case('010 10'):  # c.lwsp
+                with m.If(rd.any()):
+                    m.d.comb += self.expanded.eq(_i(imm_lwsp, sp, Funct3.W, rd, Opcode.LOAD))
+            with m.Case('100 10'):  # c.jr, c.mv, c.ebreak, c.jalr, c.add
+                with m.If(~inst[12]):
+                    with m.If(rs2.any()):
+                        m.d.comb += self.expanded.eq(_r(0, rs2, x0, Funct3.ADD, rd, Opcode.OP))
+                    with m.Elif(rd.any()):
+                        m.d.comb += self.expanded.eq(_i(Const(0, 12), rd, 0, x0, Opcode.JALR))
+                with m.Else():
+                    with m.If(rs2.any()):
+                        m.d.comb += self.expanded.eq(_r(0, rs2, rd, Funct3.ADD, rd, Opcode.OP))
+                    with m.Elif(rd.any()):
+                        m.d.comb += self.expanded.eq(_i(Const(0, 12), rd, 0, ra, Opcode.JALR))
+                    with m.Else():
+                        m.d.comb += self.expanded.eq(_i(Const(Funct12.EBREAK, 12), x0, Funct3.PRIV, x0, Opcode.SYSTEM))
+            with m.Case('110 10'):  # c.swsp
+                m.d.comb += self.expanded.eq(_s(imm_swsp, rs2, sp, Funct3.W, Opcode.STORE))
+
+        return m
+
+
+class Realigner(Elaboratable):
+    """Instruction realigner for 16-bit aligned instructions.
+
+    The instruction at `pc` is read from the 32-bit aligned word at `address`. The upper half
+    of the last word read is kept in a buffer, so:
+
+    - A 32-bit instruction that crosses a word boundary takes the buffered half plus one
+      read. Without the buffer, it takes two reads (the first one fills the buffer).
+    - A 16-bit instruction in the upper half of the last word read does not need a read
+      (`fetch` = 0): sequential compressed code reads each word once.
+
+    The buffer is a copy of the memory: invalidate it (`flush`) on fence.i.
+    """
+    def __init__(self) -> None:
+        # IO
+        self.pc          = Signal(32)  # input: address of the instruction
+        self.request     = Signal()    # input
+        self.flush       = Signal()    # input
+        self.address     = Signal(32)  # output: word to read
+        self.fetch       = Signal()    # output: read `address`
+        self.data        = Signal(32)  # input: word read
+        self.ready       = Signal()    # input: `data` is valid
+        self.instruction = Signal(32)  # output: expanded instruction
+        self.raw         = Signal(32)  # output: instruction as read (16-bit: zero-extended), for mtval
+        self.compressed  = Signal()    # output
+        self.valid       = Signal()    # output
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        expander = m.submodules.expander = Expander()
+
+        hi_valid = Signal()
+        hi_addr  = Signal(30)
+        hi_data  = Signal(16)
+        hit      = Signal()
+        raw      = Signal(32)
+        complete = Signal()
+
+        m.d.comb += hit.eq(hi_valid & (hi_addr == self.pc[2:]))
+
+        with m.If(~self.pc[1]):
+            # aligned: one read
+            m.d.comb += [
+                self.address.eq(Cat(Const(0, 2), self.pc[2:])),
+                self.fetch.eq(1),
+                raw.eq(self.data),
+                complete.eq(self.ready)
+            ]
+        with m.Elif(hit & (hi_data[:2] != 0b11)):
+            # 16-bit, from the buffer
+            m.d.comb += [
+                raw.eq(hi_data),
+                complete.eq(1)
+            ]
+        with m.Elif(hit):
+            # 32-bit: buffered half + lower half of the next word
+            m.d.comb += [
+                self.address.eq(Cat(Const(0, 2), self.pc[2:] + 1)),
+                self.fetch.eq(1),
+                raw.eq(Cat(hi_data, self.data[:16])),
+                complete.eq(self.ready)
+            ]
+        with m.Else():
+            # read the word with the lower half. A 32-bit instruction needs another read
+            m.d.comb += [
+                self.address.eq(Cat(Const(0, 2), self.pc[2:])),
+                self.fetch.eq(1),
+                raw.eq(self.data[16:]),
+                complete.eq(self.ready & (self.data[16:18] != 0b11))
+            ]
+
+        m.d.comb += [
+            expander.instruction.eq(raw[:16]),
+            self.compressed.eq(raw[:2] != 0b11),
+            self.instruction.eq(Mux(self.compressed, expander.expanded, raw)),
+            self.raw.eq(Mux(self.compressed, raw[:16], raw)),
+            self.valid.eq(self.request & complete)
+        ]
+
+        with m.If(self.flush):
+            m.d.sync += hi_valid.eq(0)
+        with m.Elif(self.request & self.fetch & self.ready):
+            m.d.sync += [
+                hi_valid.eq(1),
+                hi_addr.eq(self.address[2:]),
+                hi_data.eq(self.data[16:])
+            ]
+
+        return m
@@ -2,87 +2,16 @@ from amaranth import Cat
 from amaranth import Mux
 from amaranth import Signal
 from amaranth import Module
-from amaranth import Memory
-from amaranth import Elaboratable
 from amaranth.build import Platform
-from amaranth_soc.wishbone.bus import Interface
-from typing import List
 from altair.gateware.core.isa import Funct3
 from altair.gateware.core.isa import ExceptionCause
-from altair.gateware.core.csr import CSRFile
-from altair.gateware.core.lsu import LoadStoreUnit
-from altair.gateware.core.decoder import DecoderUnit
-from altair.gateware.core.exception import ExceptionUnit
-from altair.gateware.core.divider import Divider
-from altair.gateware.core.multiplier import Multiplier
-from altair.gateware.debug.trigger import TriggerModule
-
-
-class Core(Elaboratable):
-    def __init__(self,
-                 # Reset
-                 reset_address: int = 0x8000_0000,
-                 # ISA
-                 enable_rv32m: bool = False,
-                 enable_rv32a: bool = False,
-                 enable_extra_csr: bool = False,
-                 enable_user_mode: bool = False,
-                 # Trigger
-                 enable_triggers: bool = False,
-                 ntriggers: int = 4,
-                 # Debug
-                 debug_enable: bool = False,
-                 # Identification
-                 hartid: int = 0
-                 ) -> None:
-        # ----------------------------------------------------------------------
-        # configuration
-        self.reset_address     = reset_address
-        self.enable_rv32m      = enable_rv32m
-        self.enable_rv32a      = enable_rv32a
-        self.enable_extra_csr  = enable_extra_csr
-        self.enable_user_mode  = enable_user_mode
-        self.enable_trigger    = enable_triggers
-        self.trigger_ntriggers = ntriggers
-        self.debug_enable      = debug_enable
-        features = ['err', 'lock'] if enable_rv32a else ['err']
-        # Instantiate units
-        self._lsu        = LoadStoreUnit(features=features)
-        self._decoder    = DecoderUnit(self.enable_rv32m, self.enable_rv32a)
-        self._csr        = CSRFile()
-        self._exceptunit = ExceptionUnit(csrf=self._csr,
-                                         hartid=hartid,
-                                         enable_rv32m=self.enable_rv32m,
-                                         enable_extra_csr=self.enable_extra_csr,
-                                         enable_user_mode=self.enable_user_mode,
-                                         reset_address=self.reset_address)
-        gprf           = Memory(width=32, depth=32)
-        self._gprf_rp1 = gprf.read_port(transparent=False)
-        self._gprf_rp2 = gprf.read_port(transparent=False)
-        self._gprf_wp  = gprf.write_port()
-        if self.enable_rv32m:
-            self._multiplier = Multiplier()
-            self._divider    = Divider()
-        if self.enable_trigger:
-            self._trigger = TriggerModule(privmode=self._exceptunit.m_privmode,
-                                          ntriggers=self.trigger_ntriggers,
-                                          csrf=self._csr,
-                                          enable_user_mode=self.enable_user_mode)
-        # IO
-        self.wbport             = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='wbport')
-        self.external_interrupt = Signal()  # input
-        self.timer_interrupt    = Signal()  # input
-        self.software_interrupt = Signal()  # input
-
-    def port_list(self) -> List:
-        mport = [getattr(self.wbport, name) for name, _, _ in self.wbport.layout]
-
-        return [
-            *mport,
-            self.external_interrupt,
-            self.timer_interrupt,
-            self.software_interrupt
-        ]
+from altair.gateware.core.counters import HPMEvent
+from altair.gateware.core.base import CoreBase
+
+
+class Core(CoreBase):
+    # fetch waits for the branch resolution: nothing to predict
+    BRANCH_PREDICTOR = False
 
     def str2value(self, string: str):
         val = 0
@@ -104,22 +33,40 @@ class Core(Elaboratable):
         div_result  = Signal(32)
         div_ack     = Signal()
         instruction = Signal(32)
+        raw_inst    = Signal(32)  # instruction as fetched, for mtval (16-bit: not expanded)
         alu_a       = Signal(32)
         alu_b       = Signal(32)
         cmp_b       = Signal(32)
         add_out     = Signal(32)
         logic_out   = Signal(32)
         shift_out   = Signal(32)
-        csr_out     = Signal(32)
         ld_out      = Signal(32)
         is_eq       = Signal()
         is_lt       = Signal()
         is_ltu      = Signal()
         ltx_cmp_out = Signal()
+        add_x       = Signal(32)  # EXECUTE: combinational results
+        logic_x     = Signal(32)
+        shift_x     = Signal(32)
+        is_eq_x     = Signal()
+        is_lt_x     = Signal()
+        is_ltu_x    = Signal()
+        ltx_cmp_x   = Signal()
+        b_taken_x   = Signal()
+        jb_taken    = Signal()  # a taken branch/jump retires
+        fast        = Signal()
+        next_pc     = Signal(32)
         jb_error    = Signal()
+        jb_error_x  = Signal()
+        compressed  = Signal()
         multdiv     = Signal()
         csr_src     = Signal(32)
         csr_wdata   = Signal(32)
+        rs1_data    = Signal(32)
+        rs2_data    = Signal(32)
+        rs1_fwd     = Signal()
+        rs2_fwd     = Signal()
+        fwd_data    = Signal(32)
         # ----------------------------------------------------------------------
         # Register units
         m.submodules.lsu       = self._lsu
@@ -133,15 +80,15 @@ class Core(Elaboratable):
             m.submodules.divider    = self._divider
             m.d.comb += [
                 self._multiplier.op.eq(self._decoder.funct3),
-                self._multiplier.dat1.eq(self._gprf_rp1.data),
-                self._multiplier.dat2.eq(self._gprf_rp2.data),
+                self._multiplier.dat1.eq(rs1_data),
+                self._multiplier.dat2.eq(rs2_data),
                 self._multiplier.valid.eq(multdiv & self._decoder.is_mul),
                 mult_result.eq(self._multiplier.result),
                 mult_ack.eq(self._multiplier.ready),
 
                 self._divider.op.eq(self._decoder.funct3),
-                self._divider.dat1.eq(self._gprf_rp1.data),
-                self._divider.dat2.eq(self._gprf_rp2.data),
+                self._divider.dat1.eq(rs1_data),
+                self._divider.dat2.eq(rs2_data),
                 self._divider.valid.eq(multdiv & self._decoder.is_div),
                 div_result.eq(self._divider.result),
                 div_ack.eq(self._divider.ready)
@@ -153,6 +100,25 @@ class Core(Elaboratable):
                 mult_ack.eq(0),
                 div_ack.eq(0)
             ]
+        if self.enable_accel:
+            m.d.comb += [
+                self.accelerator.cmd.opcode.eq(instruction[5:7]),
+                self.accelerator.cmd.funct7.eq(instruction[25:32]),
+                self.accelerator.cmd.xd.eq(instruction[14]),
+                self.accelerator.cmd.xs1.eq(instruction[13]),
+                self.accelerator.cmd.xs2.eq(instruction[12]),
+                self.accelerator.cmd.rd.eq(instruction[7:12]),
+                self.accelerator.cmd.rs1.eq(rs1_data),
+                self.accelerator.cmd.rs2.eq(rs2_data)
+            ]
+
+        if self.enable_zbb:
+            m.submodules.bitmanip = self._bitmanip
+            m.d.comb += [
+                self._bitmanip.op.eq(self._decoder.bitmanip_op),
+                self._bitmanip.dat1.eq(rs1_data),
+                self._bitmanip.dat2.eq(rs2_data)
+            ]
 
         if self.enable_trigger:
             m.submodules.trigger = self._trigger
@@ -161,61 +127,132 @@ class Core(Elaboratable):
                 self._trigger.x_bus_addr.eq(add_out)
             ]
 
-        # Memory port
-        m.d.comb += self._lsu.mport.connect(self.wbport)
+        # Memory port. With the TCM: core <-> TCM <-> Wishbone port
+        wbport = self.wbport
+        if self.enable_tcm:
+            m.submodules.tcm = self._tcm
+            m.d.comb += self._tcm.bus.connect(self.wbport)
+            if self.enable_near_amo:
+                m.d.comb += self._tcm.op.eq(self.amo_op)
+            wbport = self._tcm.cpu
+        lsu_port = self._lsu.mport
+        if self.enable_sbuffer:
+            m.submodules.sbuffer = self._sbuffer
+            m.d.comb += lsu_port.connect(self._sbuffer.cpu)
+            lsu_port = self._sbuffer.bus
+        if self.enable_dcache:
+            m.submodules.dcache = self._dcache
+            m.d.comb += lsu_port.connect(self._dcache.cpu)
+        if self.enable_fetchunit:
+            m.submodules.fetchunit = self._fetchunit
+            m.submodules.arbiter   = self._arbiter
+            m.d.comb += self._arbiter.bus.connect(wbport)
+            fetch_data       = self._fetchunit.data
+            fetch_ready      = self._fetchunit.ready
+            fetch_error      = self._fetchunit.error
+            fetch_misaligned = self._fetchunit.misaligned
+            if self.enable_prefetch:
+                # end the prefetch burst when the data port waits for the bus
+                m.d.comb += self._fetchunit.release.eq(self._dport.cyc)
+        else:
+            m.d.comb += self._dport.connect(wbport)
+            fetch_data       = self._lsu.load_data
+            fetch_ready      = self._lsu.ready
+            fetch_error      = self._lsu.error
+            fetch_misaligned = self._lsu.misaligned
+        if self.enable_rv32c:
+            # 16-bit aligned instructions: realign and expand before decoding
+            m.submodules.realigner = self._realigner
+            m.d.comb += [
+                self._realigner.data.eq(fetch_data),
+                self._realigner.ready.eq(fetch_ready)
+            ]
+            inst_data  = self._realigner.instruction
+            inst_raw   = self._realigner.raw
+            inst_ready = self._realigner.valid
+        else:
+            inst_data  = fetch_data
+            inst_raw   = fetch_data
+            inst_ready = fetch_ready
 
         # ALU A
         with m.If(self._decoder.inst_lui):
             m.d.comb += alu_a.eq(0)
         with m.Elif(self._decoder.inst_auipc | self._decoder.inst_jal | self._decoder.is_b):
             m.d.comb += alu_a.eq(pc)
+        if self.enable_zba:
+            with m.Elif(self._decoder.inst_sh1add):
+                m.d.comb += alu_a.eq(rs1_data << 1)
+            with m.Elif(self._decoder.inst_sh2add):
+                m.d.comb += alu_a.eq(rs1_data << 2)
+            with m.Elif(self._decoder.inst_sh3add):
+                m.d.comb += alu_a.eq(rs1_data << 3)
         with m.Else():
-            m.d.comb += alu_a.eq(self._gprf_rp1.data)
+            m.d.comb += alu_a.eq(rs1_data)
 
         # ALU B
         with m.If(self._decoder.inst_lui | self._decoder.inst_auipc | self._decoder.is_j | self._decoder.is_b | self._decoder.is_ld | self._decoder.is_st | self._decoder.is_imm):
             m.d.comb += alu_b.eq(self._decoder.immediate)
         with m.Elif(self._decoder.inst_sub):
-            m.d.comb += alu_b.eq(~self._gprf_rp2.data)
+            m.d.comb += alu_b.eq(~rs2_data)
+        if self.enable_zbb:
+            with m.Elif(self._decoder.inst_andn | self._decoder.inst_orn | self._decoder.inst_xnor):
+                m.d.comb += alu_b.eq(~rs2_data)
         if self.enable_rv32a:
             with m.Elif(self._decoder.is_amo | self._decoder.is_lrsc):
                 m.d.comb += alu_b.eq(0)
         with m.Else():
-            m.d.comb += alu_b.eq(self._gprf_rp2.data)
+            m.d.comb += alu_b.eq(rs2_data)
 
         # CMP
         with m.If(self._decoder.inst_slti | self._decoder.inst_sltiu):
             m.d.comb += cmp_b.eq(self._decoder.immediate)
         with m.Else():
-            m.d.comb += cmp_b.eq(self._gprf_rp2.data)
+            m.d.comb += cmp_b.eq(rs2_data)
 
-        # ALU
-        m.d.sync += add_out.eq(alu_a + alu_b + self._decoder.inst_sub)
+        # ALU. Results are available in EXECUTE (fast path), and registered for the other states
+        m.d.comb += add_x.eq(alu_a + alu_b + self._decoder.inst_sub)
 
         # logic
-        with m.If(self._decoder.inst_and | self._decoder.inst_andi):
-            m.d.sync += logic_out.eq(alu_a & alu_b)
-        with m.Elif(self._decoder.inst_or | self._decoder.inst_ori):
-            m.d.sync += logic_out.eq(alu_a | alu_b)
+        with m.If(self._decoder.inst_and | self._decoder.inst_andi | self._decoder.inst_andn):
+            m.d.comb += logic_x.eq(alu_a & alu_b)
+        with m.Elif(self._decoder.inst_or | self._decoder.inst_ori | self._decoder.inst_orn):
+            m.d.comb += logic_x.eq(alu_a | alu_b)
         with m.Else():
-            m.d.sync += logic_out.eq(alu_a ^ alu_b)
+            m.d.comb += logic_x.eq(alu_a ^ alu_b)
 
         # compare
-        m.d.sync += [
-            is_eq.eq(self._gprf_rp1.data == cmp_b),
-            is_lt.eq(self._gprf_rp1.data.as_signed() < cmp_b.as_signed()),
-            is_ltu.eq(self._gprf_rp1.data < cmp_b)
+        m.d.comb += [
+            is_eq_x.eq(rs1_data == cmp_b),
+            is_lt_x.eq(rs1_data.as_signed() < cmp_b.as_signed()),
+            is_ltu_x.eq(rs1_data < cmp_b),
+            ltx_cmp_x.eq((is_lt_x & (self._decoder.inst_slt | self._decoder.inst_slti)) |
+                         (is_ltu_x & (self._decoder.inst_sltu | self._decoder.inst_sltiu)))
         ]
         m.d.comb += ltx_cmp_out.eq((is_lt & (self._decoder.inst_slt | self._decoder.inst_slti)) |
                                    (is_ltu & (self._decoder.inst_sltu | self._decoder.inst_sltiu)))
 
         # shift
         with m.If(self._decoder.inst_sll | self._decoder.inst_slli):
-            m.d.sync += shift_out.eq(alu_a << alu_b[0:5])
+            m.d.comb += shift_x.eq(alu_a << alu_b[0:5])
         with m.Elif(self._decoder.inst_srl | self._decoder.inst_srli):
-            m.d.sync += shift_out.eq(alu_a >> alu_b[0:5])
+            m.d.comb += shift_x.eq(alu_a >> alu_b[0:5])
+        if self.enable_zbb:
+            with m.Elif(self._decoder.inst_rol):
+                m.d.comb += shift_x.eq((Cat(alu_a, alu_a) << alu_b[0:5])[32:])
+            with m.Elif(self._decoder.inst_ror | self._decoder.inst_rori):
+                m.d.comb += shift_x.eq((Cat(alu_a, alu_a) >> alu_b[0:5])[:32])
         with m.Else():
-            m.d.sync += shift_out.eq(alu_a.as_signed() >> alu_b[0:5])
+            m.d.comb += shift_x.eq(alu_a.as_signed() >> alu_b[0:5])
+
+        m.d.sync += [
+            add_out.eq(add_x),
+            logic_out.eq(logic_x),
+            is_eq.eq(is_eq_x),
+            is_lt.eq(is_lt_x),
+            is_ltu.eq(is_ltu_x),
+            shift_out.eq(shift_x)
+        ]
 
         # JMP/Branch
         beq  = is_eq & self._decoder.inst_beq
@@ -224,18 +261,31 @@ class Core(Elaboratable):
         bge  = ~is_lt & self._decoder.inst_bge
         bltu = is_ltu & self._decoder.inst_bltu
         bgeu = ~is_ltu & self._decoder.inst_bgeu
+        m.d.comb += b_taken.eq(beq | bne | blt | bge | bltu | bgeu)
+        if not self.enable_rv32c:
+            # check for misalignment. With RV32C, the targets are 16-bit aligned
+            m.d.comb += [
+                jb_error.eq((self._decoder.is_j | b_taken) & add_out[1]),
+                jb_error_x.eq(b_taken_x & add_x[1])
+            ]
+        m.d.comb += b_taken_x.eq((is_eq_x & self._decoder.inst_beq) | (~is_eq_x & self._decoder.inst_bne) |
+                                 (is_lt_x & self._decoder.inst_blt) | (~is_lt_x & self._decoder.inst_bge) |
+                                 (is_ltu_x & self._decoder.inst_bltu) | (~is_ltu_x & self._decoder.inst_bgeu))
+
+        # Fast path: ALU, LUI/AUIPC and branches finish in EXECUTE, and start the next fetch
         m.d.comb += [
-            b_taken.eq(beq | bne | blt | bge | bltu | bgeu),
-            jb_error.eq((self._decoder.is_j | b_taken) & add_out[1])  # check for misalignment
+            fast.eq(self._decoder.is_add | self._decoder.is_logic | self._decoder.is_cmp | self._decoder.is_shift | self._decoder.is_b |
+                    self._decoder.is_csr | self._decoder.is_bitmanip),
+            next_pc.eq(Mux(b_taken_x, Cat(0, add_x[1:]), pc4))
         ]
 
         # CSR port
         m.d.comb += self._csr.privmode.eq(self._exceptunit.m_privmode)
 
         with m.If(self._decoder.funct3[2]):
-            m.d.sync += csr_src.eq(self._decoder.gpr_rs1_q)
+            m.d.comb += csr_src.eq(self._decoder.gpr_rs1_q)
         with m.Else():
-            m.d.sync += csr_src.eq(self._gprf_rp1.data)
+            m.d.comb += csr_src.eq(rs1_data)
 
         with m.If(self._decoder.funct3[:2] == 0b01):  # write
             m.d.comb += csr_wdata.eq(csr_src)
@@ -249,6 +299,12 @@ class Core(Elaboratable):
             self._gprf_rp1.en.eq(0),
             self._gprf_rp2.en.eq(0)
         ]
+        # The read ports are not transparent: forward the register written by the fast path
+        # when the next instruction is fetched in the same cycle
+        m.d.comb += [
+            rs1_data.eq(Mux(rs1_fwd, fwd_data, self._gprf_rp1.data)),
+            rs2_data.eq(Mux(rs2_fwd, fwd_data, self._gprf_rp2.data))
+        ]
 
         # Decoder
         m.d.comb += self._decoder.privmode.eq(self._exceptunit.m_privmode)
@@ -269,48 +325,121 @@ class Core(Elaboratable):
             amo_done   = Signal()
             amo_write  = Signal()
 
-            with m.FSM(name='amo'):
-                with m.State('load'):
-                    m.d.comb += amo_strobe.eq(1)
-                    with m.If(self._lsu.ready & self._decoder.is_amo):
-                        m.d.sync += amo_rdata.eq(self._lsu.load_data)
-                        m.next = 'modify'
-                with m.State('modify'):
-                    m.d.comb += amo_strobe.eq(0)
-
-                    with m.If(self._decoder.inst_amoadd):
-                        m.d.sync += amo_wdata.eq(amo_rdata + self._gprf_rp2.data)
-                    with m.Elif(self._decoder.inst_amoand):
-                        m.d.sync += amo_wdata.eq(amo_rdata & self._gprf_rp2.data)
-                    with m.Elif(self._decoder.inst_amomax):
-                        m.d.sync += amo_wdata.eq(Mux(amo_rdata.as_signed() > self._gprf_rp2.data.as_signed(), amo_rdata, self._gprf_rp2.data))
-                    with m.Elif(self._decoder.inst_amomaxu):
-                        m.d.sync += amo_wdata.eq(Mux(amo_rdata > self._gprf_rp2.data, amo_rdata, self._gprf_rp2.data))
-                    with m.Elif(self._decoder.inst_amomin):
-                        m.d.sync += amo_wdata.eq(Mux(amo_rdata.as_signed() > self._gprf_rp2.data.as_signed(), self._gprf_rp2.data, amo_rdata))
-                    with m.Elif(self._decoder.inst_amominu):
-                        m.d.sync += amo_wdata.eq(Mux(amo_rdata > self._gprf_rp2.data, self._gprf_rp2.data, amo_rdata))
-                    with m.Elif(self._decoder.inst_amoswap):
-                        m.d.sync += amo_wdata.eq(self._gprf_rp2.data)
-                    with m.Elif(self._decoder.inst_amoxor):
-                        m.d.sync += amo_wdata.eq(amo_rdata ^ self._gprf_rp2.data)
-                    with m.Elif(self._decoder.inst_amoor):
-                        m.d.sync += amo_wdata.eq(amo_rdata | self._gprf_rp2.data)
-
-                    m.next = 'store'
-                with m.State('store'):
-                    m.d.comb += [
-                        amo_strobe.eq(1),
-                        amo_write.eq(1)
-                    ]
-                    with m.If(self._lsu.ready):
-                        m.d.comb += amo_done.eq(1)
-                        m.next = 'load'
-                    with m.Elif(self._lsu.error):
-                        m.next = 'load'
+            if self.enable_near_amo:
+                # single locked write: the AMO unit next to the memory returns the old value
+                m.d.comb += [
+                    self.amo_op.eq(instruction[27:32]),
+                    amo_wdata.eq(rs2_data),
+                    amo_strobe.eq(1),
+                    amo_write.eq(1),
+                    amo_done.eq(self._lsu.ready)
+                ]
+                with m.If(self._lsu.ready & self._decoder.is_amo):
+                    m.d.sync += amo_rdata.eq(self._lsu.load_data)
+            else:
+                with m.FSM(name='amo'):
+                    with m.State('load'):
+                        m.d.comb += amo_strobe.eq(1)
+                        with m.If(self._lsu.ready & self._decoder.is_amo):
+                            m.d.sync += amo_rdata.eq(self._lsu.load_data)
+                            m.next = 'modify'
+                    with m.State('modify'):
+                        m.d.comb += amo_strobe.eq(0)
+
+                        with m.If(self._decoder.inst_amoadd):
+                            m.d.sync += amo_wdata.eq(amo_rdata + rs2_data)
+                        with m.Elif(self._decoder.inst_amoand):
+                            m.d.sync += amo_wdata.eq(amo_rdata & rs2_data)
+                        with m.Elif(self._decoder.inst_amomax):
+                            m.d.sync += amo_wdata.eq(Mux(amo_rdata.as_signed() > rs2_data.as_signed(), amo_rdata, rs2_data))
+                        with m.Elif(self._decoder.inst_amomaxu):
+                            m.d.sync += amo_wdata.eq(Mux(amo_rdata > rs2_data, amo_rdata, rs2_data))
+                        with m.Elif(self._decoder.inst_amomin):
+                            m.d.sync += amo_wdata.eq(Mux(amo_rdata.as_signed() > rs2_data.as_signed(), rs2_data, amo_rdata))
+                        with m.Elif(self._decoder.inst_amominu):
+                            m.d.sync += amo_wdata.eq(Mux(amo_rdata > rs2_data, rs2_data, amo_rdata))
+                        with m.Elif(self._decoder.inst_amoswap):
+                            m.d.sync += amo_wdata.eq(rs2_data)
+                        with m.Elif(self._decoder.inst_amoxor):
+                            m.d.sync += amo_wdata.eq(amo_rdata ^ rs2_data)
+                        with m.Elif(self._decoder.inst_amoor):
+                            m.d.sync += amo_wdata.eq(amo_rdata | rs2_data)
+
+                        m.next = 'store'
+                    with m.State('store'):
+                        m.d.comb += [
+                            amo_strobe.eq(1),
+                            amo_write.eq(1)
+                        ]
+                        with m.If(self._lsu.ready):
+                            m.d.comb += amo_done.eq(1)
+                            m.next = 'load'
+                        with m.Elif(self._lsu.error):
+                            m.next = 'load'
+
+            # SC failures
+            sc_fail = Signal()
+            with m.If(self._mscfail.update):
+                m.d.sync += self._mscfail.read.eq(self._mscfail.write)
+            with m.Elif(sc_fail):
+                m.d.sync += self._mscfail.read.eq(self._mscfail.read + 1)
+
+        # Interconnect wait cycles
+        if self.enable_extra_csr:
+            with m.If(self._mbuswait.update):
+                m.d.sync += self._mbuswait.read.eq(self._mbuswait.write)
+            with m.Elif(self.bus_wait):
+                m.d.sync += self._mbuswait.read.eq(self._mbuswait.read + 1)
+        # ----------------------------------------------------------------------
+        # Fetch: connect LSU/I-cache/prefetch buffer, and start decoding
+        def fetch(address):
+            read = 1
+            if self.enable_rv32c:
+                # the realigner reads the words: none, if the instruction is in its buffer
+                m.d.comb += [
+                    self._realigner.pc.eq(address),
+                    self._realigner.request.eq(1)
+                ]
+                m.d.sync += compressed.eq(self._realigner.compressed)
+                address = self._realigner.address
+                read    = self._realigner.fetch
+            if self.enable_fetchunit:
+                m.d.comb += [
+                    self._fetchunit.address.eq(address),
+                    self._fetchunit.valid.eq(read)
+                ]
+            else:
+                m.d.comb += [
+                    self._lsu.address.eq(address),
+                    self._lsu.store_data.eq(0xdead_c0de),
+                    self._lsu.write.eq(0),
+                    self._lsu.cycle.eq(read),
+                    self._lsu.strobe.eq(read),
+                    self._lsu.op.eq(Funct3.W)
+                ]
+            # pre-decoding
+            m.d.comb += [
+                self._decoder.instruction_f.eq(inst_data),  # start decoding
+                self._decoder.enable.eq(inst_ready),
+                self._gprf_rp1.addr.eq(self._decoder.gpr_rs1),
+                self._gprf_rp1.en.eq(1),
+                self._gprf_rp2.addr.eq(self._decoder.gpr_rs2),
+                self._gprf_rp2.en.eq(1)
+            ]
+            m.d.sync += [
+                rs1_fwd.eq(self._gprf_wp.en & (self._gprf_wp.addr == self._decoder.gpr_rs1)),
+                rs2_fwd.eq(self._gprf_wp.en & (self._gprf_wp.addr == self._decoder.gpr_rs2)),
+                fwd_data.eq(self._gprf_wp.data)
+            ]
+
+            m.d.sync += [
+                instruction.eq(inst_data),  # latch the instruction
+                raw_inst.eq(inst_raw)
+            ]
+
         # ----------------------------------------------------------------------
         # Main FSM
-        with m.FSM(name='main'):
+        with m.FSM(name='main') as fsm:
             with m.State('RESET'):
                 m.d.comb += debug_state.eq(self.str2value('RESET'))
 
@@ -318,40 +447,27 @@ class Core(Elaboratable):
             with m.State('FETCH'):
                 m.d.comb += debug_state.eq(self.str2value('FETCH'))
 
-                # connect LSU
-                m.d.comb += [
-                    self._lsu.address.eq(pc),
-                    self._lsu.store_data.eq(0xdead_c0de),
-                    self._lsu.write.eq(0),
-                    self._lsu.cycle.eq(1),
-                    self._lsu.strobe.eq(1),
-                    self._lsu.op.eq(Funct3.W)
-                ]
-                # pre-decoding
-                m.d.comb += [
-                    self._decoder.instruction_f.eq(self._lsu.load_data),  # start decoding
-                    self._decoder.enable.eq(self._lsu.ready),
-                    self._gprf_rp1.addr.eq(self._decoder.gpr_rs1),
-                    self._gprf_rp1.en.eq(1),
-                    self._gprf_rp2.addr.eq(self._decoder.gpr_rs2),
-                    self._gprf_rp2.en.eq(1)
-                ]
-
-                m.d.sync += instruction.eq(self._lsu.load_data)  # latch the instruction
+                # take a pending interrupt without waiting for the instruction. The fetch in
+                # progress (if any) is dropped
+                with m.If(self._exceptunit.m_interrupt):
+                    m.d.sync += self._exceptunit.enable.eq(1)
+                    m.next = 'TRAP'
+                with m.Else():
+                    fetch(pc)
 
-                with m.If(self._lsu.ready):
-                    m.next = 'EXECUTE'
-                with m.Elif(self._lsu.error | self._lsu.misaligned):
-                    m.d.sync += [
-                        self._exceptunit.enable.eq(1),
-                        self._exceptunit.edata.eq(pc),
-                        self._exceptunit.ecode.eq(ExceptionCause.E_INST_ADDR_MISALIGNED),
-                        self._exceptunit.m_exception.eq(1)
-                    ]
-                    with m.If(self._lsu.error):
-                        m.d.sync += self._exceptunit.ecode.eq(ExceptionCause.E_INST_ACCESS_FAULT)
+                    with m.If(inst_ready):
+                        m.next = 'EXECUTE'
+                    with m.Elif(fetch_error | fetch_misaligned):
+                        m.d.sync += [
+                            self._exceptunit.enable.eq(1),
+                            self._exceptunit.edata.eq(pc),
+                            self._exceptunit.ecode.eq(ExceptionCause.E_INST_ADDR_MISALIGNED),
+                            self._exceptunit.m_exception.eq(1)
+                        ]
+                        with m.If(fetch_error):
+                            m.d.sync += self._exceptunit.ecode.eq(ExceptionCause.E_INST_ACCESS_FAULT)
 
-                    m.next = 'TRAP'
+                        m.next = 'TRAP'
             with m.State('EXECUTE'):
                 m.d.comb += debug_state.eq(self.str2value('EXECUTE'))
                 if self.enable_trigger:
@@ -360,7 +476,7 @@ class Core(Elaboratable):
                 with m.If(self._exceptunit.m_interrupt):
                     m.d.sync += [
                         self._exceptunit.enable.eq(1),
-                        self._exceptunit.edata.eq(instruction)
+                        self._exceptunit.edata.eq(raw_inst)
                     ]
                     m.next = 'TRAP'
                 if self.enable_trigger:
@@ -373,28 +489,104 @@ class Core(Elaboratable):
                         ]
                         m.next = 'TRAP'
                 with m.Else():
-                    with m.If(self._decoder.is_shift | self._decoder.use_alu):
+                    with m.If(fast):
+                        # CSR: single cycle read/modify/write
+                        m.d.comb += [
+                            self._csr.port.addr.eq(self._decoder.csr_addr),
+                            self._csr.port.dat_w.eq(csr_wdata),
+                            self._csr.port.we.eq(self._decoder.csr_we),
+                            self._csr.port.valid.eq(self._decoder.is_csr)
+                        ]
+                        with m.If(jb_error_x):
+                            m.d.sync += [
+                                self._exceptunit.enable.eq(1),
+                                self._exceptunit.edata.eq(Cat(0, add_x[1:])),
+                                self._exceptunit.ecode.eq(ExceptionCause.E_INST_ADDR_MISALIGNED),
+                                self._exceptunit.m_exception.eq(1)
+                            ]
+                            m.next = 'TRAP'
+                        with m.Elif(self._csr.invalid):
+                            m.d.sync += [
+                                self._exceptunit.enable.eq(1),
+                                self._exceptunit.edata.eq(raw_inst),
+                                self._exceptunit.ecode.eq(ExceptionCause.E_ILLEGAL_INST),
+                                self._exceptunit.m_exception.eq(1)
+                            ]
+                            m.next = 'TRAP'
+                        with m.Else():
+                            # write back, and fetch the next instruction
+                            with m.If(self._decoder.gpr_rd.any() & ~self._decoder.is_b):
+                                m.d.comb += [
+                                    self._gprf_wp.addr.eq(self._decoder.gpr_rd),
+                                    self._gprf_wp.en.eq(1)
+                                ]
+                            with m.If(self._decoder.is_logic):
+                                m.d.comb += self._gprf_wp.data.eq(logic_x)
+                            with m.Elif(self._decoder.is_cmp):
+                                m.d.comb += self._gprf_wp.data.eq(ltx_cmp_x)
+                            with m.Elif(self._decoder.is_shift):
+                                m.d.comb += self._gprf_wp.data.eq(shift_x)
+                            with m.Elif(self._decoder.is_csr):
+                                m.d.comb += self._gprf_wp.data.eq(self._csr.port.dat_r)
+                            if self.enable_zbb:
+                                with m.Elif(self._decoder.is_bitmanip):
+                                    m.d.comb += self._gprf_wp.data.eq(self._bitmanip.result)
+                            with m.Else():
+                                m.d.comb += self._gprf_wp.data.eq(add_x)
+                            if self.enable_extra_csr:
+                                m.d.comb += self._exceptunit.w_retire.eq(1)
+
+                            m.d.sync += pc.eq(next_pc)
+                            m.d.comb += jb_taken.eq(b_taken_x)
+                            fetch(next_pc)
+                            with m.If(inst_ready):
+                                m.next = 'EXECUTE'
+                            with m.Else():
+                                m.next = 'FETCH'
+                    with m.Elif(self._decoder.is_j):
                         m.next = 'COMMIT'
                     with m.Elif(self._decoder.is_mul | self._decoder.is_div):
                         m.d.comb += multdiv.eq(1)
                         with m.If(mult_ack | div_ack):
                             m.next = 'COMMIT'
+                    if self.enable_accel:
+                        with m.Elif(self._decoder.is_custom):
+                            # send the command once: wait for the response (xd) in CUSTOM
+                            m.d.comb += self.accelerator.cmd.valid.eq(1)
+                            with m.If(self.accelerator.cmd.ready):
+                                with m.If(self.accelerator.cmd.xd):
+                                    m.next = 'CUSTOM'
+                                with m.Else():
+                                    m.next = 'COMMIT'
                     with m.Elif(self._decoder.inst_fence | self._decoder.inst_fencei | self._decoder.inst_wfi):
-                        m.d.sync += pc.eq(pc4)
-                        if self.enable_extra_csr:
-                            m.d.comb += self._exceptunit.w_retire.eq(1)
-                        m.next = 'FETCH'
+                        fence_done = 1
+                        drained    = 1
+                        if self.enable_sbuffer:
+                            # write the pending stores before continuing
+                            drained    = self._sbuffer.empty
+                            fence_done = drained | self._decoder.inst_wfi
+                        if self.enable_dcache:
+                            # write back the D-cache before continuing
+                            fence_done = (drained & self._dcache.flush_ready) | self._decoder.inst_wfi
+                            m.d.comb += self._dcache.flush.eq(drained & ~self._decoder.inst_wfi)
+                        with m.If(fence_done):
+                            m.d.sync += pc.eq(pc4)
+                            if self.enable_fetchunit:
+                                m.d.comb += self._fetchunit.invalidate.eq(self._decoder.inst_fencei)
+                            if self.enable_rv32c:
+                                m.d.comb += self._realigner.flush.eq(self._decoder.inst_fencei)
+                            if self.enable_extra_csr:
+                                m.d.comb += self._exceptunit.w_retire.eq(1)
+                            m.next = 'FETCH'
                     with m.Elif(self._decoder.is_ld | self._decoder.is_st | self._decoder.is_lrsc):
                         m.next = 'MEMLS/LRSC'
                     if self.enable_rv32a:
                         with m.Elif(self._decoder.is_amo):
                             m.next = 'AMO'
-                    with m.Elif(self._decoder.is_csr):
-                        m.next = 'CSR'
                     with m.Else():
                         m.d.sync += [
                             self._exceptunit.enable.eq(1),
-                            self._exceptunit.edata.eq(instruction),
+                            self._exceptunit.edata.eq(raw_inst),
                             self._exceptunit.ecode.eq(ExceptionCause.E_ILLEGAL_INST),
                             self._exceptunit.m_exception.eq(~self._decoder.inst_mret),
                             self._exceptunit.m_mret.eq(self._decoder.inst_mret)
@@ -425,7 +617,7 @@ class Core(Elaboratable):
                 # connect LSU
                 m.d.comb += [
                     self._lsu.address.eq(add_out),
-                    self._lsu.store_data.eq(self._gprf_rp2.data),
+                    self._lsu.store_data.eq(rs2_data),
                     self._lsu.write.eq(is_st),
                     self._lsu.cycle.eq(valid),
                     self._lsu.strobe.eq(valid),
@@ -433,6 +625,10 @@ class Core(Elaboratable):
                 ]
                 if self.enable_rv32a:
                     m.d.comb += self._lsu.lrsc.eq(self._decoder.is_lrsc)
+                    if self.enable_sbuffer:
+                        m.d.comb += self._sbuffer.bypass.eq(self._decoder.is_lrsc)
+                    if self.enable_dcache:
+                        m.d.comb += self._dcache.bypass.eq(self._decoder.is_lrsc)
                 # Next state and extra logic
                 ready = self._lsu.ready
                 with m.If(ready):
@@ -474,8 +670,15 @@ class Core(Elaboratable):
                         self._lsu.write.eq(amo_write),
                         self._lsu.cycle.eq(1),
                         self._lsu.strobe.eq(amo_strobe),
-                        self._lsu.op.eq(self._decoder.funct3)
+                        self._lsu.op.eq(self._decoder.funct3),
+                        self._lsu.atomic.eq(1)
                     ]
+                    if self.enable_near_amo:
+                        m.d.comb += self._lsu.lrsc.eq(1)  # lock: the operation is in the sideband
+                    if self.enable_sbuffer:
+                        m.d.comb += self._sbuffer.bypass.eq(1)
+                    if self.enable_dcache:
+                        m.d.comb += self._dcache.bypass.eq(1)
                     with m.If(amo_done):
                         m.d.sync += ld_out.eq(amo_rdata)
 
@@ -492,51 +695,38 @@ class Core(Elaboratable):
                             m.d.sync += self._exceptunit.ecode.eq(ExceptionCause.E_STORE_AMO_ADDR_MISALIGNED)
 
                         m.next = 'TRAP'
-            with m.State('CSR'):
-                m.d.comb += debug_state.eq(self.str2value('CSR'))
-                # CSR
-                m.d.comb += [
-                    self._csr.port.addr.eq(self._decoder.csr_addr),
-                    self._csr.port.dat_w.eq(csr_wdata),
-                    self._csr.port.we.eq(self._decoder.csr_we),
-                    self._csr.port.valid.eq(1)
-                ]
-                with m.If(self._csr.port.ready):
-                    m.d.sync += csr_out.eq(self._csr.port.dat_r)
-
-                    m.next = 'COMMIT'
-                    with m.If(self._csr.invalid & self._decoder.is_csr):
-                        m.d.sync += [
-                            self._exceptunit.enable.eq(1),
-                            self._exceptunit.edata.eq(instruction),
-                            self._exceptunit.ecode.eq(ExceptionCause.E_ILLEGAL_INST),
-                            self._exceptunit.m_exception.eq(1)
-                        ]
-
-                        m.next = 'TRAP'
+            if self.enable_accel:
+                with m.State('CUSTOM'):
+                    m.d.comb += [
+                        debug_state.eq(self.str2value('CUSTOM')),
+                        self.accelerator.resp.ready.eq(1)
+                    ]
+                    with m.If(self.accelerator.resp.valid):
+                        m.d.sync += ld_out.eq(self.accelerator.resp.data)
+                        m.next = 'COMMIT'
             with m.State('COMMIT'):
                 m.d.comb += debug_state.eq(self.str2value('COMMIT'))
 
                 with m.If(self._decoder.is_j | b_taken):
                     with m.If(~jb_error):
                         m.d.sync += pc.eq(Cat(0, add_out[1:]))
+                        m.d.comb += jb_taken.eq(1)
                 with m.Else():
                     m.d.sync += pc.eq(pc4)
 
                 with m.If(self._decoder.gpr_rd.any()):
                     m.d.comb += [
                         self._gprf_wp.addr.eq(self._decoder.gpr_rd),
-                        self._gprf_wp.en.eq(self._decoder.is_j | self._decoder.is_ld | self._decoder.is_csr | self._decoder.is_logic |
+                        self._gprf_wp.en.eq(self._decoder.is_j | self._decoder.is_ld | self._decoder.is_logic |
                                       self._decoder.is_cmp | self._decoder.is_shift | self._decoder.is_add | self._decoder.is_mul |
-                                      self._decoder.is_div | self._decoder.is_amo | self._decoder.is_lrsc)
+                                      self._decoder.is_div | self._decoder.is_amo | self._decoder.is_lrsc |
+                                      (self._decoder.is_custom & self._decoder.funct3[2]))
                     ]
                 # BFMux
                 with m.If(self._decoder.is_j):
                     m.d.comb += self._gprf_wp.data.eq(pc4)
                 with m.Elif(self._decoder.is_ld):
                     m.d.comb += self._gprf_wp.data.eq(ld_out)
-                with m.Elif(self._decoder.is_csr):
-                    m.d.comb += self._gprf_wp.data.eq(csr_out)
                 with m.Elif(self._decoder.is_logic):
                     m.d.comb += self._gprf_wp.data.eq(logic_out)
                 with m.Elif(self._decoder.is_cmp):
@@ -552,8 +742,13 @@ class Core(Elaboratable):
                         m.d.comb += self._gprf_wp.data.eq(amo_rdata)
                     with m.Elif(self._decoder.is_lrsc):
                         m.d.comb += self._gprf_wp.data.eq(ld_out)
+                if self.enable_accel:
+                    with m.Elif(self._decoder.is_custom):
+                        m.d.comb += self._gprf_wp.data.eq(ld_out)
                 with m.Else():
                     m.d.comb += self._gprf_wp.data.eq(add_out)
+                if self.enable_rv32a:
+                    m.d.comb += sc_fail.eq(self._decoder.inst_sc & ld_out[0])
 
                 m.next = 'FETCH'
                 with m.If(jb_error):
@@ -572,10 +767,12 @@ class Core(Elaboratable):
             with m.State('TRAP'):
                 m.d.comb += debug_state.eq(self.str2value('TRAP'))
 
-                with m.If(self._decoder.inst_mret):
+                with m.If(self._exceptunit.m_mret):
                     m.d.sync += pc.eq(self._exceptunit.mepc)
-                with m.Else():
-                    m.d.sync += pc.eq(self._exceptunit.mtvec)
+                with m.Elif(self._exceptunit.m_exception | self._exceptunit.m_interrupt):
+                    m.d.sync += pc.eq(self._exceptunit.trap_address)
+                # else: the interrupt was withdrawn before it was taken. Nothing was executed,
+                # so fetch the same instruction again
 
                 m.d.sync += [
                     self._exceptunit.enable.eq(0),
@@ -586,7 +783,41 @@ class Core(Elaboratable):
                     m.d.comb += self._exceptunit.w_retire.eq(1)
                 m.next = 'FETCH'
         # ----------------------------------------------------------------------
+        # Performance counters
+        if self.hpm_counters:
+            m.submodules.hpm = self._hpm
+            events           = self._hpm.events
+            is_ld            = self._decoder.is_ld | self._decoder.inst_lr
+            is_st            = self._decoder.is_st | self._decoder.inst_sc
+            memls            = fsm.ongoing('MEMLS/LRSC') & ~self._lsu.ready
+            m.d.comb += [
+                self._hpm.inhibit.eq(self._exceptunit.mcountinhibit.read.hpm),
+                events[HPMEvent.FETCH_WAIT].eq(fsm.ongoing('FETCH') & ~inst_ready),
+                events[HPMEvent.LOAD_WAIT].eq(memls & is_ld),
+                events[HPMEvent.STORE_WAIT].eq(memls & is_st),
+                events[HPMEvent.MULDIV_BUSY].eq(multdiv & ~(mult_ack | div_ack)),
+                events[HPMEvent.BRANCH_TAKEN].eq(jb_taken),
+                events[HPMEvent.EXCEPTION].eq(self._exceptunit.enable & self._exceptunit.m_exception),
+                events[HPMEvent.INTERRUPT].eq(self._exceptunit.enable & self._exceptunit.m_interrupt & ~self._exceptunit.m_exception),
+                events[HPMEvent.BUS_WAIT].eq(self.bus_wait),
+                events[HPMEvent.STATE_FETCH].eq(fsm.ongoing('FETCH')),
+                events[HPMEvent.STATE_EXECUTE].eq(fsm.ongoing('EXECUTE')),
+                events[HPMEvent.STATE_MEMLS].eq(fsm.ongoing('MEMLS/LRSC')),
+                events[HPMEvent.STATE_COMMIT].eq(fsm.ongoing('COMMIT')),
+                events[HPMEvent.STATE_TRAP].eq(fsm.ongoing('TRAP'))
+            ]
+            if self.enable_rv32a:
+                m.d.comb += [
+                    events[HPMEvent.LOAD_WAIT].eq((memls & is_ld) | (fsm.ongoing('AMO') & ~amo_done)),
+                    events[HPMEvent.STATE_AMO].eq(fsm.ongoing('AMO'))
+                ]
+            if self.enable_accel:
+                m.d.comb += events[HPMEvent.STATE_CUSTOM].eq(fsm.ongoing('CUSTOM'))
+        # ----------------------------------------------------------------------
         # New PC
-        m.d.comb += pc4.eq(pc + 4)
+        if self.enable_rv32c:
+            m.d.comb += pc4.eq(pc + Mux(compressed, 2, 4))
+        else:
+            m.d.comb += pc4.eq(pc + 4)
 
         return m
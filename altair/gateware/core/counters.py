@@ -0,0 +1,80 @@
+from enum import IntEnum
+from amaranth import Cat
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Elaboratable
+from amaranth.build import Platform
+from altair.gateware.core.csr import AutoCSR
+from altair.gateware.core.csr import CSRFile
+from altair.gateware.core.isa import CSRIndex
+
+
+class HPMEvent(IntEnum):
+    MAX_NUM       = 32
+    NONE          = 0
+    # both cores
+    FETCH_WAIT    = 1   # cycles without an instruction to execute (decode, for the pipeline)
+    LOAD_WAIT     = 2   # cycles waiting for a load/LR/AMO
+    STORE_WAIT    = 3   # cycles waiting for a store/SC
+    MULDIV_BUSY   = 4   # cycles waiting for the multiplier/divider
+    BRANCH_TAKEN  = 5   # taken branches and jumps
+    EXCEPTION     = 6
+    INTERRUPT     = 7
+    BUS_WAIT      = 8   # cycles waiting for the grant of the interconnect
+    # pipelined core
+    HAZARD_STALL  = 9   # cycles with EX stalled by a data hazard
+    REDIRECT      = 10  # fetch redirected by EX (mispredicted control transfer)
+    # FSM core: cycles in each state
+    STATE_FETCH   = 16
+    STATE_EXECUTE = 17
+    STATE_MEMLS   = 18
+    STATE_AMO     = 19
+    STATE_CUSTOM  = 20
+    STATE_COMMIT  = 21
+    STATE_TRAP    = 22
+
+
+class PerformanceCounters(Elaboratable, AutoCSR):
+    """Hardware performance monitor: mhpmcounter3..(3 + ncounters - 1).
+
+    Each counter is 64-bit wide (mhpmcounterN/mhpmcounterNh), and increments when the event
+    selected in mhpmeventN (HPMEvent) is active. Events not implemented by the core never fire.
+    The counting is stopped with mcountinhibit (owned by the exception unit, with mcycle and
+    minstret).
+    """
+    def __init__(self, csrf: CSRFile, ncounters: int = 4) -> None:
+        if ncounters not in range(1, 30):
+            raise ValueError(f'Invalid number of performance counters: {ncounters}. Valid options: 1 to 29')
+        # config
+        self.ncounters = ncounters
+        # registers
+        self.mhpmcounter  = [csrf.add_register(f'mhpmcounter{idx + 3}', CSRIndex.MHPMCOUNTER3 + idx) for idx in range(ncounters)]
+        self.mhpmcounterh = [csrf.add_register(f'mhpmcounter{idx + 3}h', CSRIndex.MHPMCOUNTER3H + idx) for idx in range(ncounters)]
+        self.mhpmevent    = [csrf.add_register(f'mhpmevent{idx + 3}', CSRIndex.MHPMEVENT3 + idx) for idx in range(ncounters)]
+        # IO
+        self.events  = Signal(HPMEvent.MAX_NUM)  # input: one bit per event (HPMEvent)
+        self.inhibit = Signal(ncounters)         # input: mcountinhibit.hpm
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        for register in self.get_csrs():
+            with m.If(register.update):
+                m.d.sync += register.read.eq(register.write)
+
+        for idx in range(self.ncounters):
+            low   = self.mhpmcounter[idx]
+            high  = self.mhpmcounterh[idx]
+            count = Signal(64, name=f'count{idx + 3}')
+            fire  = Signal(name=f'fire{idx + 3}')
+
+            m.d.comb += [
+                fire.eq(self.events.bit_select(self.mhpmevent[idx].read.event, 1) & ~self.inhibit[idx]),
+                count.eq(Cat(low.read, high.read) + fire)
+            ]
+            with m.If(~low.update):
+                m.d.sync += low.read.eq(count[:32])
+            with m.If(~high.update):
+                m.d.sync += high.read.eq(count[32:])
+
+        return m
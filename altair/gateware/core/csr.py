@@ -16,6 +16,8 @@ from altair.gateware.core.isa import mepc_layout
 from altair.gateware.core.isa import mip_layout
 from altair.gateware.core.isa import mie_layout
 from altair.gateware.core.isa import mcause_layout
+from altair.gateware.core.isa import mcountinhibit_layout
+from altair.gateware.core.isa import mhpmevent_layout
 from altair.gateware.core.isa import dcsr_layout
 from altair.gateware.core.isa import tdata1_layout
 
@@ -48,11 +50,19 @@ reg_map = {
     CSRIndex.INSTRET:    basic_rw_layout,
     CSRIndex.CYCLEH:     basic_rw_layout,
     CSRIndex.INSTRETH:   basic_rw_layout,
+    CSRIndex.MCOUNTINHIBIT: mcountinhibit_layout,
+    **{CSRIndex.MHPMEVENT3 + n:    mhpmevent_layout for n in range(29)},
+    **{CSRIndex.MHPMCOUNTER3 + n:  basic_rw_layout for n in range(29)},
+    **{CSRIndex.MHPMCOUNTER3H + n: basic_rw_layout for n in range(29)},
     CSRIndex.DCSR:       dcsr_layout,
     CSRIndex.DPC:        basic_rw_layout,
     CSRIndex.TSELECT:    basic_rw_layout,
     CSRIndex.TDATA1:     tdata1_layout,
     CSRIndex.TDATA2:     basic_rw_layout,
+    CSRIndex.MBPHIT:     basic_rw_layout,
+    CSRIndex.MBPMISS:    basic_rw_layout,
+    CSRIndex.MSCFAIL:    basic_rw_layout,
+    CSRIndex.MBUSWAIT:   basic_rw_layout,
 }
 
 csr_port_layout = [
@@ -80,6 +90,8 @@ class AutoCSR():
         for v in vars(self).values():
             if isinstance(v, _CSR):
                 yield v
+            elif isinstance(v, list):
+                yield from (x for x in v if isinstance(x, _CSR))
             elif hasattr(v, "get_csrs"):
                 yield from v.get_csrs()
 
@@ -113,73 +125,49 @@ class CSRFile(Elaboratable):
         invalid_undef = Signal()  # The register is not defined
         invalid_ro    = Signal()  # The register is read-only.
         invalid_priv  = Signal()  # The priviledge mode is incorrect.
-        delay         = Signal()
+
+        # ----------------------------------------------------------------------
+        # Single cycle access: the address is decoded in parallel (one-hot), the register is read
+        # and written (update) in the same cycle of the request.
+        def decode(port) -> Signal:
+            select = Signal(len(self._registers), name=f'{port.name}_select')
+            for idx, addr in enumerate(self._registers):
+                m.d.comb += select[idx].eq(port.addr == addr)
+            # read
+            for idx, register in enumerate(self._registers.values()):
+                with m.If(select[idx]):
+                    m.d.comb += port.dat_r.eq(register.read)
+            m.d.comb += port.ready.eq(port.valid)
+            return select
+
+        def write(port, select, enable, modes) -> None:
+            for idx, (addr, register) in enumerate(self._registers.items()):
+                with m.If(select[idx]):
+                    tmp = Record(register.write.layout)  # port.dat_w -> temp -> register
+                    m.d.comb += tmp.eq(port.dat_w)
+                    for name, _, mode in reg_map[addr]:
+                        if mode in modes:
+                            m.d.comb += getattr(register.write, name).eq(getattr(tmp, name))
+                    m.d.comb += register.update.eq(enable)
 
         # ----------------------------------------------------------------------
         # normal port
-        with m.If(self.port.valid & ~self.port.ready):
-            m.d.sync += [
-                delay.eq(1),
-                self.port.ready.eq(delay),
+        select = decode(self.port)
+        with m.If(self.port.valid):
+            m.d.comb += [
+                invalid_undef.eq(~select.any()),
                 invalid_ro.eq((self.port.addr[10:12] == 0b11) & self.port.we),
                 invalid_priv.eq(self.port.addr[8:10] > self.privmode)
             ]
-            with m.Switch(self.port.addr):
-                for addr, register in self._registers.items():
-                    with m.Case(addr):
-                        # read
-                        m.d.sync += self.port.dat_r.eq(register.read)
-                        # write
-                        tmp = Record(register.write.layout)  # port.dat_w -> temp -> register
-                        m.d.comb += tmp.eq(self.port.dat_w)
-                        for name, _, mode in reg_map[addr]:
-                            src = getattr(tmp, name)
-                            dst = getattr(register.write, name)
-                            if mode is CSRAccess.RW:
-                                m.d.sync += dst.eq(src)
-                        m.d.sync += register.update.eq(self.port.we & delay & ~self.invalid)
-                with m.Default():
-                    m.d.sync += invalid_undef.eq(1)
-        with m.Else():
-            m.d.sync += [
-                delay.eq(0),
-                self.port.ready.eq(0),
-                invalid_ro.eq(0),
-                invalid_priv.eq(0),
-                invalid_undef.eq(0)
-            ]
+            write(self.port, select, self.port.we & ~self.invalid, [CSRAccess.RW])
 
         m.d.comb += self.invalid.eq(invalid_undef | invalid_ro | invalid_priv)
 
         # ----------------------------------------------------------------------
         # debug port: no exceptions.
         if self._enable_debug:
-            with m.If(self.debug_port.valid & ~self.debug_port.ready):
-                m.d.sync += self.debug_port.ready.eq(1)
-
-                with m.Switch(self.debug_port.addr):
-                    for addr, register in self._registers.items():
-                        with m.Case(addr):
-                            # read
-                            m.d.sync += self.debug_port.dat_r.eq(register.read)
-                            # write
-                            tmp = Record(register.write.layout)  # debug_port.dat_w -> temp -> register
-                            m.d.comb += tmp.eq(self.debug_port.dat_w)
-                            for name, _, mode in reg_map[addr]:
-                                src = getattr(tmp, name)
-                                dst = getattr(register.write, name)
-                                if mode in [CSRAccess.WLRL, CSRAccess.WARL]:
-                                    m.d.sync += dst.eq(src)
-                                else:
-                                    m.d.sync += dst.eq(0)
-                            m.d.sync += register.update.eq(self.debug_port.we)
-            with m.Else():
-                m.d.sync += self.debug_port.ready.eq(0)
-
-        # ----------------------------------------------------------------------
-        # reset we
-        for register in self._registers.values():
-            with m.If(register.update):
-                m.d.sync += register.update.eq(0)
+            debug_select = decode(self.debug_port)
+            with m.If(self.debug_port.valid & ~self.port.valid):
+                write(self.debug_port, debug_select, self.debug_port.we, [CSRAccess.WLRL, CSRAccess.WARL])
 
         return m
@@ -0,0 +1,361 @@
+from amaranth import Cat
+from amaranth import Repl
+from amaranth import Array
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Memory
+from amaranth import Elaboratable
+from amaranth.build import Platform
+from amaranth.utils import log2_int
+from amaranth_soc.wishbone.bus import Interface
+from amaranth_soc.wishbone.bus import CycleType
+from amaranth_soc.wishbone.bus import BurstTypeExt
+from altair.gateware.core.icache import plru_masks
+from typing import List
+
+
+class DataCache(Elaboratable):
+    """N-way set associative data cache. Write-back, write-allocate.
+
+    Sits between the LSU and the memory port. The lookup is combinational: a hit is
+    answered in the same cycle of the request. Stores to a cached line only update the
+    line and mark it dirty, so consecutive stores to the same line are merged into a single
+    burst when the line is evicted.
+
+    Accesses bypass the cache (passed through to the bus) when:
+    - The address is inside one of the uncached windows.
+    - `bypass` is set (AMO, LR/SC). If the line is cached, it is written back (if dirty)
+      and invalidated first, so the atomic operation sees the latest value in memory.
+
+    `flush` writes back all dirty lines and invalidates the cache (fence, fence.i). The
+    request must be held until `flush_ready`.
+
+    There is no coherence between caches: data shared with other harts or bus masters must
+    be placed in an uncached window, or synchronized with fence.
+    """
+    REPLACEMENT = ['lru', 'random']
+
+    def __init__(self,
+                 size: int = 4096,
+                 nwords: int = 4,
+                 nways: int = 1,
+                 replacement: str = 'lru',
+                 uncached: List = [],
+                 features: List[str] = ['err']
+                 ) -> None:
+        # ----------------------------------------------------------------------
+        # checks
+        for name, value in [('size', size), ('nwords', nwords), ('nways', nways)]:
+            if not isinstance(value, int) or value <= 0 or (value & (value - 1)):
+                raise ValueError(f'D-cache {name} must be a power of 2: {value}')
+        if size < 4 * nwords * nways:
+            raise ValueError(f'D-cache size ({size} bytes) must hold at least one line per way ({nways} way(s) of {nwords} words)')
+        if replacement not in DataCache.REPLACEMENT:
+            raise ValueError(f'Invalid replacement policy: {replacement}. Valid options: {DataCache.REPLACEMENT}')
+        for start, addr_width in uncached:
+            if start & ((1 << (addr_width + 2)) - 1):
+                raise ValueError(f'Uncached window {start:#010x} is not aligned to its size ({1 << (addr_width + 2)} bytes)')
+        # ----------------------------------------------------------------------
+        # config
+        self.size        = size
+        self.nwords      = nwords
+        self.nways       = nways
+        self.nsets       = size // (4 * nwords * nways)
+        self.replacement = replacement
+        self.uncached    = uncached
+        self._word_bits  = log2_int(self.nwords)
+        self._index_bits = log2_int(self.nsets)
+        self._tag_bits   = 30 - self._word_bits - self._index_bits
+        # ----------------------------------------------------------------------
+        # storage
+        self._tags = [Memory(width=self._tag_bits, depth=self.nsets, name=f'dcache_tag{n}') for n in range(nways)]
+        self._data = [Memory(width=32, depth=self.nsets * self.nwords, name=f'dcache_data{n}') for n in range(nways)]
+        # ----------------------------------------------------------------------
+        # IO
+        self.cpu         = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='dcache_cpu')
+        self.bus         = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='dcache')
+        self.bypass      = Signal()  # input
+        self.flush       = Signal()  # input
+        self.flush_ready = Signal()  # output
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        offset      = self.cpu.adr[:self._word_bits]
+        index       = self.cpu.adr[self._word_bits:self._word_bits + self._index_bits]
+        tag         = self.cpu.adr[self._word_bits + self._index_bits:]
+        tag_rp      = [mem.read_port(domain='comb') for mem in self._tags]
+        tag_wp      = [mem.write_port() for mem in self._tags]
+        data_rp     = [mem.read_port(domain='comb') for mem in self._data]
+        data_wp     = [mem.write_port(granularity=8) for mem in self._data]
+        line_valid  = [Signal(self.nsets, name=f'line_valid{n}') for n in range(self.nways)]
+        line_dirty  = [Signal(self.nsets, name=f'line_dirty{n}') for n in range(self.nways)]
+        request     = Signal()
+        uncached    = Signal()
+        passthrough = Signal()
+        way_hit     = Signal(self.nways)
+        hit         = Signal()
+        hit_dirty   = Signal()
+        hit_way     = Signal(range(self.nways))
+        hit_data    = Signal(32)
+        victim      = Signal(range(self.nways))
+        way_valid   = Signal(self.nways)
+        way_dirty   = Signal(self.nways)
+        way_tag     = Array(rp.data for rp in tag_rp)
+        way_data    = Array(rp.data for rp in data_rp)
+        r_index     = Signal(self._index_bits)
+        r_tag       = Signal(self._tag_bits)  # refill
+        r_wb_tag    = Signal(self._tag_bits)  # write-back
+        r_way       = Signal.like(victim)
+        r_cnt       = Signal(self._word_bits)
+        r_flushing  = Signal()
+        line_index  = Signal.like(index)
+        line_word   = Signal.like(offset)
+        last        = Signal()
+        flush_last  = Signal()
+
+        m.submodules += tag_rp, tag_wp, data_rp, data_wp
+
+        # ----------------------------------------------------------------------
+        # Lookup. The line to read depends on the current state
+        m.d.comb += [
+            request.eq(self.cpu.cyc & self.cpu.stb),
+            hit.eq(way_hit.any())
+        ]
+        for way in range(self.nways):
+            m.d.comb += [
+                tag_rp[way].addr.eq(line_index),
+                data_rp[way].addr.eq(Cat(line_word, line_index)),
+                way_valid[way].eq(line_valid[way].bit_select(line_index, 1)),
+                way_dirty[way].eq(line_dirty[way].bit_select(line_index, 1)),
+                way_hit[way].eq(way_valid[way] & (tag_rp[way].data == tag))
+            ]
+            with m.If(way_hit[way]):
+                m.d.comb += [
+                    hit_way.eq(way),
+                    hit_dirty.eq(way_dirty[way]),
+                    hit_data.eq(data_rp[way].data)
+                ]
+
+        # Uncached windows
+        for start, addr_width in self.uncached:
+            with m.If(self.cpu.adr[addr_width:] == (start >> (addr_width + 2))):
+                m.d.comb += uncached.eq(1)
+
+        # ----------------------------------------------------------------------
+        # Replacement
+        if self.nways > 1:
+            policy_way = Signal.like(victim)
+
+            if self.replacement == 'lru':
+                plru  = Array(Signal(self.nways - 1, name=f'plru{n}') for n in range(self.nsets))
+                masks = plru_masks(self.nways)
+                for way, (mask, toward) in enumerate(masks):
+                    with m.If((plru[index] & mask) == toward):
+                        m.d.comb += policy_way.eq(way)
+                # On a hit, point all the nodes in the path away from the accessed way
+                with m.If(request & hit & ~passthrough):
+                    for way, (mask, toward) in enumerate(masks):
+                        with m.If(way_hit[way]):
+                            m.d.sync += plru[index].eq((plru[index] & ~mask) | (~toward & mask))
+            else:
+                lfsr = Signal(16, reset=0xACE1)
+                m.d.sync += lfsr.eq(Cat(lfsr[1:], lfsr[0] ^ lfsr[2] ^ lfsr[3] ^ lfsr[5]))
+                m.d.comb += policy_way.eq(lfsr[:log2_int(self.nways)])
+
+            # Use invalid ways first
+            m.d.comb += victim.eq(policy_way)
+            for way in reversed(range(self.nways)):
+                with m.If(~way_valid[way]):
+                    m.d.comb += victim.eq(way)
+        else:
+            m.d.comb += victim.eq(0)
+
+        # ----------------------------------------------------------------------
+        # Control
+        m.d.comb += [
+            last.eq(r_cnt == self.nwords - 1),
+            flush_last.eq((r_index == self.nsets - 1) & (r_way == self.nways - 1)),
+            self.cpu.dat_r.eq(hit_data),
+            self.bus.sel.eq(0b1111),
+            self.bus.dat_w.eq(way_data[r_way])
+        ]
+        if hasattr(self.bus, 'cti'):
+            with m.If(last):
+                m.d.comb += self.bus.cti.eq(CycleType.END_OF_BURST)
+            with m.Else():
+                m.d.comb += self.bus.cti.eq(CycleType.INCR_BURST)
+        if hasattr(self.bus, 'bte'):
+            m.d.comb += self.bus.bte.eq(BurstTypeExt.LINEAR)
+
+        with m.FSM(name='dcache'):
+            with m.State('LOOKUP'):
+                m.d.comb += [
+                    line_index.eq(index),
+                    line_word.eq(offset),
+                    passthrough.eq(uncached | (self.bypass & ~hit))
+                ]
+                with m.If(request & passthrough):
+                    # uncached access: connect the CPU directly to the bus
+                    m.d.comb += [
+                        self.bus.adr.eq(self.cpu.adr),
+                        self.bus.dat_w.eq(self.cpu.dat_w),
+                        self.bus.sel.eq(self.cpu.sel),
+                        self.bus.we.eq(self.cpu.we),
+                        self.bus.cyc.eq(1),
+                        self.bus.stb.eq(1),
+                        self.cpu.dat_r.eq(self.bus.dat_r),
+                        self.cpu.ack.eq(self.bus.ack)
+                    ]
+                    if hasattr(self.bus, 'cti'):
+                        m.d.comb += self.bus.cti.eq(CycleType.CLASSIC)
+                    if hasattr(self.bus, 'err'):
+                        m.d.comb += self.cpu.err.eq(self.bus.err)
+                    if hasattr(self.bus, 'lock'):
+                        m.d.comb += self.bus.lock.eq(self.cpu.lock)
+                with m.Elif(self.flush):
+                    m.d.sync += [
+                        r_index.eq(0),
+                        r_way.eq(0),
+                        r_flushing.eq(1)
+                    ]
+                    m.next = 'FLUSH'
+                with m.Elif(request & hit & self.bypass):
+                    # atomic access to a cached line: write back (if needed) and invalidate
+                    with m.If(hit_dirty):
+                        m.d.sync += [
+                            r_index.eq(index),
+                            r_wb_tag.eq(tag),
+                            r_way.eq(hit_way),
+                            r_cnt.eq(0),
+                            r_flushing.eq(0)
+                        ]
+                        m.next = 'WRITEBACK'
+                    with m.Else():
+                        with m.Switch(hit_way):
+                            for way in range(self.nways):
+                                with m.Case(way):
+                                    m.d.sync += line_valid[way].bit_select(index, 1).eq(0)
+                with m.Elif(request & hit):
+                    m.d.comb += self.cpu.ack.eq(1)
+                    with m.If(self.cpu.we):
+                        for way in range(self.nways):
+                            m.d.comb += [
+                                data_wp[way].addr.eq(Cat(offset, index)),
+                                data_wp[way].data.eq(self.cpu.dat_w),
+                                data_wp[way].en.eq(self.cpu.sel & Repl(way_hit[way], 4))
+                            ]
+                        with m.Switch(hit_way):
+                            for way in range(self.nways):
+                                with m.Case(way):
+                                    m.d.sync += line_dirty[way].bit_select(index, 1).eq(1)
+                with m.Elif(request):
+                    # miss: write back the victim (if dirty), and refill
+                    m.d.sync += [
+                        r_index.eq(index),
+                        r_tag.eq(tag),
+                        r_wb_tag.eq(way_tag[victim]),
+                        r_way.eq(victim),
+                        r_cnt.eq(0),
+                        r_flushing.eq(0)
+                    ]
+                    with m.If(way_valid.bit_select(victim, 1) & way_dirty.bit_select(victim, 1)):
+                        m.next = 'WRITEBACK'
+                    with m.Else():
+                        m.next = 'REFILL'
+            with m.State('FLUSH'):
+                m.d.comb += [
+                    line_index.eq(r_index),
+                    line_word.eq(0)
+                ]
+                with m.If(way_valid.bit_select(r_way, 1) & way_dirty.bit_select(r_way, 1)):
+                    m.d.sync += [
+                        r_wb_tag.eq(way_tag[r_way]),
+                        r_cnt.eq(0)
+                    ]
+                    m.next = 'WRITEBACK'
+                with m.Else():
+                    with m.Switch(r_way):
+                        for way in range(self.nways):
+                            with m.Case(way):
+                                m.d.sync += line_valid[way].bit_select(r_index, 1).eq(0)
+                    with m.If(r_way == self.nways - 1):
+                        m.d.sync += [
+                            r_way.eq(0),
+                            r_index.eq(r_index + 1)
+                        ]
+                    with m.Else():
+                        m.d.sync += r_way.eq(r_way + 1)
+                    with m.If(flush_last):
+                        m.d.comb += self.flush_ready.eq(self.flush)
+                        m.d.sync += r_flushing.eq(0)
+                        m.next = 'LOOKUP'
+            with m.State('WRITEBACK'):
+                m.d.comb += [
+                    line_index.eq(r_index),
+                    line_word.eq(r_cnt),
+                    self.bus.adr.eq(Cat(r_cnt, r_index, r_wb_tag)),
+                    self.bus.we.eq(1),
+                    self.bus.cyc.eq(1),
+                    self.bus.stb.eq(1)
+                ]
+                with m.If(self.bus.ack):
+                    m.d.sync += r_cnt.eq(r_cnt + 1)
+                if hasattr(self.bus, 'err'):
+                    # the line cannot be written back: drop it
+                    with m.If(self.bus.err):
+                        m.d.sync += r_cnt.eq(r_cnt + 1)
+                    done = last & (self.bus.ack | self.bus.err)
+                else:
+                    done = last & self.bus.ack
+                with m.If(done):
+                    with m.Switch(r_way):
+                        for way in range(self.nways):
+                            with m.Case(way):
+                                m.d.sync += line_dirty[way].bit_select(r_index, 1).eq(0)
+                    # A miss goes back to LOOKUP (idle bus) before the refill: a new burst
+                    # cannot start in the cycle after the end of the previous one.
+                    with m.If(r_flushing):
+                        m.next = 'FLUSH'
+                    with m.Else():
+                        m.next = 'LOOKUP'
+            with m.State('REFILL'):
+                m.d.comb += [
+                    line_index.eq(r_index),
+                    line_word.eq(r_cnt),
+                    self.bus.adr.eq(Cat(r_cnt, r_index, r_tag)),
+                    self.bus.we.eq(0),
+                    self.bus.cyc.eq(1),
+                    self.bus.stb.eq(1)
+                ]
+                for way in range(self.nways):
+                    m.d.comb += [
+                        data_wp[way].addr.eq(Cat(r_cnt, r_index)),
+                        data_wp[way].data.eq(self.bus.dat_r),
+                        data_wp[way].en.eq(Repl(self.bus.ack & (r_way == way), 4)),
+                        tag_wp[way].addr.eq(r_index),
+                        tag_wp[way].data.eq(r_tag),
+                        tag_wp[way].en.eq(self.bus.ack & last & (r_way == way))
+                    ]
+                with m.If(self.bus.ack):
+                    m.d.sync += r_cnt.eq(r_cnt + 1)
+                    with m.If(last):
+                        with m.Switch(r_way):
+                            for way in range(self.nways):
+                                with m.Case(way):
+                                    m.d.sync += [
+                                        line_valid[way].bit_select(r_index, 1).eq(1),
+                                        line_dirty[way].bit_select(r_index, 1).eq(0)
+                                    ]
+                        m.next = 'LOOKUP'
+                if hasattr(self.bus, 'err'):
+                    with m.Elif(self.bus.err):
+                        # abort the refill, and report the error
+                        with m.Switch(r_way):
+                            for way in range(self.nways):
+                                with m.Case(way):
+                                    m.d.sync += line_valid[way].bit_select(r_index, 1).eq(0)
+                        m.d.comb += self.cpu.err.eq(request)
+                        m.next = 'LOOKUP'
+
+        return m
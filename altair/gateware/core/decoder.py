@@ -10,6 +10,7 @@ from altair.gateware.core.isa import Funct3
 from altair.gateware.core.isa import Funct5
 from altair.gateware.core.isa import Funct7
 from altair.gateware.core.isa import Funct12
+from altair.gateware.core.bitmanip import BitManipOp
 
 
 class Type(IntEnum):
@@ -22,9 +23,18 @@ class Type(IntEnum):
 
 
 class DecoderUnit(Elaboratable):
-    def __init__(self, enable_rv32m: bool, enable_rv32a: bool) -> None:
-        self.enable_rv32m = enable_rv32m
-        self.enable_rv32a = enable_rv32a
+    def __init__(self,
+                 enable_rv32m: bool,
+                 enable_rv32a: bool,
+                 enable_custom: bool = False,
+                 enable_zba: bool = False,
+                 enable_zbb: bool = False
+                 ) -> None:
+        self.enable_rv32m  = enable_rv32m
+        self.enable_rv32a  = enable_rv32a
+        self.enable_custom = enable_custom
+        self.enable_zba    = enable_zba
+        self.enable_zbb    = enable_zbb
 
         self.enable        = Signal()
         self.privmode      = Signal(PrivMode)
@@ -102,6 +112,15 @@ class DecoderUnit(Elaboratable):
         self.inst_amomax   = Signal()
         self.inst_amominu  = Signal()
         self.inst_amomaxu  = Signal()
+        self.inst_sh1add   = Signal()
+        self.inst_sh2add   = Signal()
+        self.inst_sh3add   = Signal()
+        self.inst_andn     = Signal()
+        self.inst_orn      = Signal()
+        self.inst_xnor     = Signal()
+        self.inst_rol      = Signal()
+        self.inst_ror      = Signal()
+        self.inst_rori     = Signal()
         self.is_imm        = Signal()
         self.is_j          = Signal()
         self.is_b          = Signal()
@@ -116,6 +135,9 @@ class DecoderUnit(Elaboratable):
         self.is_div        = Signal()
         self.is_lrsc       = Signal()
         self.is_amo        = Signal()
+        self.is_custom     = Signal()
+        self.is_bitmanip   = Signal()  # Zbb: BitManipUnit
+        self.bitmanip_op   = Signal(BitManipOp)
         self.use_alu       = Signal()
         self.csr_addr      = Signal(12)
         self.csr_we        = Signal()
@@ -169,6 +191,8 @@ class DecoderUnit(Elaboratable):
                 m.d.comb += itype.eq(Type.I)
             with m.Case(Opcode.SYSTEM):
                 m.d.comb += itype.eq(Type.I)
+            with m.Case(Opcode.CUSTOM0, Opcode.CUSTOM1, Opcode.CUSTOM2, Opcode.CUSTOM3):
+                m.d.comb += itype.eq(Type.R)
 
         m.d.comb += [
             opcode.eq(self.instruction_f[:7]),
@@ -288,6 +312,44 @@ class DecoderUnit(Elaboratable):
                     self.inst_amominu.eq(match(Opcode.AMO, f3=Funct3.AMO, f5=Funct5.AMOMINU)),
                     self.inst_amomaxu.eq(match(Opcode.AMO, f3=Funct3.AMO, f5=Funct5.AMOMAXU)),
                 ]
+            if self.enable_zba:
+                m.d.sync += [
+                    self.inst_sh1add.eq(match(Opcode.OP, f3=Funct3.SH1ADD, f7=Funct7.SHADD)),
+                    self.inst_sh2add.eq(match(Opcode.OP, f3=Funct3.SH2ADD, f7=Funct7.SHADD)),
+                    self.inst_sh3add.eq(match(Opcode.OP, f3=Funct3.SH3ADD, f7=Funct7.SHADD))
+                ]
+            if self.enable_zbb:
+                m.d.sync += [
+                    self.inst_andn.eq(match(Opcode.OP, f3=Funct3.AND, f7=Funct7.ANDN)),
+                    self.inst_orn.eq(match(Opcode.OP, f3=Funct3.OR, f7=Funct7.ANDN)),
+                    self.inst_xnor.eq(match(Opcode.OP, f3=Funct3.XOR, f7=Funct7.ANDN)),
+                    self.inst_rol.eq(match(Opcode.OP, f3=Funct3.SLL, f7=Funct7.ROT)),
+                    self.inst_ror.eq(match(Opcode.OP, f3=Funct3.SR, f7=Funct7.ROT)),
+                    self.inst_rori.eq(match(Opcode.OP_IMM, f3=Funct3.SR, f7=Funct7.ROT))
+                ]
+                bitmanip = [
+                    (BitManipOp.CLZ,   match(Opcode.OP_IMM, f3=Funct3.SLL, f12=Funct12.CLZ)),
+                    (BitManipOp.CTZ,   match(Opcode.OP_IMM, f3=Funct3.SLL, f12=Funct12.CTZ)),
+                    (BitManipOp.CPOP,  match(Opcode.OP_IMM, f3=Funct3.SLL, f12=Funct12.CPOP)),
+                    (BitManipOp.SEXTB, match(Opcode.OP_IMM, f3=Funct3.SLL, f12=Funct12.SEXTB)),
+                    (BitManipOp.SEXTH, match(Opcode.OP_IMM, f3=Funct3.SLL, f12=Funct12.SEXTH)),
+                    (BitManipOp.REV8,  match(Opcode.OP_IMM, f3=Funct3.SR, f12=Funct12.REV8)),
+                    (BitManipOp.ORCB,  match(Opcode.OP_IMM, f3=Funct3.SR, f12=Funct12.ORCB)),
+                    (BitManipOp.ZEXTH, match(Opcode.OP, f3=Funct3.XOR, f12=Funct12.ZEXTH)),
+                    (BitManipOp.MIN,   match(Opcode.OP, f3=Funct3.MIN, f7=Funct7.MINMAX)),
+                    (BitManipOp.MINU,  match(Opcode.OP, f3=Funct3.MINU, f7=Funct7.MINMAX)),
+                    (BitManipOp.MAX,   match(Opcode.OP, f3=Funct3.MAX, f7=Funct7.MINMAX)),
+                    (BitManipOp.MAXU,  match(Opcode.OP, f3=Funct3.MAXU, f7=Funct7.MINMAX))
+                ]
+                m.d.sync += self.is_bitmanip.eq(0)
+                for op, hit in bitmanip:
+                    with m.If(hit):
+                        m.d.sync += [
+                            self.is_bitmanip.eq(1),
+                            self.bitmanip_op.eq(op)
+                        ]
+            if self.enable_custom:
+                m.d.sync += self.is_custom.eq(match(Opcode.CUSTOM0) | match(Opcode.CUSTOM1) | match(Opcode.CUSTOM2) | match(Opcode.CUSTOM3))
 
         m.d.comb += [
             self.is_j.eq(self.inst_jal | self.inst_jalr),
@@ -295,10 +357,13 @@ class DecoderUnit(Elaboratable):
             self.is_ld.eq(self.inst_lb | self.inst_lbu | self.inst_lh | self.inst_lhu | self.inst_lw),
             self.is_st.eq(self.inst_sb | self.inst_sh | self.inst_sw),
             self.is_csr.eq(self.inst_csrrw | self.inst_csrrs | self.inst_csrrc | self.inst_csrrwi | self.inst_csrrsi | self.inst_csrrci),
-            self.is_add.eq(self.inst_auipc | self.inst_lui | self.inst_add | self.inst_addi | self.inst_sub),
-            self.is_logic.eq(self.inst_and | self.inst_andi | self.inst_or | self.inst_ori | self.inst_xor | self.inst_xori),
+            self.is_add.eq(self.inst_auipc | self.inst_lui | self.inst_add | self.inst_addi | self.inst_sub |
+                           self.inst_sh1add | self.inst_sh2add | self.inst_sh3add),
+            self.is_logic.eq(self.inst_and | self.inst_andi | self.inst_or | self.inst_ori | self.inst_xor | self.inst_xori |
+                             self.inst_andn | self.inst_orn | self.inst_xnor),
             self.is_cmp.eq(self.inst_slt | self.inst_slti | self.inst_sltu | self.inst_sltiu),
-            self.is_shift.eq(self.inst_slli | self.inst_sll | self.inst_srli | self.inst_srl | self.inst_srai | self.inst_sra),
+            self.is_shift.eq(self.inst_slli | self.inst_sll | self.inst_srli | self.inst_srl | self.inst_srai | self.inst_sra |
+                             self.inst_rol | self.inst_ror | self.inst_rori),
             self.use_alu.eq(self.is_add | self.is_j | self.is_b | self.is_cmp | self.is_logic),
         ]
         if self.enable_rv32m:
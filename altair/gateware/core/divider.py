@@ -1,13 +1,53 @@
+from fractions import Fraction
+from math import ceil
+from math import floor
+from amaranth import Cat
+from amaranth import Const
 from amaranth import Mux
 from amaranth import Module
 from amaranth import Signal
 from amaranth import Elaboratable
+from amaranth import signed
 from amaranth.build import Platform
 from altair.gateware.core.isa import Funct3
 
 
 class Divider(Elaboratable):
-    def __init__(self) -> None:
+    """Iterative divider.
+
+    Modes:
+    - 'radix2': restoring, 1 quotient bit per cycle.
+    - 'radix4': restoring, 2 quotient bits per cycle (compare with d, 2d and 3d).
+    - 'srt4': SRT radix-4, digit set {-2..2}. The divisor is normalized, and the digit
+      is selected from 4 bits of the divisor and 7 bits of the partial remainder. Needs
+      a correction step at the end.
+
+    With early termination, only the significant quotient bits are computed: the number of
+    iterations depends on the leading zeros of the dividend and divisor (clz(divisor) - clz(dividend) + 1
+    quotient bits). If the divisor is larger than the dividend, there are no iterations.
+
+    Division by zero and overflow (-2^31 / -1) skip the iterations.
+
+    Cycles, from the request to the result (b = number of quotient bits):
+
+    +-------------+-------------------+-------------------------------+
+    | Mode        | Fixed             | Early termination             |
+    +=============+===================+===============================+
+    | radix2      | 36                | 4 + b (4 if b <= 0)           |
+    | radix4      | 20                | 4 + ceil(b/2) (4 if b <= 0)   |
+    | srt4        | 21                | 5 + ceil(b/2) (4 if b <= 0)   |
+    | div by zero | 2                 | 2                             |
+    | overflow    | 2                 | 2                             |
+    +-------------+-------------------+-------------------------------+
+    """
+    MODES = ['radix2', 'radix4', 'srt4']
+
+    def __init__(self, mode: str = 'radix2', early_termination: bool = False) -> None:
+        if mode not in Divider.MODES:
+            raise ValueError(f'Invalid divider mode: {mode}. Valid options: {Divider.MODES}')
+        self.mode              = mode
+        self.early_termination = early_termination
+        # IO
         self.op     = Signal(Funct3)   # input
         self.dat1   = Signal(32)  # input
         self.dat2   = Signal(32)  # input
@@ -15,61 +55,269 @@ class Divider(Elaboratable):
         self.result = Signal(32)  # output
         self.ready  = Signal()    # output
 
+    @staticmethod
+    def srt_thresholds():
+        """Digit selection for SRT radix-4 (a = 2), for a divisor in [1/2, 1).
+
+        For each interval of the divisor (3 bits after the leading one), return the
+        lower bound of the partial remainder (x 16) to select the digits -1, 0, 1 and 2.
+        """
+        table = []
+        for i in range(8):
+            dl = Fraction(1, 2) + Fraction(i, 16)
+            dh = dl + Fraction(1, 16)
+            row = []
+            for k in [-1, 0, 1, 2]:
+                # digit >= k is valid if 4w >= (k - 2/3)d. digit <= k - 1 if 4w <= (k - 1/3)d
+                low  = max((k - Fraction(2, 3)) * dl, (k - Fraction(2, 3)) * dh)
+                high = min((k - Fraction(1, 3)) * dl, (k - Fraction(1, 3)) * dh)
+                threshold = ceil(low * 16)
+                assert threshold <= floor(high * 16), 'Invalid SRT selection table'
+                row.append(threshold)
+            table.append(row)
+        return table
+
+    def clz(self, m: Module, value: Signal, result: Signal) -> None:
+        m.d.comb += result.eq(len(value))
+        for idx in range(len(value)):
+            with m.If(value[idx]):
+                m.d.comb += result.eq(len(value) - 1 - idx)
+
     def elaborate(self, platform: Platform) -> Module:
-        m             = Module()
-
-        is_div        = Signal()
-        is_divu       = Signal()
-        is_rem        = Signal()
-        dividend      = Signal(32)
-        divisor       = Signal(63)
-        quotient      = Signal(32)
-        quotient_mask = Signal(32)
-        start         = Signal()
-        start_q       = Signal()
-        running       = Signal()
-        outsign       = Signal()
+        m         = Module()
 
-        m.d.comb += [
-            is_div.eq(self.op == Funct3.DIV),
-            is_divu.eq(self.op == Funct3.DIVU),
-            is_rem.eq(self.op == Funct3.REM)
-        ]
+        is_signed = Signal()
+        get_quot  = Signal()
+        overflow  = Signal()
+        dividend  = Signal(32)
+        divisor   = Signal(32)
+        quot_sign = Signal()
+        rem_sign  = Signal()
+        clz1      = Signal(range(33))
+        clz2      = Signal(range(33))
+        nbits     = Signal(signed(7))  # significant quotient bits
+        count     = Signal(range(33))
+        quotient  = Signal(32)
+        remainder = Signal(32)
 
-        m.d.sync += [
-            start.eq(self.valid & ~self.ready),
-            start_q.eq(start),
-            self.ready.eq(0)
+        m.d.comb += [
+            is_signed.eq((self.op == Funct3.DIV) | (self.op == Funct3.REM)),
+            overflow.eq(is_signed & (self.dat1 == 0x8000_0000) & (self.dat2 == 0xffff_ffff))
         ]
+        # significant bits of the quotient
+        self.clz(m, dividend, clz1)
+        self.clz(m, divisor, clz2)
+        if self.early_termination:
+            m.d.comb += nbits.eq(clz2 - clz1 + 1)
+        else:
+            m.d.comb += nbits.eq(32)
 
-        with m.If(start & ~start_q):
-            m.d.sync += [
-                dividend.eq(Mux((is_div | is_rem) & self.dat1[-1], -self.dat1, self.dat1)),
-                divisor.eq(Mux((is_div | is_rem) & self.dat2[-1], -self.dat2, self.dat2) << 31),
-                outsign.eq((is_div & (self.dat1[-1] ^ self.dat2[-1]) & (self.dat2 != 0)) | (is_rem & self.dat1[-1])),
-                quotient.eq(0),
-                quotient_mask.eq(1 << 31),
-                running.eq(1)
+        # ----------------------------------------------------------------------
+        # datapath for each mode
+        if self.mode == 'radix2':
+            acc   = Signal(32)  # partial remainder
+            shreg = Signal(32)  # dividend bits, shifted out. Quotient bits, shifted in
+            trial = Signal(33)
+            diff  = Signal(34)
+            m.d.comb += [
+                trial.eq(Cat(shreg[31], acc)),
+                diff.eq(trial - divisor),
+                quotient.eq(shreg),
+                remainder.eq(acc)
             ]
-        with m.Elif((quotient_mask == 0) & running):
-            m.d.sync += [
-                running.eq(0),
-                self.ready.eq(1)
+            skip       = nbits
+            iterations = nbits
+        elif self.mode == 'radix4':
+            acc   = Signal(32)
+            shreg = Signal(32)
+            trial = Signal(34)
+            diff1 = Signal(35)
+            diff2 = Signal(35)
+            diff3 = Signal(35)
+            m.d.comb += [
+                trial.eq(Cat(shreg[30:32], acc)),
+                diff1.eq(trial - divisor),
+                diff2.eq(trial - (divisor << 1)),
+                diff3.eq(trial - divisor * 3),
+                quotient.eq(shreg),
+                remainder.eq(acc)
             ]
+            skip       = nbits + nbits[0]  # 2 bits per iteration
+            iterations = skip >> 1
+        else:
+            shift    = Signal(6)
+            dnorm    = Signal(32)
+            start    = Signal(66)
+            acc      = Signal(signed(36))  # partial remainder (upper part)
+            shreg    = Signal(34)          # dividend bits (lower part)
+            q_pos    = Signal(34)
+            q_neg    = Signal(34)
+            shifted  = Signal(signed(38))
+            estimate = Signal(signed(10))
+            digit    = Signal(signed(3))
+            acc_next = Signal(signed(38))
+            quot_raw = Signal(34)
+            srt_its  = Signal(range(18))
+            table    = self.srt_thresholds()
 
-            with m.If(is_div | is_divu):
-                m.d.sync += self.result.eq(Mux(outsign, -quotient, quotient))
+            m.d.comb += [
+                shifted.eq(Cat(shreg[32:34], acc)),
+                estimate.eq(shifted[28:]),
+                quot_raw.eq(q_pos - q_neg)
+            ]
+            # scale the dividend, so the first partial remainder is < 2/3 of the divisor
+            if self.early_termination:
+                m.d.comb += srt_its.eq(((nbits + 1) >> 1) + 1)
+            else:
+                m.d.comb += srt_its.eq(17)
+            m.d.comb += [
+                shift.eq(clz2 + 34 - (srt_its << 1)),
+                start.eq(dividend << shift)
+            ]
+            # digit selection
+            with m.Switch(dnorm[28:31]):
+                for idx, (m1, m0, p1, p2) in enumerate(table):
+                    with m.Case(idx):
+                        with m.If(estimate >= p2):
+                            m.d.comb += digit.eq(2)
+                        with m.Elif(estimate >= p1):
+                            m.d.comb += digit.eq(1)
+                        with m.Elif(estimate >= m0):
+                            m.d.comb += digit.eq(0)
+                        with m.Elif(estimate >= m1):
+                            m.d.comb += digit.eq(-1)
+                        with m.Else():
+                            m.d.comb += digit.eq(-2)
+            with m.If(digit == 2):
+                m.d.comb += acc_next.eq(shifted - (dnorm << 1))
+            with m.Elif(digit == 1):
+                m.d.comb += acc_next.eq(shifted - dnorm)
+            with m.Elif(digit == 0):
+                m.d.comb += acc_next.eq(shifted)
+            with m.Elif(digit == -1):
+                m.d.comb += acc_next.eq(shifted + dnorm)
             with m.Else():
-                m.d.sync += self.result.eq(Mux(outsign, -dividend, dividend))
-        with m.Else():
-            with m.If(divisor <= dividend):
-                m.d.sync += [
-                    dividend.eq(dividend - divisor),
-                    quotient.eq(quotient | quotient_mask)
+                m.d.comb += acc_next.eq(shifted + (dnorm << 1))
+            # correction: the remainder must be positive
+            with m.If(acc[-1]):
+                m.d.comb += [
+                    quotient.eq(quot_raw - 1),
+                    remainder.eq((acc + dnorm) >> clz2)
                 ]
-            m.d.sync += [
-                divisor.eq(divisor >> 1),
-                quotient_mask.eq(quotient_mask >> 1)
-            ]
+            with m.Else():
+                m.d.comb += [
+                    quotient.eq(quot_raw),
+                    remainder.eq(acc >> clz2)
+                ]
+            iterations = srt_its
+
+        # ----------------------------------------------------------------------
+        # control
+        m.d.sync += self.ready.eq(0)
+
+        with m.FSM(name='divider'):
+            with m.State('IDLE'):
+                with m.If(self.valid & ~self.ready):
+                    m.d.sync += [
+                        get_quot.eq((self.op == Funct3.DIV) | (self.op == Funct3.DIVU)),
+                        dividend.eq(Mux(is_signed & self.dat1[-1], -self.dat1, self.dat1)),
+                        divisor.eq(Mux(is_signed & self.dat2[-1], -self.dat2, self.dat2)),
+                        quot_sign.eq(is_signed & (self.dat1[-1] ^ self.dat2[-1])),
+                        rem_sign.eq(is_signed & self.dat1[-1])
+                    ]
+                    # fast paths
+                    with m.If(self.dat2 == 0):
+                        m.d.sync += [
+                            self.result.eq(Mux((self.op == Funct3.DIV) | (self.op == Funct3.DIVU), 0xffff_ffff, self.dat1)),
+                            self.ready.eq(1)
+                        ]
+                    with m.Elif(overflow):
+                        m.d.sync += [
+                            self.result.eq(Mux(self.op == Funct3.DIV, 0x8000_0000, 0)),
+                            self.ready.eq(1)
+                        ]
+                    with m.Else():
+                        m.next = 'SETUP'
+            with m.State('SETUP'):
+                m.d.sync += count.eq(iterations - 1)
+                if self.mode == 'srt4':
+                    m.d.sync += [
+                        dnorm.eq(divisor << clz2),
+                        acc.eq(start[34:]),
+                        shreg.eq(start[:34]),
+                        q_pos.eq(0),
+                        q_neg.eq(0)
+                    ]
+                else:
+                    # skip the leading zeros of the quotient
+                    m.d.sync += [
+                        acc.eq(dividend >> skip[:6]),
+                        shreg.eq(dividend << (32 - skip[:6]))
+                    ]
+                with m.If(nbits <= 0):
+                    # divisor > dividend: quotient = 0, remainder = dividend
+                    if self.mode == 'srt4':
+                        m.d.sync += [
+                            acc.eq(dividend << clz2),
+                            shreg.eq(0)
+                        ]
+                    else:
+                        m.d.sync += [
+                            acc.eq(dividend),
+                            shreg.eq(0)
+                        ]
+                    m.next = 'DONE'
+                with m.Else():
+                    m.next = 'ITERATE'
+            with m.State('ITERATE'):
+                if self.mode == 'radix2':
+                    with m.If(~diff[-1]):
+                        m.d.sync += [
+                            acc.eq(diff),
+                            shreg.eq(Cat(1, shreg[:31]))
+                        ]
+                    with m.Else():
+                        m.d.sync += [
+                            acc.eq(trial),
+                            shreg.eq(Cat(0, shreg[:31]))
+                        ]
+                elif self.mode == 'radix4':
+                    with m.If(~diff3[-1]):
+                        m.d.sync += [
+                            acc.eq(diff3),
+                            shreg.eq(Cat(Const(3, 2), shreg[:30]))
+                        ]
+                    with m.Elif(~diff2[-1]):
+                        m.d.sync += [
+                            acc.eq(diff2),
+                            shreg.eq(Cat(Const(2, 2), shreg[:30]))
+                        ]
+                    with m.Elif(~diff1[-1]):
+                        m.d.sync += [
+                            acc.eq(diff1),
+                            shreg.eq(Cat(Const(1, 2), shreg[:30]))
+                        ]
+                    with m.Else():
+                        m.d.sync += [
+                            acc.eq(trial),
+                            shreg.eq(Cat(Const(0, 2), shreg[:30]))
+                        ]
+                else:
+                    m.d.sync += [
+                        acc.eq(acc_next),
+                        shreg.eq(shreg << 2),
+                        q_pos.eq(Cat(Mux(digit > 0, digit[:2], 0), q_pos)),
+                        q_neg.eq(Cat(Mux(digit < 0, -digit, 0)[:2], q_neg))
+                    ]
+                m.d.sync += count.eq(count - 1)
+                with m.If(count == 0):
+                    m.next = 'DONE'
+            with m.State('DONE'):
+                m.d.sync += self.ready.eq(1)
+                with m.If(get_quot):
+                    m.d.sync += self.result.eq(Mux(quot_sign, -quotient, quotient))
+                with m.Else():
+                    m.d.sync += self.result.eq(Mux(rem_sign, -remainder, remainder))
+                m.next = 'IDLE'
 
         return m
@@ -1,4 +1,5 @@
 from amaranth import Cat
+from amaranth import Const
 from amaranth import Module
 from amaranth import Signal
 from amaranth import Elaboratable
@@ -18,12 +19,14 @@ class ExceptionUnit(Elaboratable, AutoCSR):
                  enable_user_mode: bool = False,
                  enable_extra_csr: bool = False,
                  enable_rv32m: bool = False,
+                 enable_rv32c: bool = False,
                  reset_address: int = 0x8000_0000
                  ) -> None:
         # ----------------------------------------------------------------------
         # Settings
         self.enable_user_mode = enable_user_mode
         self.enable_extra_csr = enable_extra_csr
+        self.enable_rv32c     = enable_rv32c
         self._interrupts      = PriorityEncoder(ExceptionCause.MAX_NUM)
         # ----------------------------------------------------------------------
         # Registers
@@ -37,6 +40,7 @@ class ExceptionUnit(Elaboratable, AutoCSR):
             self.mcycle    = csrf.add_register('mcycle', CSRIndex.MCYCLE)
             self.minstreth = csrf.add_register('minstreth', CSRIndex.MINSTRETH)
             self.mcycleh   = csrf.add_register('mcycleh', CSRIndex.MCYCLEH)
+            self.mcountinhibit = csrf.add_register('mcountinhibit', CSRIndex.MCOUNTINHIBIT)
             if self.enable_user_mode:
                 self.instret  = csrf.add_register('instret', CSRIndex.INSTRET)
                 self.cycle    = csrf.add_register('cycle', CSRIndex.CYCLE)
@@ -63,6 +67,7 @@ class ExceptionUnit(Elaboratable, AutoCSR):
         self.m_exception          = Signal()    # input
         self.m_interrupt          = Signal()    # output
         self.m_privmode           = Signal(PrivMode)   # output
+        self.trap_address         = Signal(32)  # output
         if enable_extra_csr:
             self.w_retire = Signal()
         # ----------------------------------------------------------------------
@@ -75,6 +80,8 @@ class ExceptionUnit(Elaboratable, AutoCSR):
             misa_ext = (1 << (ord('i') - ord('a')))  # 32-bits processor. RV32I
             if enable_rv32m:
                 misa_ext |= 1 << (ord('m') - ord('a'))  # RV32M
+            if enable_rv32c:
+                misa_ext |= 1 << (ord('c') - ord('a'))  # RV32C
             if enable_user_mode:
                 misa_ext |= 1 << (ord('u') - ord('a'))  # User mode enabled
 
@@ -100,6 +107,16 @@ class ExceptionUnit(Elaboratable, AutoCSR):
             with m.If(register.update):
                 m.d.sync += register.read.eq(register.write)
 
+        # mtvec: the reserved modes are replaced with direct mode
+        with m.If(self.mtvec.update & self.mtvec.write.mode[1]):
+            m.d.sync += self.mtvec.read.mode.eq(0)
+
+        # trap address. Vectored mode: interrupts jump to base + 4 * cause
+        with m.If((self.mtvec.read.mode == 1) & ~self.m_exception):
+            m.d.comb += self.trap_address.eq(Cat(Const(0, 2), self.mtvec.read.base) + (self._interrupts.o << 2))
+        with m.Else():
+            m.d.comb += self.trap_address.eq(Cat(Const(0, 2), self.mtvec.read.base))
+
         # --------------------------------------------------------------------------------
         m.submodules.interrupts = self._interrupts
         m.d.comb += [
@@ -131,7 +148,7 @@ class ExceptionUnit(Elaboratable, AutoCSR):
             with m.If(self.m_exception | self.m_interrupt):
                 # Register the exception and move one priviledge mode down.
                 m.d.sync += [
-                    self.mepc.read.base.eq(self.m_pc[2:]),
+                    self.mepc.read.base.eq(self.m_pc[1:]),
                     self.mstatus.read.mpie.eq(self.mstatus.read.mie),
                     self.mstatus.read.mie.eq(0),
 
@@ -161,6 +178,10 @@ class ExceptionUnit(Elaboratable, AutoCSR):
                 if self.enable_user_mode:
                     m.d.sync += self.mstatus.read.mpp.eq(PrivMode.User)
 
+        if not self.enable_rv32c:
+            # 32-bit aligned instructions: mepc[1] is zero
+            m.d.sync += self.mepc.read.base[0].eq(0)
+
         # counters
         if self.enable_extra_csr:
             mcycle   = Signal(64)
@@ -177,8 +198,11 @@ class ExceptionUnit(Elaboratable, AutoCSR):
                     self.minstreth.read.eq(minstret[32:64])
                 ]
 
-            m.d.comb += mcycle.eq(Cat(self.mcycle.read, self.mcycleh.read) + 1)
-            with m.If(self.w_retire):
+            with m.If(~self.mcountinhibit.read.cy):
+                m.d.comb += mcycle.eq(Cat(self.mcycle.read, self.mcycleh.read) + 1)
+            with m.Else():
+                m.d.comb += mcycle.eq(Cat(self.mcycle.read, self.mcycleh.read))
+            with m.If(self.w_retire & ~self.mcountinhibit.read.ir):
                 m.d.comb += minstret.eq(Cat(self.minstret.read, self.minstreth.read) + 1)
             with m.Else():
                 m.d.comb += minstret.eq(Cat(self.minstret.read, self.minstreth.read))
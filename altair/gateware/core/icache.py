@@ -0,0 +1,225 @@
+from amaranth import Cat
+from amaranth import Array
+from amaranth import Const
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Memory
+from amaranth import Elaboratable
+from amaranth.build import Platform
+from amaranth.utils import log2_int
+from amaranth_soc.wishbone.bus import Interface
+from amaranth_soc.wishbone.bus import CycleType
+from amaranth_soc.wishbone.bus import BurstTypeExt
+from typing import List
+
+
+def plru_masks(nways: int) -> List:
+    # Tree pseudo-LRU: one bit per node. 1 = the victim is in the right sub-tree.
+    # For each way: (mask of the nodes in the path, value pointing towards the way)
+    levels = log2_int(nways)
+    result = []
+    for way in range(nways):
+        mask, toward, node = 0, 0, 0
+        for level in range(levels):
+            direction = (way >> (levels - 1 - level)) & 1
+            mask     |= 1 << node
+            toward   |= direction << node
+            node      = 2 * node + 1 + direction
+        result.append((mask, toward))
+    return result
+
+
+class InstructionCache(Elaboratable):
+    """N-way set associative instruction cache.
+
+    The lookup is combinational: a hit is answered in the same cycle of the request.
+    A miss refills the whole line using an incrementing burst (classic cycles if the bus
+    does not have CTI/BTE), and the request is answered once the line is valid.
+
+    Replacement policy:
+    - 'lru': tree pseudo-LRU (true LRU for 2 ways).
+    - 'random': LFSR.
+    Invalid ways are always used first.
+    """
+    REPLACEMENT = ['lru', 'random']
+
+    def __init__(self,
+                 size: int = 4096,
+                 nwords: int = 4,
+                 nways: int = 1,
+                 replacement: str = 'lru',
+                 features: List[str] = ['err']
+                 ) -> None:
+        # ----------------------------------------------------------------------
+        # checks
+        for name, value in [('size', size), ('nwords', nwords), ('nways', nways)]:
+            if not isinstance(value, int) or value <= 0 or (value & (value - 1)):
+                raise ValueError(f'I-cache {name} must be a power of 2: {value}')
+        if size < 4 * nwords * nways:
+            raise ValueError(f'I-cache size ({size} bytes) must hold at least one line per way ({nways} way(s) of {nwords} words)')
+        if replacement not in InstructionCache.REPLACEMENT:
+            raise ValueError(f'Invalid replacement policy: {replacement}. Valid options: {InstructionCache.REPLACEMENT}')
+        # ----------------------------------------------------------------------
+        # config
+        self.size        = size
+        self.nwords      = nwords
+        self.nways       = nways
+        self.nsets       = size // (4 * nwords * nways)
+        self.replacement = replacement
+        self._word_bits  = log2_int(self.nwords)
+        self._index_bits = log2_int(self.nsets)
+        self._tag_bits   = 30 - self._word_bits - self._index_bits
+        # ----------------------------------------------------------------------
+        # storage
+        self._tags  = [Memory(width=self._tag_bits, depth=self.nsets, name=f'icache_tag{n}') for n in range(nways)]
+        self._data  = [Memory(width=32, depth=self.nsets * self.nwords, name=f'icache_data{n}') for n in range(nways)]
+        # ----------------------------------------------------------------------
+        # IO
+        self.bus        = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='icache')
+        self.address    = Signal(32)  # input
+        self.valid      = Signal()    # input
+        self.invalidate = Signal()    # input
+        self.data       = Signal(32)  # output
+        self.ready      = Signal()    # output
+        self.error      = Signal()    # output
+        self.misaligned = Signal()    # output
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        offset     = self.address[2:2 + self._word_bits]
+        index      = self.address[2 + self._word_bits:2 + self._word_bits + self._index_bits]
+        tag        = self.address[2 + self._word_bits + self._index_bits:]
+        tag_rp     = [mem.read_port(domain='comb') for mem in self._tags]
+        tag_wp     = [mem.write_port() for mem in self._tags]
+        data_rp    = [mem.read_port(domain='comb') for mem in self._data]
+        data_wp    = [mem.write_port() for mem in self._data]
+        line_valid = [Signal(self.nsets, name=f'line_valid{n}') for n in range(self.nways)]
+        way_hit    = Signal(self.nways)
+        hit        = Signal()
+        victim     = Signal(range(self.nways))
+        r_index    = Signal(self._index_bits)
+        r_tag      = Signal(self._tag_bits)
+        r_victim   = Signal.like(victim)
+        r_cnt      = Signal(self._word_bits)
+        r_stale    = Signal()
+        last       = Signal()
+
+        m.submodules += tag_rp, tag_wp, data_rp, data_wp
+
+        # ----------------------------------------------------------------------
+        # Lookup
+        for way in range(self.nways):
+            m.d.comb += [
+                tag_rp[way].addr.eq(index),
+                data_rp[way].addr.eq(Cat(offset, index)),
+                way_hit[way].eq(line_valid[way].bit_select(index, 1) & (tag_rp[way].data == tag))
+            ]
+            with m.If(way_hit[way]):
+                m.d.comb += self.data.eq(data_rp[way].data)
+        m.d.comb += [
+            hit.eq(way_hit.any()),
+            self.misaligned.eq(self.valid & self.address[:2].any())
+        ]
+
+        # ----------------------------------------------------------------------
+        # Replacement
+        if self.nways > 1:
+            invalid_way = Signal(self.nways)
+            policy_way  = Signal.like(victim)
+            m.d.comb += invalid_way.eq(~Cat(lv.bit_select(index, 1) for lv in line_valid))
+
+            if self.replacement == 'lru':
+                plru  = Array(Signal(self.nways - 1, name=f'plru{n}') for n in range(self.nsets))
+                masks = plru_masks(self.nways)
+                for way, (mask, toward) in enumerate(masks):
+                    with m.If((plru[index] & mask) == toward):
+                        m.d.comb += policy_way.eq(way)
+                # On a hit, point all the nodes in the path away from the accessed way
+                with m.If(self.valid & hit & ~self.misaligned):
+                    for way, (mask, toward) in enumerate(masks):
+                        with m.If(way_hit[way]):
+                            m.d.sync += plru[index].eq((plru[index] & ~mask) | (~toward & mask))
+            else:
+                lfsr = Signal(16, reset=0xACE1)
+                m.d.sync += lfsr.eq(Cat(lfsr[1:], lfsr[0] ^ lfsr[2] ^ lfsr[3] ^ lfsr[5]))
+                m.d.comb += policy_way.eq(lfsr[:log2_int(self.nways)])
+
+            # Use invalid ways first
+            m.d.comb += victim.eq(policy_way)
+            for way in reversed(range(self.nways)):
+                with m.If(invalid_way[way]):
+                    m.d.comb += victim.eq(way)
+        else:
+            m.d.comb += victim.eq(0)
+
+        # ----------------------------------------------------------------------
+        # Control
+        m.d.comb += [
+            last.eq(r_cnt == self.nwords - 1),
+            self.bus.adr.eq(Cat(r_cnt, r_index, r_tag)),
+            self.bus.sel.eq(0b1111),
+            self.bus.we.eq(0)
+        ]
+        if hasattr(self.bus, 'cti'):
+            with m.If(last):
+                m.d.comb += self.bus.cti.eq(CycleType.END_OF_BURST)
+            with m.Else():
+                m.d.comb += self.bus.cti.eq(CycleType.INCR_BURST)
+        if hasattr(self.bus, 'bte'):
+            m.d.comb += self.bus.bte.eq(BurstTypeExt.LINEAR)
+
+        with m.FSM(name='icache'):
+            with m.State('LOOKUP'):
+                m.d.comb += self.ready.eq(self.valid & hit & ~self.misaligned)
+                with m.If(self.valid & ~hit & ~self.misaligned & ~self.invalidate):
+                    m.d.sync += [
+                        r_index.eq(index),
+                        r_tag.eq(tag),
+                        r_victim.eq(victim),
+                        r_cnt.eq(0),
+                        r_stale.eq(0)
+                    ]
+                    # the refill overwrites the victim: invalidate it now, in case the refill fails
+                    with m.Switch(victim):
+                        for way in range(self.nways):
+                            with m.Case(way):
+                                m.d.sync += line_valid[way].bit_select(index, 1).eq(0)
+                    m.next = 'REFILL'
+            with m.State('REFILL'):
+                m.d.comb += [
+                    self.bus.cyc.eq(1),
+                    self.bus.stb.eq(1)
+                ]
+                for way in range(self.nways):
+                    m.d.comb += [
+                        data_wp[way].addr.eq(Cat(r_cnt, r_index)),
+                        data_wp[way].data.eq(self.bus.dat_r),
+                        data_wp[way].en.eq(self.bus.ack & (r_victim == way)),
+                        tag_wp[way].addr.eq(r_index),
+                        tag_wp[way].data.eq(r_tag),
+                        tag_wp[way].en.eq(self.bus.ack & last & (r_victim == way))
+                    ]
+                with m.If(self.bus.ack):
+                    m.d.sync += r_cnt.eq(r_cnt + 1)
+                    with m.If(last):
+                        with m.If(~r_stale & ~self.invalidate):
+                            with m.Switch(r_victim):
+                                for way in range(self.nways):
+                                    with m.Case(way):
+                                        m.d.sync += line_valid[way].bit_select(r_index, 1).eq(1)
+                        m.next = 'LOOKUP'
+                if hasattr(self.bus, 'err'):
+                    with m.Elif(self.bus.err):
+                        m.d.comb += self.error.eq(1)
+                        m.next = 'LOOKUP'
+                # the line may be stale: do not validate it
+                with m.If(self.invalidate):
+                    m.d.sync += r_stale.eq(1)
+
+        # ----------------------------------------------------------------------
+        # Invalidate all lines (fence.i)
+        with m.If(self.invalidate):
+            m.d.sync += [lv.eq(Const(0, self.nsets)) for lv in line_valid]
+
+        return m
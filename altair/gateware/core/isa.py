@@ -8,29 +8,33 @@ Priviledge Arquitecture v1.11
 
 
 class Opcode(IntEnum):
-    LUI    = 0b0110111
-    AUIPC  = 0b0010111
-    JAL    = 0b1101111
-    JALR   = 0b1100111
-    BRANCH = 0b1100011
-    LOAD   = 0b0000011
-    STORE  = 0b0100011
-    OP_IMM = 0b0010011
-    OP     = 0b0110011
-    FENCE  = 0b0001111
-    SYSTEM = 0b1110011
-    AMO    = 0b0101111
+    LUI     = 0b0110111
+    AUIPC   = 0b0010111
+    JAL     = 0b1101111
+    JALR    = 0b1100111
+    BRANCH  = 0b1100011
+    LOAD    = 0b0000011
+    STORE   = 0b0100011
+    OP_IMM  = 0b0010011
+    OP      = 0b0110011
+    FENCE   = 0b0001111
+    SYSTEM  = 0b1110011
+    AMO     = 0b0101111
+    CUSTOM0 = 0b0001011
+    CUSTOM1 = 0b0101011
+    CUSTOM2 = 0b1011011
+    CUSTOM3 = 0b1111011
 
 
 class Funct3(IntEnum):
-    BEQ  = B  = ADD  = FENCE  = PRIV   = MUL    = _c  = 0b000
-    BNE  = H  = SLL  = FENCEI = CSRRW  = MULH   = _d  = 0b001
-    _0   = W  = SLT  = _5     = CSRRS  = MULHSU = AMO = 0b010
-    _1   = _2 = SLTU = _6     = CSRRC  = MULHU  = _e  = 0b011
-    BLT  = BU = XOR  = _7     = _b     = DIV    = _f  = 0b100
-    BGE  = HU = SR   = _8     = CSRRWI = DIVU   = _g  = 0b101
-    BLTU = _3 = OR   = _9     = CSRRSI = REM    = _h  = 0b110
-    BGEU = _4 = AND  = _a     = CSRRCI = REMU   = _i  = 0b111
+    BEQ  = B  = ADD  = FENCE  = PRIV   = MUL    = _c  = _j     = _p   = 0b000
+    BNE  = H  = SLL  = FENCEI = CSRRW  = MULH   = _d  = _k     = _q   = 0b001
+    _0   = W  = SLT  = _5     = CSRRS  = MULHSU = AMO = SH1ADD = _r   = 0b010
+    _1   = _2 = SLTU = _6     = CSRRC  = MULHU  = _e  = _l     = _s   = 0b011
+    BLT  = BU = XOR  = _7     = _b     = DIV    = _f  = SH2ADD = MIN  = 0b100
+    BGE  = HU = SR   = _8     = CSRRWI = DIVU   = _g  = _m     = MINU = 0b101
+    BLTU = _3 = OR   = _9     = CSRRSI = REM    = _h  = SH3ADD = MAX  = 0b110
+    BGEU = _4 = AND  = _a     = CSRRCI = REMU   = _i  = _n     = MAXU = 0b111
 
 
 class Funct5(IntEnum):
@@ -51,6 +55,10 @@ class Funct7(IntEnum):
     SRL = ADD = 0b0000000
     SRA = SUB = 0b0100000
     MULDIV    = 0b0000001
+    SHADD     = 0b0010000
+    ANDN      = 0b0100000
+    MINMAX    = 0b0000101
+    ROT       = 0b0110000
 
 
 class Funct12(IntEnum):
@@ -60,6 +68,14 @@ class Funct12(IntEnum):
     SRET   = 0b000100000010
     MRET   = 0b001100000010
     WFI    = 0b000100000101
+    CLZ    = 0b011000000000
+    CTZ    = 0b011000000001
+    CPOP   = 0b011000000010
+    SEXTB  = 0b011000000100
+    SEXTH  = 0b011000000101
+    REV8   = 0b011010011000
+    ORCB   = 0b001010000111
+    ZEXTH  = 0b000010000000
 
 
 class CSRIndex(IntEnum):
@@ -84,6 +100,10 @@ class CSRIndex(IntEnum):
     MINSTRET   = 0xB02
     MCYCLEH    = 0xB80
     MINSTRETH  = 0xB82
+    MCOUNTINHIBIT = 0x320
+    MHPMEVENT3    = 0x323  # mhpmevent3..31: MHPMEVENT3 + n - 3
+    MHPMCOUNTER3  = 0xB03  # mhpmcounter3..31
+    MHPMCOUNTER3H = 0xB83  # mhpmcounter3h..31h
     CYCLE      = 0xC00
     INSTRET    = 0xC02
     CYCLEH     = 0xC80
@@ -95,6 +115,13 @@ class CSRIndex(IntEnum):
     TSELECT    = 0x7A0
     TDATA1     = 0x7A1
     TDATA2     = 0x7A2
+    # branch predictor (custom)
+    MBPHIT     = 0x7C0
+    MBPMISS    = 0x7C1
+    # atomics (custom)
+    MSCFAIL    = 0x7C2
+    # interconnect (custom)
+    MBUSWAIT   = 0x7C3
 
 
 class ExceptionCause(IntEnum):
@@ -179,8 +206,8 @@ mtvec_layout = [
 ]
 
 mepc_layout = [
-    ('zero',   2, CSRAccess.RO),
-    ('base',  30, CSRAccess.RW)
+    ('zero',   1, CSRAccess.RO),
+    ('base',  31, CSRAccess.RW)   # bit 1 is zero without RV32C
 ]
 
 mip_layout = [
@@ -230,6 +257,18 @@ minstret_layout = [
     ('minstreth', 32, CSRAccess.RW)
 ]
 
+mcountinhibit_layout = [
+    ('cy',     1, CSRAccess.RW),  # mcycle
+    ('zero0',  1, CSRAccess.RO),
+    ('ir',     1, CSRAccess.RW),  # minstret
+    ('hpm',   29, CSRAccess.RW)   # mhpmcounter3..31
+]
+
+mhpmevent_layout = [
+    ('event',  5, CSRAccess.RW),  # HPMEvent
+    ('zero0', 27, CSRAccess.RO)
+]
+
 dcsr_layout = [
     ('prv',        2, CSRAccess.RW),  # Privilege level before Debug Mode was entered
     ('step',       1, CSRAccess.RW),  # Execute a single instruction and re-enter Debug Mode
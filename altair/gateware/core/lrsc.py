@@ -1,31 +1,55 @@
-from ast import LShift
-from curses.ascii import SI
+from amaranth import Array
 from amaranth import Signal
 from amaranth import Module
 from amaranth import Elaboratable
+from amaranth.utils import log2_int
 from amaranth.build import Platform
 
 
 class LRSC(Elaboratable):
-    def __init__(self, nmasters) -> None:
+    """Reservations for LR/SC, for the masters (harts) of a slave.
+
+    Each master has its own reservation: LR reserves the granule (`granule` bytes) of the
+    address, and SC succeeds only if the reservation of the master is still valid. A
+    reservation is lost:
+    - With the SC of the master (successful or not).
+    - When any master writes to the reserved granule (store, AMO, SC).
+    - After `timeout` cycles (0: no timeout). The timeout must be longer than the LR/SC
+      sequence, or the SC always fails.
+
+    Harts using different granules do not invalidate each other.
+    """
+    def __init__(self, nmasters: int, granule: int = 4, timeout: int = 0) -> None:
+        if granule < 4 or (granule & (granule - 1)):
+            raise ValueError(f'Invalid LR/SC granule: {granule}. Must be a power of 2, greater or equal than 4')
+        if timeout < 0:
+            raise ValueError(f'Invalid LR/SC timeout: {timeout}. Must be positive, or 0 (no timeout)')
+        # config
+        self.nmasters = nmasters
+        self.granule  = granule
+        self.timeout  = timeout
+        # IO
         self.idx     = Signal(range(nmasters))
         self.address = Signal(30)
         self.we      = Signal()
         self.lock    = Signal()
+        self.amo     = Signal()  # the locked write is a near-memory AMO
         self.valid   = Signal()
         self.ack     = Signal()
         self.sc_fail = Signal()
 
-    def tap_bus(self, *, m, idx, master, slave):
+    def tap_bus(self, *, m, idx, master, slave, amo=0):
+        # amo: the locked write is a near-memory AMO, not a SC. It only clears the reservations.
         m.d.comb += [
             self.idx.eq(idx),
             self.address.eq(master.adr),
             self.we.eq(master.we),
             self.lock.eq(master.lock),
+            self.amo.eq(amo),
             self.valid.eq(master.cyc),
             self.ack.eq(master.ack),
         ]
-        with m.If(master.lock):
+        with m.If(master.lock & ~(master.we & amo)):
             with m.If(master.we):
                 # For writes, default to 0
                 m.d.comb += master.dat_r.eq(0)
@@ -41,25 +65,40 @@ class LRSC(Elaboratable):
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
 
-        idx_reservation   = Signal.like(self.idx)
-        reservation       = Signal(30)
-        valid_reservation = Signal()
+        offset_bits = log2_int(self.granule) - 2  # word address -> granule
+        tag         = self.address[offset_bits:]
+
+        reservation       = Array(Signal(len(tag), name=f'reservation{n}') for n in range(self.nmasters))
+        valid_reservation = Array(Signal(name=f'valid_reservation{n}') for n in range(self.nmasters))
+        reservation_match = Signal(self.nmasters)
+        done              = self.valid & self.ack
+        is_sc             = self.lock & self.we & ~self.amo
 
-        reservation_match = reservation == self.address
-        idx_match         = idx_reservation == self.idx
+        for n in range(self.nmasters):
+            own = self.idx == n
+            m.d.comb += reservation_match[n].eq(valid_reservation[n] & (reservation[n] == tag))
+
+            # Do the reservation (LR). Clear it with the SC, or a write to the granule (store, AMO,
+            # successful SC: a failed SC does not write)
+            with m.If(done & own & self.lock & ~self.we):
+                m.d.sync += [
+                    reservation[n].eq(tag),
+                    valid_reservation[n].eq(1)
+                ]
+            with m.Elif(done & self.we & ((own & is_sc) | (reservation_match[n] & ~self.sc_fail))):
+                m.d.sync += valid_reservation[n].eq(0)
 
-        # Do the reservation (LR)
-        with m.If(self.lock & self.valid & ~self.we & self.ack):
-            m.d.sync += [
-                idx_reservation.eq(self.idx),
-                reservation.eq(self.address),
-                valid_reservation.eq(1)
-            ]
-        with m.Elif(self.valid & self.we & self.ack):
-            m.d.sync += valid_reservation.eq(0)
+            if self.timeout:
+                timer = Signal(range(self.timeout + 1), name=f'timer{n}')
+                with m.If(done & own & self.lock & ~self.we):
+                    m.d.sync += timer.eq(self.timeout)
+                with m.Elif(timer != 0):
+                    m.d.sync += timer.eq(timer - 1)
+                    with m.If(timer == 1):
+                        m.d.sync += valid_reservation[n].eq(0)
 
         # Check reservaton (SC)
-        with m.If(self.lock & self.valid & self.we):
-            m.d.comb += self.sc_fail.eq(~(idx_match & reservation_match & valid_reservation))
+        with m.If(self.valid & is_sc):
+            m.d.comb += self.sc_fail.eq(~reservation_match.bit_select(self.idx, 1))
 
         return m
@@ -1,53 +1,84 @@
 from amaranth import Cat
+from amaranth import Const
 from amaranth import Repl
 from amaranth import Signal
 from amaranth import Module
 from amaranth import Elaboratable
 from amaranth.build import Platform
 from amaranth_soc.wishbone.bus import Interface
+from amaranth_soc.wishbone.bus import CycleType
+from amaranth_soc.wishbone.bus import BurstTypeExt
 from altair.gateware.core.isa import Funct3
 
 
 class _DataFormat(Elaboratable):
-    def __init__(self) -> None:
+    def __init__(self, split: bool = False) -> None:
+        # split: the access can span two words. The byte selector and write data are 64-bit
+        # (first word, second word), and the load data is read from the two words
+        width = 64 if split else 32
+        self.split      = split
         self.op         = Signal(Funct3)
         self.offset     = Signal(2)
-        self.byte_sel   = Signal(4)
+        self.byte_sel   = Signal(width // 8)
         self.store_data = Signal(32)
-        self.data_write = Signal(32)
-        self.data_read  = Signal(32)
+        self.data_write = Signal(width)
+        self.data_read  = Signal(width)
         self.load_data  = Signal(32)
         self.misaligned = Signal()
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
 
-        # create byte selector
-        with m.Switch(self.op):
-            with m.Case(Funct3.B):
-                m.d.comb += self.byte_sel.eq(0b0001 << self.offset)
-            with m.Case(Funct3.H):
-                m.d.comb += self.byte_sel.eq(0b0011 << self.offset)
-            with m.Case(Funct3.W):
-                m.d.comb += self.byte_sel.eq(0b1111)
-
-        # format write data
-        with m.Switch(self.op):
-            with m.Case(Funct3.B):
-                m.d.comb += self.data_write.eq(Repl(self.store_data[:8], 4))
-            with m.Case(Funct3.H):
-                m.d.comb += self.data_write.eq(Repl(self.store_data[:16], 2))
-            with m.Case(Funct3.W):
-                m.d.comb += self.data_write.eq(self.store_data)
+        if self.split:
+            # create byte selector
+            with m.Switch(self.op):
+                with m.Case(Funct3.B, Funct3.BU):
+                    m.d.comb += self.byte_sel.eq(0b0001 << self.offset)
+                with m.Case(Funct3.H, Funct3.HU):
+                    m.d.comb += self.byte_sel.eq(0b0011 << self.offset)
+                with m.Case(Funct3.W):
+                    m.d.comb += self.byte_sel.eq(0b1111 << self.offset)
+
+            # format write data
+            m.d.comb += self.data_write.eq(self.store_data << Cat(Const(0, 3), self.offset))
+        else:
+            # create byte selector
+            with m.Switch(self.op):
+                with m.Case(Funct3.B, Funct3.BU):
+                    m.d.comb += self.byte_sel.eq(0b0001 << self.offset)
+                with m.Case(Funct3.H, Funct3.HU):
+                    m.d.comb += self.byte_sel.eq(0b0011 << self.offset)
+                with m.Case(Funct3.W):
+                    m.d.comb += self.byte_sel.eq(0b1111)
+
+            # format write data
+            with m.Switch(self.op):
+                with m.Case(Funct3.B):
+                    m.d.comb += self.data_write.eq(Repl(self.store_data[:8], 4))
+                with m.Case(Funct3.H):
+                    m.d.comb += self.data_write.eq(Repl(self.store_data[:16], 2))
+                with m.Case(Funct3.W):
+                    m.d.comb += self.data_write.eq(self.store_data)
 
         # format input data
         _byte = Signal((8, True))
         _half = Signal((16, True))
-
-        m.d.comb += [
-            _byte.eq(self.data_read.word_select(self.offset, 8)),
-            _half.eq(self.data_read.word_select(self.offset[1], 16)),
-        ]
+        _word = Signal(32)
+
+        if self.split:
+            _data = Signal(64)
+            m.d.comb += [
+                _data.eq(self.data_read >> Cat(Const(0, 3), self.offset)),
+                _byte.eq(_data[:8]),
+                _half.eq(_data[:16]),
+                _word.eq(_data[:32])
+            ]
+        else:
+            m.d.comb += [
+                _byte.eq(self.data_read.word_select(self.offset, 8)),
+                _half.eq(self.data_read.word_select(self.offset[1], 16)),
+                _word.eq(self.data_read)
+            ]
 
         with m.Switch(self.op):
             with m.Case(Funct3.B):
@@ -59,7 +90,7 @@ class _DataFormat(Elaboratable):
             with m.Case(Funct3.HU):
                 m.d.comb += self.load_data.eq(Cat(_half, 0))  # make sign bit = 0
             with m.Case(Funct3.W):
-                m.d.comb += self.load_data.eq(self.data_read)
+                m.d.comb += self.load_data.eq(_word)
 
         # exception/misaligment
         with m.Switch(self.op):
@@ -72,9 +103,18 @@ class _DataFormat(Elaboratable):
 
 
 class LoadStoreUnit(Elaboratable):
-    def __init__(self, features) -> None:
+    """Load/store unit.
+
+    With `misaligned`, a halfword/word access that spans two words is split into two bus
+    accesses (first word, then second word), and the bytes are merged. The core sees a single
+    access. Atomic accesses (`lrsc`, `atomic`) must be aligned: they are still reported as
+    misaligned. Without it, every unaligned access is reported as misaligned.
+    """
+    def __init__(self, features, misaligned: bool = False) -> None:
+        # config
+        self.split = misaligned
         # submodules
-        self._dataformat = _DataFormat()
+        self._dataformat = _DataFormat(split=misaligned)
         # IO
         self.mport      = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='mport')
         self.address    = Signal(32)
@@ -88,6 +128,7 @@ class LoadStoreUnit(Elaboratable):
         self.error      = Signal()
         self.misaligned = Signal()
         self.lrsc       = Signal()
+        self.atomic     = Signal()
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
@@ -99,21 +140,58 @@ class LoadStoreUnit(Elaboratable):
             self._dataformat.offset.eq(self.address[:2]),
             self._dataformat.store_data.eq(self.store_data),
             self.load_data.eq(self._dataformat.load_data),
-            self.misaligned.eq(self._dataformat.misaligned),
 
-            self.mport.adr.eq(self.address[2:]),
-            self.mport.dat_w.eq(self._dataformat.data_write),
-            self.mport.sel.eq(self._dataformat.byte_sel),
             self.mport.we.eq(self.write),
             self.mport.cyc.eq(~self.misaligned & self.cycle),
             self.mport.stb.eq(self.strobe),
 
-            self.ready.eq(self.mport.ack),
-            self.error.eq(self.mport.err),
-            self._dataformat.data_read.eq(self.mport.dat_r)
+            self.error.eq(self.mport.err)
         ]
 
+        if self.split:
+            second  = Signal()    # accessing the second word
+            cross   = Signal()    # the access spans two words
+            lo_data = Signal(32)  # data from the first word
+            m.d.comb += [
+                cross.eq(self._dataformat.byte_sel[4:].any()),
+                self.misaligned.eq(self._dataformat.misaligned & (self.lrsc | self.atomic)),
+
+                self.mport.adr.eq(self.address[2:] + second),
+                self.mport.dat_w.eq(self._dataformat.data_write.word_select(second, 32)),
+                self.mport.sel.eq(self._dataformat.byte_sel.word_select(second, 4)),
+
+                self.ready.eq(self.mport.ack & (second | ~cross))
+            ]
+            with m.If(second):
+                m.d.comb += self._dataformat.data_read.eq(Cat(lo_data, self.mport.dat_r))
+            with m.Else():
+                m.d.comb += self._dataformat.data_read.eq(self.mport.dat_r)
+
+            with m.If(~self.cycle | self.error):
+                m.d.sync += second.eq(0)
+            with m.Elif(self.mport.ack):
+                m.d.sync += [
+                    second.eq(cross & ~second),
+                    lo_data.eq(self.mport.dat_r)
+                ]
+        else:
+            m.d.comb += [
+                self.misaligned.eq(self._dataformat.misaligned),
+
+                self.mport.adr.eq(self.address[2:]),
+                self.mport.dat_w.eq(self._dataformat.data_write),
+                self.mport.sel.eq(self._dataformat.byte_sel),
+
+                self.ready.eq(self.mport.ack),
+                self._dataformat.data_read.eq(self.mport.dat_r)
+            ]
+
         if hasattr(self.mport, 'lock'):
             m.d.comb += self.mport.lock.eq(self.lrsc)
+        # single accesses
+        if hasattr(self.mport, 'cti'):
+            m.d.comb += self.mport.cti.eq(CycleType.CLASSIC)
+        if hasattr(self.mport, 'bte'):
+            m.d.comb += self.mport.bte.eq(BurstTypeExt.LINEAR)
 
         return m
@@ -10,7 +10,24 @@ from altair.gateware.core.isa import Funct3
 
 
 class Multiplier(Elaboratable):
-    def __init__(self) -> None:
+    """Multiplier.
+
+    - Parallel: the product is computed in 4 steps (operands, partial products, sum,
+      sign/select). `latency` (1 to 4) sets the number of registers between the steps,
+      and the result is ready exactly `latency` cycles after the request:
+        - 4: register after each step.
+        - 3: operands and partial products in the same cycle.
+        - 2: operands and partial products, then sum and sign/select.
+        - 1: everything in one cycle (for FPGAs with wide DSP blocks).
+    - Iterative: shift-and-add, 1 bit per cycle (low area). The result is ready after 34 cycles.
+    """
+    def __init__(self, latency: int = 4, iterative: bool = False) -> None:
+        if latency not in range(1, 5):
+            raise ValueError(f'Invalid multiplier latency: {latency}. Valid options: 1 to 4')
+        # config
+        self.latency   = latency
+        self.iterative = iterative
+        # IO
         self.op     = Signal(Funct3)   # input
         self.dat1   = Signal(32)  # input
         self.dat2   = Signal(32)  # input
@@ -21,6 +38,22 @@ class Multiplier(Elaboratable):
     def elaborate(self, platform: Platform) -> Module:
         m           = Module()
 
+        a_is_signed = Signal()
+        b_is_signed = Signal()
+
+        m.d.comb += [
+            a_is_signed.eq(((self.op == Funct3.MULH) | (self.op == Funct3.MULHSU)) & self.dat1[-1]),
+            b_is_signed.eq((self.op == Funct3.MULH) & self.dat2[-1])
+        ]
+
+        if self.iterative:
+            self.elaborate_iterative(m, a_is_signed, b_is_signed)
+        else:
+            self.elaborate_parallel(m, a_is_signed, b_is_signed)
+
+        return m
+
+    def elaborate_parallel(self, m: Module, a_is_signed: Signal, b_is_signed: Signal) -> None:
         a           = Signal(signed(33))
         b           = Signal(signed(33))
         result_ll   = Signal(32)
@@ -29,46 +62,84 @@ class Multiplier(Elaboratable):
         result_hh   = Signal(33)
         result_3    = Signal(64)
         result_4    = Signal(64)
-        active      = Signal(5)
+        active      = Signal(self.latency)
         is_signed   = Signal()
-        a_is_signed = Signal()
-        b_is_signed = Signal()
         low         = Signal()
 
-        m.d.sync += [
-            is_signed.eq(a_is_signed ^ b_is_signed),
-            active.eq(Cat(self.valid & (active == 0), active)),
-            low.eq(self.op == Funct3.MUL)
-        ]
+        # registers after each step
+        registers = {
+            1: ['step4'],
+            2: ['step2', 'step4'],
+            3: ['step2', 'step3', 'step4'],
+            4: ['step1', 'step2', 'step3', 'step4']
+        }[self.latency]
+        domain = {step: 'sync' if step in registers else 'comb' for step in ['step1', 'step2', 'step3', 'step4']}
+
+        m.d.sync += active.eq(Cat(self.valid & (active == 0), active))
         # ----------------------------------------------------------------------
-        # fist state
-        m.d.comb += [
-            a_is_signed.eq(((self.op == Funct3.MULH) | (self.op == Funct3.MULHSU)) & self.dat1[-1]),
-            b_is_signed.eq((self.op == Funct3.MULH) & self.dat2[-1])
-        ]
-        m.d.sync += [
+        # first step
+        m.d[domain['step1']] += [
+            is_signed.eq(a_is_signed ^ b_is_signed),
+            low.eq(self.op == Funct3.MUL),
             a.eq(Mux(a_is_signed, -Cat(self.dat1, 1), self.dat1)),
             b.eq(Mux(b_is_signed, -Cat(self.dat2, 1), self.dat2)),
         ]
         # ----------------------------------------------------------------------
-        # second state
-        m.d.sync += [
+        # second step
+        m.d[domain['step2']] += [
             result_ll.eq(a[0:16] * b[0:16]),
             result_lh.eq(a[0:16] * b[16:33]),
             result_hl.eq(a[16:33] * b[0:16]),
             result_hh.eq(a[16:33] * b[16:33])
         ]
         # ----------------------------------------------------------------------
-        # third state
-        m.d.sync += [
+        # third step
+        m.d[domain['step3']] += [
             result_3.eq(Cat(result_ll, result_hh) + Cat(Repl(0, 16), (result_lh + result_hl)))
         ]
         # ----------------------------------------------------------------------
-        # fourth state
-        m.d.sync += [
-            result_4.eq(Mux(is_signed, -result_3, result_3)),
-            self.result.eq(Mux(low, result_4[:32], result_4[32:64]))
-        ]
+        # fourth step
+        m.d.comb += result_4.eq(Mux(is_signed, -result_3, result_3))
+        m.d[domain['step4']] += self.result.eq(Mux(low, result_4[:32], result_4[32:64]))
+
         m.d.comb += self.ready.eq(active[-1])
 
-        return m
+    def elaborate_iterative(self, m: Module, a_is_signed: Signal, b_is_signed: Signal) -> None:
+        a         = Signal(32)  # magnitude
+        product   = Signal(64)  # upper part: partial sum. Lower part: multiplier bits
+        partial   = Signal(33)
+        result    = Signal(64)
+        count     = Signal(range(32))
+        is_signed = Signal()
+        low       = Signal()
+
+        m.d.comb += [
+            partial.eq(product[32:] + Mux(product[0], a, 0)),
+            result.eq(Mux(is_signed, -product, product))
+        ]
+        m.d.sync += self.ready.eq(0)
+
+        with m.FSM(name='multiplier'):
+            with m.State('IDLE'):
+                with m.If(self.valid & ~self.ready):
+                    m.d.sync += [
+                        is_signed.eq(a_is_signed ^ b_is_signed),
+                        low.eq(self.op == Funct3.MUL),
+                        a.eq(Mux(a_is_signed, (-self.dat1)[:32], self.dat1)),
+                        product.eq(Mux(b_is_signed, (-self.dat2)[:32], self.dat2)),
+                        count.eq(31)
+                    ]
+                    m.next = 'RUN'
+            with m.State('RUN'):
+                m.d.sync += [
+                    product.eq(Cat(product[1:32], partial)),
+                    count.eq(count - 1)
+                ]
+                with m.If(count == 0):
+                    m.next = 'DONE'
+            with m.State('DONE'):
+                m.d.sync += [
+                    self.result.eq(Mux(low, result[:32], result[32:64])),
+                    self.ready.eq(1)
+                ]
+                m.next = 'IDLE'
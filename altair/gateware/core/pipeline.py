@@ -0,0 +1,981 @@
+from amaranth import Cat
+from amaranth import Mux
+from amaranth import Signal
+from amaranth import Module
+from amaranth.build import Platform
+from altair.gateware.core.isa import Funct3
+from altair.gateware.core.isa import Funct5
+from altair.gateware.core.isa import ExceptionCause
+from altair.gateware.core.counters import HPMEvent
+from altair.gateware.core.base import CoreBase
+
+
+class PipelinedCore(CoreBase):
+    """In-order, 5-stage pipelined core: IF/ID/EX/MEM/WB.
+
+    - IF: fetch from the bus. One transaction in flight.
+    - ID: decode + register file read. The decoder registers are the ID/EX latch.
+    - EX: ALU, branch resolution, multiplier/divider.
+    - MEM: load/store/AMO, CSR access, accelerator commands, trap handling (precise).
+    - WB: register file write.
+
+    Results are forwarded from MEM and WB to EX. Loads, AMOs, CSR reads and accelerator
+    responses stall a dependent instruction in EX until the result reaches WB. Without
+    I-cache, fetch and data accesses share the LSU, and the MEM stage has priority. With
+    I-cache, IF reads from the cache (one instruction per cycle on hits), and the refills
+    are arbitrated with the LSU. The prefetch buffer works the same way, reading ahead
+    sequentially.
+
+    Without branch predictor, IF fetches the next sequential address (predict not-taken).
+    With branch predictor, IF follows the predicted target. EX checks the prediction, and
+    redirects the fetch on a mispredict.
+
+    With RV32C, IF reads the words through the realigner, and passes the expanded
+    instructions to ID. A 16-bit instruction in the upper half of the last word read does not
+    use the bus.
+    """
+    # transparent read ports: a write in WB is visible to the read in ID
+    GPRF_TRANSPARENT = True
+    BRANCH_PREDICTOR = True
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        # ----------------------------------------------------------------------
+        # signals
+        redirect    = Signal()
+        redirect_pc = Signal(32)
+        # IF
+        fetch_pc    = Signal(32, reset=self.reset_address)
+        f_addr      = Signal(32)
+        f_busy      = Signal()
+        f_kill      = Signal()
+        f_start     = Signal()
+        f_owns      = Signal()
+        f_done      = Signal()
+        f_read      = Signal()
+        f_word      = Signal(32)
+        f_inst      = Signal(32)
+        f_compr     = Signal()
+        f_raw       = Signal(16)  # 16-bit instruction as fetched (mtval)
+        f_valid     = Signal()
+        f_fault     = Signal()
+        f_next      = Signal()
+        f_pred      = Signal()
+        f_pred_pc   = Signal(32)
+        f_history   = Signal(max(self._bp_history, 1))
+        # ID
+        d_valid     = Signal()
+        d_pc        = Signal(32)
+        d_inst      = Signal(32)
+        d_compr     = Signal()
+        d_raw       = Signal(16)
+        d_fault     = Signal()
+        d_ecode     = Signal(ExceptionCause)
+        d_pred      = Signal()
+        d_pred_pc   = Signal(32)
+        d_history   = Signal(max(self._bp_history, 1))
+        advance_dx  = Signal()
+        # EX
+        x_valid     = Signal()
+        x_pc        = Signal(32)
+        x_pc4       = Signal(32)
+        x_inst      = Signal(32)
+        x_compr     = Signal()
+        x_raw       = Signal(16)
+        x_fault     = Signal()
+        x_ecode     = Signal(ExceptionCause)
+        x_rs2       = Signal(5)
+        x_rs1_data  = Signal(32)
+        x_rs2_data  = Signal(32)
+        x_hazard    = Signal()
+        x_stall     = Signal()
+        x_fire      = Signal()
+        x_ready     = Signal()
+        x_redirect  = Signal()
+        x_pred      = Signal()
+        x_pred_pc   = Signal(32)
+        x_history   = Signal(max(self._bp_history, 1))
+        x_taken     = Signal()
+        x_target    = Signal(32)
+        x_next_pc   = Signal(32)
+        x_mispred   = Signal()
+        x_result    = Signal(32)
+        x_exception = Signal()
+        x_mret      = Signal()
+        x_ecause    = Signal(ExceptionCause)
+        x_edata     = Signal(32)
+        x_wr        = Signal()
+        alu_a       = Signal(32)
+        alu_b       = Signal(32)
+        cmp_b       = Signal(32)
+        add_out     = Signal(32)
+        logic_out   = Signal(32)
+        shift_out   = Signal(32)
+        is_eq       = Signal()
+        is_lt       = Signal()
+        is_ltu      = Signal()
+        ltx_cmp_out = Signal()
+        b_taken     = Signal()
+        jb_error    = Signal()
+        md_valid    = Signal()
+        md_ready    = Signal()
+        md_result   = Signal(32)
+        md_busy     = Signal()
+        md_stale    = Signal()
+        md_done     = Signal()
+        md_result_q = Signal(32)
+        mult_result = Signal(32)
+        mult_ack    = Signal()
+        div_result  = Signal(32)
+        div_ack     = Signal()
+        # MEM
+        m_valid     = Signal()
+        m_pc        = Signal(32)
+        m_inst      = Signal(32)
+        m_compr     = Signal()
+        m_result    = Signal(32)
+        m_addr      = Signal(32)
+        m_rs1_data  = Signal(32)
+        m_rs2_data  = Signal(32)
+        m_csr_src   = Signal(32)
+        m_wr        = Signal()
+        m_late      = Signal()
+        m_is_ld     = Signal()
+        m_is_st     = Signal()
+        m_is_lr     = Signal()
+        m_is_sc     = Signal()
+        m_is_amo    = Signal()
+        m_is_csr    = Signal()
+        m_is_custom = Signal()
+        m_csr_we    = Signal()
+        m_fence     = Signal()
+        m_fencei    = Signal()
+        m_exception = Signal()
+        m_mret      = Signal()
+        m_ecode     = Signal(ExceptionCause)
+        m_edata     = Signal(32)
+        m_started   = Signal()
+        m_funct3    = Signal(Funct3)
+        m_funct5    = Signal(Funct5)
+        m_rd        = Signal(5)
+        m_bus       = Signal()
+        m_req       = Signal()
+        m_owns      = Signal()
+        m_bus_done  = Signal()
+        m_bus_fault = Signal()
+        m_interrupt = Signal()
+        m_trigger   = Signal()
+        m_pretrap   = Signal()
+        m_trap      = Signal()
+        m_done      = Signal()
+        m_ready     = Signal()
+        m_flush     = Signal()
+        m_target    = Signal(32)
+        csr_valid   = Signal()
+        csr_done    = Signal()
+        csr_fault   = Signal()
+        csr_wdata   = Signal(32)
+        cus_valid   = Signal()
+        cus_sent    = Signal()
+        cus_done    = Signal()
+        # WB
+        w_valid     = Signal()
+        w_wr        = Signal()
+        w_rd        = Signal(5)
+        w_result    = Signal(32)
+        # call/return hints: x1/x5 are link registers
+        rd_link     = (self._decoder.gpr_rd == 1) | (self._decoder.gpr_rd == 5)
+        rs1_link    = (self._decoder.gpr_rs1_q == 1) | (self._decoder.gpr_rs1_q == 5)
+        # ----------------------------------------------------------------------
+        # Register units
+        m.submodules.lsu       = self._lsu
+        m.submodules.decoder   = self._decoder
+        m.submodules.csr       = self._csr
+        m.submodules.exception = self._exceptunit
+        m.submodules += self._gprf_rp1, self._gprf_rp2, self._gprf_wp
+        # optional units: register and connect
+        if self.enable_rv32m:
+            m.submodules.multiplier = self._multiplier
+            m.submodules.divider    = self._divider
+            m.d.comb += [
+                self._multiplier.op.eq(self._decoder.funct3),
+                self._multiplier.dat1.eq(x_rs1_data),
+                self._multiplier.dat2.eq(x_rs2_data),
+                self._multiplier.valid.eq(md_valid & self._decoder.is_mul),
+                mult_result.eq(self._multiplier.result),
+                mult_ack.eq(self._multiplier.ready),
+
+                self._divider.op.eq(self._decoder.funct3),
+                self._divider.dat1.eq(x_rs1_data),
+                self._divider.dat2.eq(x_rs2_data),
+                self._divider.valid.eq(md_valid & self._decoder.is_div),
+                div_result.eq(self._divider.result),
+                div_ack.eq(self._divider.ready)
+            ]
+        else:
+            m.d.comb += [
+                mult_result.eq(0xdead0000),
+                div_result.eq(0x0000beef),
+                mult_ack.eq(0),
+                div_ack.eq(0)
+            ]
+
+        if self.enable_zbb:
+            m.submodules.bitmanip = self._bitmanip
+            m.d.comb += [
+                self._bitmanip.op.eq(self._decoder.bitmanip_op),
+                self._bitmanip.dat1.eq(x_rs1_data),
+                self._bitmanip.dat2.eq(x_rs2_data)
+            ]
+
+        if self.enable_trigger:
+            m.submodules.trigger = self._trigger
+            m.d.comb += [
+                self._trigger.x_pc.eq(m_pc),
+                self._trigger.x_bus_addr.eq(m_addr),
+                self._trigger.x_valid.eq(m_valid & ~m_started),
+                self._trigger.x_load.eq(m_is_ld | m_is_lr),
+                self._trigger.x_store.eq(m_is_st | m_is_sc),
+                m_trigger.eq(self._trigger.trap)
+            ]
+
+        if self.enable_predictor:
+            m.submodules.predictor = self._predictor
+            m.d.comb += [
+                self._predictor.f_pc.eq(fetch_pc),
+                f_pred.eq(self._predictor.f_taken),
+                f_pred_pc.eq(self._predictor.f_target),
+                f_history.eq(self._predictor.f_history),
+
+                self._predictor.x_valid.eq(x_fire & ~x_exception & ~x_mret),
+                self._predictor.x_pc.eq(x_pc),
+                self._predictor.x_history.eq(x_history),
+                self._predictor.x_branch.eq(self._decoder.is_b),
+                self._predictor.x_jump.eq(self._decoder.is_j),
+                self._predictor.x_call.eq(self._decoder.is_j & rd_link),
+                self._predictor.x_return.eq(self._decoder.inst_jalr & rs1_link & ~(rd_link & (self._decoder.gpr_rd == self._decoder.gpr_rs1_q))),
+                self._predictor.x_taken.eq(x_taken),
+                self._predictor.x_target.eq(x_target),
+                self._predictor.x_return_pc.eq(x_pc4),
+                self._predictor.x_hit.eq(~x_mispred)
+            ]
+        else:
+            m.d.comb += f_pred.eq(0)
+
+        # Memory port. With the TCM: core <-> TCM <-> Wishbone port
+        wbport = self.wbport
+        if self.enable_tcm:
+            m.submodules.tcm = self._tcm
+            m.d.comb += self._tcm.bus.connect(self.wbport)
+            if self.enable_near_amo:
+                m.d.comb += self._tcm.op.eq(self.amo_op)
+            wbport = self._tcm.cpu
+        lsu_port = self._lsu.mport
+        if self.enable_sbuffer:
+            m.submodules.sbuffer = self._sbuffer
+            m.d.comb += lsu_port.connect(self._sbuffer.cpu)
+            lsu_port = self._sbuffer.bus
+        if self.enable_dcache:
+            m.submodules.dcache = self._dcache
+            m.d.comb += lsu_port.connect(self._dcache.cpu)
+        if self.enable_fetchunit:
+            m.submodules.fetchunit = self._fetchunit
+            m.submodules.arbiter   = self._arbiter
+            m.d.comb += self._arbiter.bus.connect(wbport)
+            fetch_data       = self._fetchunit.data
+            fetch_ready      = self._fetchunit.ready
+            fetch_error      = self._fetchunit.error
+            fetch_misaligned = self._fetchunit.misaligned
+            if self.enable_prefetch:
+                # end the prefetch burst when the data port waits for the bus
+                m.d.comb += self._fetchunit.release.eq(self._dport.cyc)
+        else:
+            m.d.comb += self._dport.connect(wbport)
+            fetch_data       = self._lsu.load_data
+            fetch_ready      = self._lsu.ready
+            fetch_error      = self._lsu.error
+            fetch_misaligned = self._lsu.misaligned
+
+        # CSR port, decoder and interrupts
+        m.d.comb += [
+            self._csr.privmode.eq(self._exceptunit.m_privmode),
+            self._decoder.privmode.eq(self._exceptunit.m_privmode),
+            self._exceptunit.external_interrupt.eq(self.external_interrupt),
+            self._exceptunit.software_interrupt.eq(self.software_interrupt),
+            self._exceptunit.timer_interrupt.eq(self.timer_interrupt)
+        ]
+
+        # ----------------------------------------------------------------------
+        # Redirection. The oldest instruction (MEM) has priority
+        with m.If(m_flush):
+            m.d.comb += [
+                redirect.eq(1),
+                redirect_pc.eq(m_target)
+            ]
+        with m.Elif(x_redirect):
+            m.d.comb += [
+                redirect.eq(1),
+                redirect_pc.eq(x_next_pc)
+            ]
+
+        # ----------------------------------------------------------------------
+        # Bus ownership: a fetch in flight finishes first. Then, MEM has priority.
+        # The I-cache (or prefetch buffer) has its own port to the bus.
+        if self.enable_fetchunit:
+            m.d.comb += [
+                m_owns.eq(m_req),
+                f_start.eq(~f_busy & (~d_valid | advance_dx) & ~redirect),
+                self._fetchunit.address.eq(Mux(f_busy, f_addr, f_word)),
+                self._fetchunit.valid.eq(f_owns),
+                self._fetchunit.invalidate.eq(m_done & m_fencei)
+            ]
+        else:
+            m.d.comb += [
+                m_owns.eq(m_req & ~f_busy),
+                f_start.eq(~f_busy & ~m_req & (~d_valid | advance_dx) & ~redirect)
+            ]
+        m.d.comb += f_owns.eq(f_busy | (f_start & f_read))
+
+        with m.If(m_owns):
+            m.d.comb += [
+                self._lsu.address.eq(m_addr),
+                self._lsu.store_data.eq(m_rs2_data),
+                self._lsu.write.eq(m_is_st | m_is_sc),
+                self._lsu.cycle.eq(1),
+                self._lsu.strobe.eq(1),
+                self._lsu.op.eq(m_funct3)
+            ]
+            if self.enable_near_amo:
+                m.d.comb += self._lsu.lrsc.eq(m_is_lr | m_is_sc | m_is_amo)  # AMO: the operation is in the sideband
+            elif self.enable_rv32a:
+                m.d.comb += self._lsu.lrsc.eq(m_is_lr | m_is_sc)
+        if not self.enable_fetchunit:
+            with m.Elif(f_owns):
+                m.d.comb += [
+                    self._lsu.address.eq(Mux(f_busy, f_addr, f_word)),
+                    self._lsu.store_data.eq(0xdead_c0de),
+                    self._lsu.write.eq(0),
+                    self._lsu.cycle.eq(1),
+                    self._lsu.strobe.eq(1),
+                    self._lsu.op.eq(Funct3.W)
+                ]
+
+        # ----------------------------------------------------------------------
+        # IF. f_done: end of the bus read. f_next: instruction (or fault) for ID
+        if self.enable_rv32c:
+            m.submodules.realigner = self._realigner
+            m.d.comb += [
+                self._realigner.pc.eq(fetch_pc),
+                self._realigner.request.eq(f_start | (f_busy & ~f_kill)),
+                self._realigner.flush.eq(m_done & m_fencei),
+                self._realigner.data.eq(fetch_data),
+                self._realigner.ready.eq(f_owns & fetch_ready),
+                f_read.eq(self._realigner.fetch),
+                f_word.eq(self._realigner.address),
+                f_inst.eq(self._realigner.instruction),
+                f_compr.eq(self._realigner.compressed),
+                f_raw.eq(self._realigner.raw),
+                f_valid.eq(self._realigner.valid)
+            ]
+        else:
+            m.d.comb += [
+                f_read.eq(1),
+                f_word.eq(fetch_pc),
+                f_inst.eq(fetch_data),
+                f_valid.eq(f_owns & fetch_ready)
+            ]
+        m.d.comb += [
+            f_done.eq(f_owns & (fetch_ready | fetch_error | fetch_misaligned)),
+            f_fault.eq(f_owns & (fetch_error | fetch_misaligned)),
+            f_next.eq((f_valid | f_fault) & ~f_kill)
+        ]
+
+        with m.If(f_done):
+            m.d.sync += [
+                f_busy.eq(0),
+                f_kill.eq(0)
+            ]
+        with m.Elif(f_start & f_read):
+            m.d.sync += [
+                f_busy.eq(1),
+                f_addr.eq(f_word)
+            ]
+
+        with m.If(redirect):
+            m.d.sync += fetch_pc.eq(redirect_pc)
+            with m.If(f_busy & ~f_done):
+                m.d.sync += f_kill.eq(1)  # discard the fetch in flight
+        with m.Elif(f_next):
+            m.d.sync += fetch_pc.eq(Mux(f_pred, f_pred_pc, fetch_pc + Mux(f_compr, 2, 4)))
+
+        # IF/ID latch
+        with m.If(redirect):
+            m.d.sync += d_valid.eq(0)
+        with m.Elif(f_next):
+            m.d.sync += [
+                d_valid.eq(1),
+                d_pc.eq(fetch_pc),
+                d_inst.eq(f_inst),
+                d_compr.eq(f_compr),
+                d_raw.eq(f_raw),
+                d_fault.eq(f_fault),
+                d_ecode.eq(ExceptionCause.E_INST_ADDR_MISALIGNED),
+                d_pred.eq(f_pred),
+                d_pred_pc.eq(f_pred_pc),
+                d_history.eq(f_history)
+            ]
+            with m.If(fetch_error):
+                m.d.sync += d_ecode.eq(ExceptionCause.E_INST_ACCESS_FAULT)
+        with m.Elif(advance_dx):
+            m.d.sync += d_valid.eq(0)
+
+        # ----------------------------------------------------------------------
+        # ID: the decoder and the register file latch the ID/EX values
+        m.d.comb += [
+            advance_dx.eq(d_valid & x_ready & ~redirect),
+            self._decoder.instruction_f.eq(d_inst),
+            self._decoder.enable.eq(advance_dx)
+        ]
+        # Keep reading the operands of the instruction in EX while it is stalled
+        with m.If(advance_dx):
+            m.d.comb += [
+                self._gprf_rp1.addr.eq(self._decoder.gpr_rs1),
+                self._gprf_rp2.addr.eq(self._decoder.gpr_rs2)
+            ]
+        with m.Else():
+            m.d.comb += [
+                self._gprf_rp1.addr.eq(self._decoder.gpr_rs1_q),
+                self._gprf_rp2.addr.eq(x_rs2)
+            ]
+
+        with m.If(m_flush):
+            m.d.sync += x_valid.eq(0)
+        with m.Elif(advance_dx):
+            m.d.sync += [
+                x_valid.eq(1),
+                x_pc.eq(d_pc),
+                x_inst.eq(d_inst),
+                x_compr.eq(d_compr),
+                x_raw.eq(d_raw),
+                x_fault.eq(d_fault),
+                x_ecode.eq(d_ecode),
+                x_rs2.eq(self._decoder.gpr_rs2),
+                x_pred.eq(d_pred),
+                x_pred_pc.eq(d_pred_pc),
+                x_history.eq(d_history)
+            ]
+        with m.Elif(x_fire):
+            m.d.sync += x_valid.eq(0)
+
+        # ----------------------------------------------------------------------
+        # EX: forwarding and hazards
+        def forward(rs, rf_data, data):
+            rs_valid = rs.any()
+            m_match  = m_valid & m_wr & (m_rd == rs) & rs_valid
+            w_match  = w_valid & w_wr & (w_rd == rs) & rs_valid
+            with m.If(m_match & ~m_late):
+                m.d.comb += data.eq(m_result)
+            with m.Elif(w_match):
+                m.d.comb += data.eq(w_result)
+            with m.Else():
+                m.d.comb += data.eq(rf_data)
+            return m_match & m_late
+
+        hazard_rs1 = forward(self._decoder.gpr_rs1_q, self._gprf_rp1.data, x_rs1_data)
+        hazard_rs2 = forward(x_rs2, self._gprf_rp2.data, x_rs2_data)
+        m.d.comb += x_hazard.eq(x_valid & (hazard_rs1 | hazard_rs2))
+
+        # ALU A
+        with m.If(self._decoder.inst_lui):
+            m.d.comb += alu_a.eq(0)
+        with m.Elif(self._decoder.inst_auipc | self._decoder.inst_jal | self._decoder.is_b):
+            m.d.comb += alu_a.eq(x_pc)
+        if self.enable_zba:
+            with m.Elif(self._decoder.inst_sh1add):
+                m.d.comb += alu_a.eq(x_rs1_data << 1)
+            with m.Elif(self._decoder.inst_sh2add):
+                m.d.comb += alu_a.eq(x_rs1_data << 2)
+            with m.Elif(self._decoder.inst_sh3add):
+                m.d.comb += alu_a.eq(x_rs1_data << 3)
+        with m.Else():
+            m.d.comb += alu_a.eq(x_rs1_data)
+
+        # ALU B
+        with m.If(self._decoder.inst_lui | self._decoder.inst_auipc | self._decoder.is_j | self._decoder.is_b | self._decoder.is_ld | self._decoder.is_st | self._decoder.is_imm):
+            m.d.comb += alu_b.eq(self._decoder.immediate)
+        with m.Elif(self._decoder.inst_sub):
+            m.d.comb += alu_b.eq(~x_rs2_data)
+        if self.enable_zbb:
+            with m.Elif(self._decoder.inst_andn | self._decoder.inst_orn | self._decoder.inst_xnor):
+                m.d.comb += alu_b.eq(~x_rs2_data)
+        if self.enable_rv32a:
+            with m.Elif(self._decoder.is_amo | self._decoder.is_lrsc):
+                m.d.comb += alu_b.eq(0)
+        with m.Else():
+            m.d.comb += alu_b.eq(x_rs2_data)
+
+        # CMP
+        with m.If(self._decoder.inst_slti | self._decoder.inst_sltiu):
+            m.d.comb += cmp_b.eq(self._decoder.immediate)
+        with m.Else():
+            m.d.comb += cmp_b.eq(x_rs2_data)
+
+        # ALU
+        m.d.comb += add_out.eq(alu_a + alu_b + self._decoder.inst_sub)
+
+        # logic
+        with m.If(self._decoder.inst_and | self._decoder.inst_andi | self._decoder.inst_andn):
+            m.d.comb += logic_out.eq(alu_a & alu_b)
+        with m.Elif(self._decoder.inst_or | self._decoder.inst_ori | self._decoder.inst_orn):
+            m.d.comb += logic_out.eq(alu_a | alu_b)
+        with m.Else():
+            m.d.comb += logic_out.eq(alu_a ^ alu_b)
+
+        # compare
+        m.d.comb += [
+            is_eq.eq(x_rs1_data == cmp_b),
+            is_lt.eq(x_rs1_data.as_signed() < cmp_b.as_signed()),
+            is_ltu.eq(x_rs1_data < cmp_b),
+            ltx_cmp_out.eq((is_lt & (self._decoder.inst_slt | self._decoder.inst_slti)) |
+                           (is_ltu & (self._decoder.inst_sltu | self._decoder.inst_sltiu)))
+        ]
+
+        # shift
+        with m.If(self._decoder.inst_sll | self._decoder.inst_slli):
+            m.d.comb += shift_out.eq(alu_a << alu_b[0:5])
+        with m.Elif(self._decoder.inst_srl | self._decoder.inst_srli):
+            m.d.comb += shift_out.eq(alu_a >> alu_b[0:5])
+        if self.enable_zbb:
+            with m.Elif(self._decoder.inst_rol):
+                m.d.comb += shift_out.eq((Cat(alu_a, alu_a) << alu_b[0:5])[32:])
+            with m.Elif(self._decoder.inst_ror | self._decoder.inst_rori):
+                m.d.comb += shift_out.eq((Cat(alu_a, alu_a) >> alu_b[0:5])[:32])
+        with m.Else():
+            m.d.comb += shift_out.eq(alu_a.as_signed() >> alu_b[0:5])
+
+        # JMP/Branch
+        beq  = is_eq & self._decoder.inst_beq
+        bne  = ~is_eq & self._decoder.inst_bne
+        blt  = is_lt & self._decoder.inst_blt
+        bge  = ~is_lt & self._decoder.inst_bge
+        bltu = is_ltu & self._decoder.inst_bltu
+        bgeu = ~is_ltu & self._decoder.inst_bgeu
+        m.d.comb += [
+            b_taken.eq(beq | bne | blt | bge | bltu | bgeu),
+            x_pc4.eq(x_pc + Mux(x_compr, 2, 4))
+        ]
+        if not self.enable_rv32c:
+            # check for misalignment. With RV32C, the targets are 16-bit aligned
+            m.d.comb += jb_error.eq((self._decoder.is_j | b_taken) & add_out[1])
+
+        # Check the prediction made in IF
+        m.d.comb += [
+            x_taken.eq(self._decoder.is_j | b_taken),
+            x_target.eq(Cat(0, add_out[1:])),
+            x_next_pc.eq(Mux(x_taken, x_target, x_pc4)),
+            x_mispred.eq(Mux(x_pred, x_pred_pc, x_pc4) != x_next_pc)
+        ]
+
+        # Multiplier/divider: the request is kept until the unit answers. If the instruction is
+        # flushed while the unit is running, wait for the (stale) answer before starting a new one.
+        m.d.comb += [
+            md_valid.eq(x_valid & (self._decoder.is_mul | self._decoder.is_div) & ~x_fault & ~x_hazard & ~md_done & ~md_stale),
+            md_ready.eq(md_done | (md_valid & (mult_ack | div_ack))),
+            md_result.eq(Mux(md_done, md_result_q, Mux(self._decoder.is_mul, mult_result, div_result)))
+        ]
+        with m.If(mult_ack | div_ack):
+            m.d.sync += md_busy.eq(0)
+        with m.Elif(md_valid):
+            m.d.sync += md_busy.eq(1)
+
+        with m.If(mult_ack | div_ack):
+            m.d.sync += md_stale.eq(0)
+        with m.Elif(m_flush & (md_busy | md_valid)):
+            m.d.sync += md_stale.eq(1)
+
+        with m.If(advance_dx | m_flush):
+            m.d.sync += md_done.eq(0)
+        with m.Elif(md_valid & (mult_ack | div_ack)):
+            m.d.sync += [
+                md_done.eq(1),
+                md_result_q.eq(md_result)
+            ]
+
+        # Result
+        with m.If(self._decoder.is_j):
+            m.d.comb += x_result.eq(x_pc4)
+        with m.Elif(self._decoder.is_logic):
+            m.d.comb += x_result.eq(logic_out)
+        with m.Elif(self._decoder.is_cmp):
+            m.d.comb += x_result.eq(ltx_cmp_out)
+        with m.Elif(self._decoder.is_shift):
+            m.d.comb += x_result.eq(shift_out)
+        with m.Elif(self._decoder.is_mul | self._decoder.is_div):
+            m.d.comb += x_result.eq(md_result)
+        if self.enable_zbb:
+            with m.Elif(self._decoder.is_bitmanip):
+                m.d.comb += x_result.eq(self._bitmanip.result)
+        with m.Else():
+            m.d.comb += x_result.eq(add_out)
+
+        m.d.comb += x_wr.eq(self._decoder.gpr_rd.any() &
+                            (self._decoder.is_j | self._decoder.is_ld | self._decoder.is_csr | self._decoder.is_logic |
+                             self._decoder.is_cmp | self._decoder.is_shift | self._decoder.is_add | self._decoder.is_mul |
+                             self._decoder.is_div | self._decoder.is_amo | self._decoder.is_lrsc | self._decoder.is_bitmanip |
+                             (self._decoder.is_custom & self._decoder.funct3[2])))
+
+        # Exceptions detected in IF/EX. These are taken in MEM.
+        known = (self._decoder.is_shift | self._decoder.use_alu | self._decoder.is_mul | self._decoder.is_div | self._decoder.is_bitmanip |
+                 self._decoder.inst_fence | self._decoder.inst_fencei | self._decoder.inst_wfi |
+                 self._decoder.is_ld | self._decoder.is_st | self._decoder.is_lrsc | self._decoder.is_amo | self._decoder.is_csr |
+                 self._decoder.is_custom)
+        # By default, the instruction as fetched: mtval of an illegal instruction, here or in MEM
+        m.d.comb += x_edata.eq(Mux(x_compr, x_raw, x_inst))
+        with m.If(x_fault):
+            m.d.comb += [
+                x_exception.eq(1),
+                x_ecause.eq(x_ecode),
+                x_edata.eq(x_pc)
+            ]
+        with m.Elif(~known):
+            m.d.comb += [
+                x_exception.eq(~self._decoder.inst_mret),
+                x_mret.eq(self._decoder.inst_mret),
+                x_ecause.eq(ExceptionCause.E_ILLEGAL_INST)
+            ]
+            with m.If(self._decoder.inst_xcall):
+                m.d.comb += x_ecause.eq(ExceptionCause.E_ECALL_FROM_M)  # check priviledge mode...
+            with m.Elif(self._decoder.inst_xbreak):
+                m.d.comb += [
+                    x_edata.eq(x_pc),
+                    x_ecause.eq(ExceptionCause.E_BREAKPOINT)
+                ]
+        with m.Elif(jb_error):
+            m.d.comb += [
+                x_exception.eq(1),
+                x_ecause.eq(ExceptionCause.E_INST_ADDR_MISALIGNED),
+                x_edata.eq(Cat(0, add_out[1:]))
+            ]
+
+        # Stall/advance
+        md_wait = (self._decoder.is_mul | self._decoder.is_div) & ~x_fault & ~md_ready
+        m.d.comb += [
+            x_stall.eq(x_hazard | md_wait),
+            x_fire.eq(x_valid & ~x_stall & m_ready & ~m_flush),
+            x_ready.eq(~x_valid | x_fire),
+            x_redirect.eq(x_fire & ~x_exception & ~x_mret & x_mispred)
+        ]
+
+        # EX/MEM latch
+        with m.If(x_fire):
+            m.d.sync += [
+                m_valid.eq(1),
+                m_pc.eq(x_pc),
+                m_inst.eq(x_inst),
+                m_compr.eq(x_compr),
+                m_result.eq(x_result),
+                m_addr.eq(add_out),
+                m_rs1_data.eq(x_rs1_data),
+                m_rs2_data.eq(x_rs2_data),
+                m_wr.eq(x_wr),
+                m_late.eq(self._decoder.is_ld | self._decoder.is_csr | self._decoder.is_amo | self._decoder.is_lrsc |
+                          self._decoder.is_custom),
+                m_is_ld.eq(self._decoder.is_ld),
+                m_is_st.eq(self._decoder.is_st),
+                m_is_lr.eq(self._decoder.inst_lr),
+                m_is_sc.eq(self._decoder.inst_sc),
+                m_is_amo.eq(self._decoder.is_amo),
+                m_is_csr.eq(self._decoder.is_csr),
+                m_is_custom.eq(self._decoder.is_custom),
+                m_csr_we.eq(self._decoder.csr_we),
+                m_fence.eq(self._decoder.inst_fence | self._decoder.inst_fencei),
+                m_fencei.eq(self._decoder.inst_fencei),
+                m_exception.eq(x_exception),
+                m_mret.eq(x_mret),
+                m_ecode.eq(x_ecause),
+                m_edata.eq(x_edata),
+                m_started.eq(0)
+            ]
+            with m.If(self._decoder.funct3[2]):
+                m.d.sync += m_csr_src.eq(self._decoder.gpr_rs1_q)
+            with m.Else():
+                m.d.sync += m_csr_src.eq(x_rs1_data)
+        with m.Elif(m_done | m_trap):
+            m.d.sync += m_valid.eq(0)
+
+        # ----------------------------------------------------------------------
+        # MEM
+        m.d.comb += [
+            m_funct3.eq(m_inst[12:15]),
+            m_funct5.eq(m_inst[27:32]),
+            m_rd.eq(m_inst[7:12]),
+            m_bus.eq(m_is_ld | m_is_st | m_is_lr | m_is_sc | m_is_amo),
+            m_interrupt.eq(m_valid & ~m_started & self._exceptunit.m_interrupt),
+            m_pretrap.eq(m_valid & (m_interrupt | m_exception | m_mret | m_trigger)),
+            m_req.eq(m_valid & m_bus & ~m_pretrap)
+        ]
+
+        with m.If(m_owns & ~m_bus_done):
+            m.d.sync += m_started.eq(1)
+        with m.If(csr_valid & ~self._csr.port.ready):
+            m.d.sync += m_started.eq(1)
+
+        # Atomic Memory Operations
+        if self.enable_rv32a:
+            amo_rdata  = Signal(32)
+            amo_wdata  = Signal(32)
+            amo_strobe = Signal()
+            amo_done   = Signal()
+            amo_write  = Signal()
+            amo_active = m_owns & m_is_amo
+
+            if self.enable_near_amo:
+                # single locked write: the AMO unit next to the memory returns the old value
+                m.d.comb += [
+                    self.amo_op.eq(m_funct5),
+                    amo_rdata.eq(self._lsu.load_data),
+                    amo_wdata.eq(m_rs2_data),
+                    amo_strobe.eq(1),
+                    amo_write.eq(1),
+                    amo_done.eq(amo_active & self._lsu.ready)
+                ]
+            else:
+                with m.FSM(name='amo'):
+                    with m.State('load'):
+                        m.d.comb += amo_strobe.eq(1)
+                        with m.If(amo_active & self._lsu.ready):
+                            m.d.sync += amo_rdata.eq(self._lsu.load_data)
+                            m.next = 'modify'
+                    with m.State('modify'):
+                        m.d.comb += amo_strobe.eq(0)
+
+                        with m.Switch(m_funct5):
+                            with m.Case(Funct5.AMOADD):
+                                m.d.sync += amo_wdata.eq(amo_rdata + m_rs2_data)
+                            with m.Case(Funct5.AMOAND):
+                                m.d.sync += amo_wdata.eq(amo_rdata & m_rs2_data)
+                            with m.Case(Funct5.AMOMAX):
+                                m.d.sync += amo_wdata.eq(Mux(amo_rdata.as_signed() > m_rs2_data.as_signed(), amo_rdata, m_rs2_data))
+                            with m.Case(Funct5.AMOMAXU):
+                                m.d.sync += amo_wdata.eq(Mux(amo_rdata > m_rs2_data, amo_rdata, m_rs2_data))
+                            with m.Case(Funct5.AMOMIN):
+                                m.d.sync += amo_wdata.eq(Mux(amo_rdata.as_signed() > m_rs2_data.as_signed(), m_rs2_data, amo_rdata))
+                            with m.Case(Funct5.AMOMINU):
+                                m.d.sync += amo_wdata.eq(Mux(amo_rdata > m_rs2_data, m_rs2_data, amo_rdata))
+                            with m.Case(Funct5.AMOSWAP):
+                                m.d.sync += amo_wdata.eq(m_rs2_data)
+                            with m.Case(Funct5.AMOXOR):
+                                m.d.sync += amo_wdata.eq(amo_rdata ^ m_rs2_data)
+                            with m.Case(Funct5.AMOOR):
+                                m.d.sync += amo_wdata.eq(amo_rdata | m_rs2_data)
+
+                        m.next = 'store'
+                    with m.State('store'):
+                        m.d.comb += [
+                            amo_strobe.eq(1),
+                            amo_write.eq(1)
+                        ]
+                        with m.If(amo_active & self._lsu.ready):
+                            m.d.comb += amo_done.eq(1)
+                            m.next = 'load'
+                        with m.Elif(amo_active & self._lsu.error):
+                            m.next = 'load'
+
+            with m.If(amo_active):
+                m.d.comb += [
+                    self._lsu.store_data.eq(amo_wdata),
+                    self._lsu.write.eq(amo_write),
+                    self._lsu.strobe.eq(amo_strobe),
+                    self._lsu.atomic.eq(1)
+                ]
+            m.d.comb += m_bus_done.eq(m_owns & Mux(m_is_amo, amo_done, self._lsu.ready))
+
+            # SC failures
+            with m.If(self._mscfail.update):
+                m.d.sync += self._mscfail.read.eq(self._mscfail.write)
+            with m.Elif(m_done & m_is_sc & self._lsu.load_data[0]):
+                m.d.sync += self._mscfail.read.eq(self._mscfail.read + 1)
+        else:
+            m.d.comb += m_bus_done.eq(m_owns & self._lsu.ready)
+        m.d.comb += m_bus_fault.eq(m_owns & (self._lsu.error | self._lsu.misaligned))
+
+        # Interconnect wait cycles
+        if self.enable_extra_csr:
+            with m.If(self._mbuswait.update):
+                m.d.sync += self._mbuswait.read.eq(self._mbuswait.write)
+            with m.Elif(self.bus_wait):
+                m.d.sync += self._mbuswait.read.eq(self._mbuswait.read + 1)
+        m_drained = 1
+        if self.enable_sbuffer:
+            m_drained = self._sbuffer.empty
+            m.d.comb += self._sbuffer.bypass.eq(m_owns & (m_is_amo | m_is_lr | m_is_sc))
+        if self.enable_dcache:
+            m.d.comb += [
+                self._dcache.bypass.eq(m_owns & (m_is_amo | m_is_lr | m_is_sc)),
+                self._dcache.flush.eq(m_valid & m_fence & ~m_pretrap & m_drained)
+            ]
+
+        # CSR
+        with m.If(m_funct3[:2] == 0b01):  # write
+            m.d.comb += csr_wdata.eq(m_csr_src)
+        with m.Elif(m_funct3[:2] == 0b10):  # set
+            m.d.comb += csr_wdata.eq(self._csr.port.dat_r | m_csr_src)
+        with m.Else():  # clear
+            m.d.comb += csr_wdata.eq(self._csr.port.dat_r & ~m_csr_src)
+
+        m.d.comb += [
+            csr_valid.eq(m_valid & m_is_csr & ~m_pretrap),
+            csr_done.eq(csr_valid & self._csr.port.ready & ~self._csr.invalid),
+            csr_fault.eq(csr_valid & self._csr.port.ready & self._csr.invalid),
+            self._csr.port.addr.eq(m_inst[20:32]),
+            self._csr.port.dat_w.eq(csr_wdata),
+            self._csr.port.we.eq(m_csr_we),
+            self._csr.port.valid.eq(csr_valid)
+        ]
+
+        # Accelerator: the command is sent once the instruction cannot be interrupted. With xd,
+        # wait for the response (the instruction is started: interrupts are taken after it)
+        if self.enable_accel:
+            m.d.comb += [
+                cus_valid.eq(m_valid & m_is_custom & ~m_pretrap),
+                cus_sent.eq(self.accelerator.cmd.valid & self.accelerator.cmd.ready),
+                cus_done.eq(Mux(m_inst[14], self.accelerator.resp.valid & self.accelerator.resp.ready, cus_sent)),
+
+                self.accelerator.cmd.valid.eq(cus_valid & ~m_started),
+                self.accelerator.cmd.opcode.eq(m_inst[5:7]),
+                self.accelerator.cmd.funct7.eq(m_inst[25:32]),
+                self.accelerator.cmd.xd.eq(m_inst[14]),
+                self.accelerator.cmd.xs1.eq(m_inst[13]),
+                self.accelerator.cmd.xs2.eq(m_inst[12]),
+                self.accelerator.cmd.rd.eq(m_rd),
+                self.accelerator.cmd.rs1.eq(m_rs1_data),
+                self.accelerator.cmd.rs2.eq(m_rs2_data),
+                self.accelerator.resp.ready.eq(cus_valid & m_started)
+            ]
+            with m.If(cus_sent & m_inst[14]):
+                m.d.sync += m_started.eq(1)
+
+        # Done/trap
+        with m.If(m_bus):
+            m.d.comb += m_done.eq(m_valid & ~m_pretrap & m_bus_done)
+        with m.Elif(m_is_csr):
+            m.d.comb += m_done.eq(csr_done)
+        with m.Elif(m_is_custom):
+            m.d.comb += m_done.eq(cus_done)
+        if self.enable_dcache:
+            # write the pending stores, and write back the D-cache before continuing
+            with m.Elif(m_fence):
+                m.d.comb += m_done.eq(m_valid & ~m_pretrap & m_drained & self._dcache.flush_ready)
+        elif self.enable_sbuffer:
+            # write the pending stores before continuing
+            with m.Elif(m_fence):
+                m.d.comb += m_done.eq(m_valid & ~m_pretrap & m_drained)
+        with m.Else():
+            m.d.comb += m_done.eq(m_valid & ~m_pretrap)
+
+        m.d.comb += [
+            m_trap.eq(m_pretrap | m_bus_fault | csr_fault),
+            m_flush.eq(m_trap | (m_done & m_fencei)),
+            m_ready.eq(~m_valid | m_done),
+            self._exceptunit.m_pc.eq(m_pc)
+        ]
+
+        with m.If(m_trap):
+            m.d.comb += [
+                self._exceptunit.enable.eq(1),
+                m_target.eq(self._exceptunit.trap_address)
+            ]
+            with m.If(m_interrupt):
+                m.d.comb += self._exceptunit.m_exception.eq(0)  # the exception unit takes the pending interrupt
+            with m.Elif(m_exception):
+                m.d.comb += [
+                    self._exceptunit.m_exception.eq(1),
+                    self._exceptunit.ecode.eq(m_ecode),
+                    self._exceptunit.edata.eq(m_edata)
+                ]
+            with m.Elif(m_mret):
+                m.d.comb += [
+                    self._exceptunit.m_mret.eq(1),
+                    m_target.eq(self._exceptunit.mepc.read)
+                ]
+            with m.Elif(m_trigger):
+                m.d.comb += [
+                    self._exceptunit.m_exception.eq(1),
+                    self._exceptunit.ecode.eq(ExceptionCause.E_BREAKPOINT),
+                    self._exceptunit.edata.eq(m_pc)
+                ]
+            with m.Elif(m_bus_fault):
+                is_ld = m_is_ld | m_is_lr
+                is_st = m_is_st | m_is_sc | m_is_amo
+                m.d.comb += [
+                    self._exceptunit.m_exception.eq(1),
+                    self._exceptunit.edata.eq(m_addr)
+                ]
+                with m.If(is_ld & self._lsu.error):
+                    m.d.comb += self._exceptunit.ecode.eq(ExceptionCause.E_LOAD_ACCESS_FAULT)
+                with m.If(is_ld & self._lsu.misaligned):
+                    m.d.comb += self._exceptunit.ecode.eq(ExceptionCause.E_LOAD_ADDR_MISALIGNED)
+                with m.If(is_st & self._lsu.error):
+                    m.d.comb += self._exceptunit.ecode.eq(ExceptionCause.E_STORE_AMO_ACCESS_FAULT)
+                with m.If(is_st & self._lsu.misaligned):
+                    m.d.comb += self._exceptunit.ecode.eq(ExceptionCause.E_STORE_AMO_ADDR_MISALIGNED)
+            with m.Else():
+                m.d.comb += [
+                    self._exceptunit.m_exception.eq(1),
+                    self._exceptunit.ecode.eq(ExceptionCause.E_ILLEGAL_INST),
+                    self._exceptunit.edata.eq(m_edata)
+                ]
+        with m.Else():
+            m.d.comb += m_target.eq(m_pc + Mux(m_compr, 2, 4))  # fence.i: fetch again the next instructions
+
+        # MEM/WB latch
+        m.d.sync += w_valid.eq(m_done)
+        with m.If(m_done):
+            m.d.sync += [
+                w_wr.eq(m_wr),
+                w_rd.eq(m_rd)
+            ]
+            with m.If(m_is_ld | m_is_lr | m_is_sc):
+                m.d.sync += w_result.eq(self._lsu.load_data)
+            with m.Elif(m_is_csr):
+                m.d.sync += w_result.eq(self._csr.port.dat_r)
+            if self.enable_accel:
+                with m.Elif(m_is_custom):
+                    m.d.sync += w_result.eq(self.accelerator.resp.data)
+            if self.enable_rv32a:
+                with m.Elif(m_is_amo):
+                    m.d.sync += w_result.eq(amo_rdata)
+            with m.Else():
+                m.d.sync += w_result.eq(m_result)
+
+        # ----------------------------------------------------------------------
+        # WB
+        m.d.comb += [
+            self._gprf_wp.addr.eq(w_rd),
+            self._gprf_wp.data.eq(w_result),
+            self._gprf_wp.en.eq(w_valid & w_wr)
+        ]
+        if self.enable_extra_csr:
+            m.d.comb += self._exceptunit.w_retire.eq(w_valid)
+
+        # ----------------------------------------------------------------------
+        # Performance counters
+        if self.hpm_counters:
+            m.submodules.hpm = self._hpm
+            events           = self._hpm.events
+            m_wait           = m_valid & ~m_pretrap & ~m_done & ~m_bus_fault
+            m.d.comb += [
+                self._hpm.inhibit.eq(self._exceptunit.mcountinhibit.read.hpm),
+                events[HPMEvent.FETCH_WAIT].eq(~d_valid),
+                events[HPMEvent.LOAD_WAIT].eq(m_wait & (m_is_ld | m_is_lr | m_is_amo)),
+                events[HPMEvent.STORE_WAIT].eq(m_wait & (m_is_st | m_is_sc)),
+                events[HPMEvent.MULDIV_BUSY].eq(x_valid & md_wait & ~x_hazard),
+                events[HPMEvent.BRANCH_TAKEN].eq(x_fire & ~x_exception & x_taken),
+                events[HPMEvent.EXCEPTION].eq(self._exceptunit.enable & self._exceptunit.m_exception),
+                events[HPMEvent.INTERRUPT].eq(self._exceptunit.enable & self._exceptunit.m_interrupt & ~self._exceptunit.m_exception),
+                events[HPMEvent.BUS_WAIT].eq(self.bus_wait),
+                events[HPMEvent.HAZARD_STALL].eq(x_valid & x_hazard),
+                events[HPMEvent.REDIRECT].eq(x_redirect)
+            ]
+
+        return m
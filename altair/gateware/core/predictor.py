@@ -0,0 +1,209 @@
+from amaranth import Cat
+from amaranth import Mux
+from amaranth import Array
+from amaranth import Const
+from amaranth import Memory
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Elaboratable
+from amaranth.utils import log2_int
+from amaranth.build import Platform
+from altair.gateware.core.csr import AutoCSR
+from altair.gateware.core.csr import CSRFile
+from altair.gateware.core.isa import CSRIndex
+from enum import IntEnum
+
+
+class BranchKind(IntEnum):
+    BRANCH = 0
+    JUMP   = 1
+    CALL   = 2
+    RETURN = 3
+
+
+class BranchPredictor(Elaboratable, AutoCSR):
+    """Branch prediction for the fetch stage.
+
+    - BTB: direct-mapped, indexed by the PC. Each entry keeps the tag, target and kind
+      (branch, jump, call, return) of a control transfer instruction.
+    - BHT: 2-bit saturating counters, for the direction of conditional branches. With
+      `history` > 0, the index is the PC xor the global history (gshare).
+    - RAS: circular stack of return addresses. The target of a return is the top of the stack.
+
+    The prediction for the address being fetched (`f_pc`) is combinational. The predictor is
+    updated when the instruction is resolved in EX (`x_*`), so the history and the RAS are not
+    speculative, and the pipeline does not need to repair them after a mispredict. The history
+    used for the prediction must be carried to EX (`f_history` -> `x_history`).
+
+    With RV32C, the instructions (and the targets) are 16-bit aligned: the PC bit 1 is part
+    of the index and the tag.
+
+    The number of correct and wrong predictions are counted in MBPHIT/MBPMISS.
+    """
+    def __init__(self,
+                 csrf: CSRFile,
+                 btb_entries: int = 32,
+                 bht_entries: int = 256,
+                 history: int = 0,
+                 ras_depth: int = 4,
+                 enable_rv32c: bool = False
+                 ) -> None:
+        for name, value in (('BTB entries', btb_entries), ('BHT entries', bht_entries), ('RAS depth', ras_depth)):
+            if value < 2 or (value & (value - 1)):
+                raise ValueError(f'Invalid number of {name}: {value}. Must be a power of 2, greater than 1')
+        if history not in range(0, log2_int(bht_entries) + 1):
+            raise ValueError(f'Invalid branch history length: {history}. Valid options: 0 to {log2_int(bht_entries)}')
+        # config
+        self.btb_entries = btb_entries
+        self.bht_entries = bht_entries
+        self.history     = history
+        self.ras_depth   = ras_depth
+        self._lsb        = 1 if enable_rv32c else 2  # first PC bit used
+        # registers
+        self.mbphit  = csrf.add_register('mbphit', CSRIndex.MBPHIT)
+        self.mbpmiss = csrf.add_register('mbpmiss', CSRIndex.MBPMISS)
+        # IO: prediction (IF)
+        self.f_pc        = Signal(32)                 # input
+        self.f_taken     = Signal()                   # output
+        self.f_target    = Signal(32)                 # output
+        self.f_history   = Signal(max(history, 1))    # output
+        # IO: update (EX)
+        self.x_valid     = Signal()                   # input
+        self.x_pc        = Signal(32)                 # input
+        self.x_history   = Signal(max(history, 1))    # input
+        self.x_branch    = Signal()                   # input
+        self.x_jump      = Signal()                   # input
+        self.x_call      = Signal()                   # input
+        self.x_return    = Signal()                   # input
+        self.x_taken     = Signal()                   # input
+        self.x_target    = Signal(32)                 # input
+        self.x_return_pc = Signal(32)                 # input: pc + 4 (+ 2, compressed)
+        self.x_hit       = Signal()                   # input: the prediction was correct
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        btb_bits = log2_int(self.btb_entries)
+        bht_bits = log2_int(self.bht_entries)
+        ras_bits = log2_int(self.ras_depth)
+        lsb      = self._lsb
+        tag_bits = 32 - lsb - btb_bits
+
+        # ----------------------------------------------------------------------
+        # Read/write behavior for all registers in this module
+        for register in self.get_csrs():
+            with m.If(register.update):
+                m.d.sync += register.read.eq(register.write)
+
+        # ----------------------------------------------------------------------
+        # storage
+        btb_valid = Signal(self.btb_entries)
+        btb_tag   = Memory(width=tag_bits, depth=self.btb_entries)
+        btb_data  = Memory(width=34 - lsb, depth=self.btb_entries)  # target[lsb:32] + kind
+        bht       = Memory(width=2, depth=self.bht_entries, init=[0b01] * self.bht_entries)
+        ras       = Array(Signal(32, name=f'ras{n}') for n in range(self.ras_depth))
+        ras_ptr   = Signal(ras_bits)  # top of the stack
+        ghr       = Signal(max(self.history, 1))
+
+        m.submodules.btb_tag_rp  = btb_tag_rp  = btb_tag.read_port(domain='comb')
+        m.submodules.btb_tag_wp  = btb_tag_wp  = btb_tag.write_port()
+        m.submodules.btb_data_rp = btb_data_rp = btb_data.read_port(domain='comb')
+        m.submodules.btb_data_wp = btb_data_wp = btb_data.write_port()
+        m.submodules.bht_f_rp    = bht_f_rp    = bht.read_port(domain='comb')
+        m.submodules.bht_x_rp    = bht_x_rp    = bht.read_port(domain='comb')
+        m.submodules.bht_wp      = bht_wp      = bht.write_port()
+
+        def bht_index(pc, history):
+            if self.history:
+                return pc[lsb:lsb + bht_bits] ^ Cat(history, Const(0, bht_bits - self.history))
+            return pc[lsb:lsb + bht_bits]
+
+        # ----------------------------------------------------------------------
+        # Prediction
+        f_index = self.f_pc[lsb:lsb + btb_bits]
+        f_hit   = Signal()
+        f_kind  = Signal(2)
+        m.d.comb += [
+            btb_tag_rp.addr.eq(f_index),
+            btb_data_rp.addr.eq(f_index),
+            bht_f_rp.addr.eq(bht_index(self.f_pc, ghr)),
+            f_hit.eq(btb_valid.bit_select(f_index, 1) & (btb_tag_rp.data == self.f_pc[lsb + btb_bits:])),
+            f_kind.eq(btb_data_rp.data[:2]),
+            self.f_history.eq(ghr)
+        ]
+        with m.If(f_kind == BranchKind.RETURN):
+            m.d.comb += self.f_target.eq(ras[ras_ptr])
+        with m.Else():
+            m.d.comb += self.f_target.eq(Cat(Const(0, lsb), btb_data_rp.data[2:]))
+        with m.If(f_kind == BranchKind.BRANCH):
+            m.d.comb += self.f_taken.eq(f_hit & bht_f_rp.data[1])
+        with m.Else():
+            m.d.comb += self.f_taken.eq(f_hit)
+
+        # ----------------------------------------------------------------------
+        # Update
+        x_index   = self.x_pc[lsb:lsb + btb_bits]
+        x_kind    = Signal(2)
+        x_counter = bht_x_rp.data
+        x_control = self.x_branch | self.x_jump
+
+        with m.If(self.x_return):
+            m.d.comb += x_kind.eq(BranchKind.RETURN)
+        with m.Elif(self.x_call):
+            m.d.comb += x_kind.eq(BranchKind.CALL)
+        with m.Elif(self.x_jump):
+            m.d.comb += x_kind.eq(BranchKind.JUMP)
+        with m.Else():
+            m.d.comb += x_kind.eq(BranchKind.BRANCH)
+
+        # BTB: allocate on taken branches and jumps. Remove entries hit by other instructions
+        m.d.comb += [
+            btb_tag_wp.addr.eq(x_index),
+            btb_tag_wp.data.eq(self.x_pc[lsb + btb_bits:]),
+            btb_tag_wp.en.eq(self.x_valid & self.x_taken),
+            btb_data_wp.addr.eq(x_index),
+            btb_data_wp.data.eq(Cat(x_kind, self.x_target[lsb:])),
+            btb_data_wp.en.eq(self.x_valid & self.x_taken)
+        ]
+        with m.If(self.x_valid & self.x_taken):
+            m.d.sync += btb_valid.bit_select(x_index, 1).eq(1)
+        with m.Elif(self.x_valid & ~x_control & ~self.x_hit):
+            m.d.sync += btb_valid.bit_select(x_index, 1).eq(0)
+
+        # BHT/history: conditional branches only
+        m.d.comb += [
+            bht_x_rp.addr.eq(bht_index(self.x_pc, self.x_history)),
+            bht_wp.addr.eq(bht_x_rp.addr),
+            bht_wp.en.eq(self.x_valid & self.x_branch)
+        ]
+        with m.If(self.x_taken):
+            m.d.comb += bht_wp.data.eq(Mux(x_counter == 0b11, x_counter, x_counter + 1))
+        with m.Else():
+            m.d.comb += bht_wp.data.eq(Mux(x_counter == 0b00, x_counter, x_counter - 1))
+        if self.history:
+            with m.If(self.x_valid & self.x_branch):
+                m.d.sync += ghr.eq(Cat(self.x_taken, ghr[:-1]))
+
+        # RAS: a return pops, a call pushes (both for a co-routine swap)
+        ras_top  = Signal(ras_bits)
+        ras_push = Signal(ras_bits)
+        m.d.comb += [
+            ras_top.eq(Mux(self.x_return, ras_ptr - 1, ras_ptr)),
+            ras_push.eq(ras_top + 1)
+        ]
+        with m.If(self.x_valid & self.x_call):
+            m.d.sync += [
+                ras[ras_push].eq(self.x_return_pc),
+                ras_ptr.eq(ras_push)
+            ]
+        with m.Elif(self.x_valid & self.x_return):
+            m.d.sync += ras_ptr.eq(ras_top)
+
+        # ----------------------------------------------------------------------
+        # counters
+        with m.If(~self.mbphit.update & self.x_valid & x_control & self.x_hit):
+            m.d.sync += self.mbphit.read.eq(self.mbphit.read + 1)
+        with m.If(~self.mbpmiss.update & self.x_valid & ~self.x_hit):
+            m.d.sync += self.mbpmiss.read.eq(self.mbpmiss.read + 1)
+
+        return m
@@ -0,0 +1,195 @@
+from amaranth import Mux
+from amaranth import Array
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Elaboratable
+from amaranth.build import Platform
+from amaranth_soc.wishbone.bus import Interface
+from amaranth_soc.wishbone.bus import CycleType
+from amaranth_soc.wishbone.bus import BurstTypeExt
+from typing import List
+
+
+class PrefetchBuffer(Elaboratable):
+    """Sequential instruction prefetch queue.
+
+    Keeps fetching the next sequential addresses, while there is space in the queue. The core
+    requests instructions using the same interface of the I-cache (address/valid -> data/ready).
+
+    The queue is flushed, and fetching restarts at the requested address, when the request
+    does not match the head of the queue (taken branch, jump, trap, mret), or with invalidate
+    (fence.i). A flush in the first cycle of a burst beat drops the beat (the slave has not
+    sampled it), and the new access starts in the next cycle. Otherwise, the response for the
+    flushed request is dropped.
+
+    Bus errors are kept in the queue, and reported only if the core requests that address.
+    Sequential accesses are done using an incrementing burst (classic cycles if the bus does
+    not have CTI), while there is space in the queue. The bus is released when the queue is
+    full, or after the current beat with `release` (the data port waits for the bus).
+    """
+    def __init__(self, depth: int = 2, features: List[str] = ['err']) -> None:
+        if depth not in range(2, 5):
+            raise ValueError(f'Invalid prefetch buffer depth: {depth}. Valid options: 2 to 4')
+        # config
+        self.depth = depth
+        # IO
+        self.bus        = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='prefetch')
+        self.address    = Signal(32)  # input
+        self.valid      = Signal()    # input
+        self.invalidate = Signal()    # input
+        self.release    = Signal()    # input: end the burst, and do not start a new one
+        self.data       = Signal(32)  # output
+        self.ready      = Signal()    # output
+        self.error      = Signal()    # output
+        self.misaligned = Signal()    # output
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        buf_data   = Array(Signal(32, name=f'buf_data{n}') for n in range(self.depth))
+        buf_error  = Array(Signal(name=f'buf_error{n}') for n in range(self.depth))
+        rd_ptr     = Signal(range(self.depth))
+        wr_ptr     = Signal(range(self.depth))
+        count      = Signal(range(self.depth + 1))
+        head_pc    = Signal(32)  # address of the first entry
+        fetch_pc   = Signal(32)  # address of the next access
+        bus_pc     = Signal(32)  # address of the current access
+        busy       = Signal()
+        stale      = Signal()
+        stop       = Signal()
+        bus_done   = Signal()
+        restart    = Signal()
+        restart_pc = Signal(32)
+        start      = Signal()
+        start_pc   = Signal(32)
+        idle       = Signal()  # bus released after a burst
+        fresh      = Signal()  # first cycle of the next beat of a burst
+        drop       = Signal()  # flush: drop the beat
+        more       = Signal()  # there is space for the next beat
+        request    = Signal()
+        direct     = Signal()
+        push       = Signal()
+        pop        = Signal()
+
+        m.d.comb += [
+            request.eq(self.valid & ~self.misaligned),
+            restart.eq((request & (self.address != head_pc)) | self.invalidate),
+            restart_pc.eq(head_pc),
+            self.misaligned.eq(self.valid & self.address[:2].any()),
+            drop.eq(restart & busy & fresh),
+            bus_done.eq(busy & ~drop & self.bus.ack)
+        ]
+        if hasattr(self.bus, 'err'):
+            m.d.comb += bus_done.eq(busy & ~drop & (self.bus.ack | self.bus.err))
+        with m.If(request):
+            m.d.comb += restart_pc.eq(self.address)
+
+        # ----------------------------------------------------------------------
+        # Core side. An empty queue forwards the bus response
+        with m.If(request & ~restart):
+            with m.If(count != 0):
+                m.d.comb += [
+                    self.data.eq(buf_data[rd_ptr]),
+                    self.ready.eq(~buf_error[rd_ptr]),
+                    self.error.eq(buf_error[rd_ptr]),
+                    pop.eq(~buf_error[rd_ptr])
+                ]
+            with m.Else():
+                m.d.comb += [
+                    direct.eq(busy & self.bus.ack & ~stale),
+                    self.data.eq(self.bus.dat_r),
+                    self.ready.eq(direct)
+                ]
+        m.d.comb += push.eq(bus_done & ~stale & ~restart & ~direct)
+
+        # ----------------------------------------------------------------------
+        # Bus side. A flush ends the burst after the current beat
+        with m.If(restart):
+            m.d.comb += more.eq(~busy)
+        with m.Else():
+            m.d.comb += more.eq(~stale & ~stop & ~self.release & (count < self.depth - 1))
+        m.d.comb += [
+            start.eq(~busy & ~idle & (restart | (~stop & ~self.release & (count < self.depth)))),
+            start_pc.eq(Mux(restart, restart_pc, fetch_pc)),
+            self.bus.adr.eq(Mux(busy, bus_pc[2:], start_pc[2:])),
+            self.bus.sel.eq(0b1111),
+            self.bus.we.eq(0),
+            self.bus.cyc.eq((busy & ~drop) | start),
+            self.bus.stb.eq((busy & ~drop) | start)
+        ]
+        if hasattr(self.bus, 'cti'):
+            with m.If(more):
+                m.d.comb += self.bus.cti.eq(CycleType.INCR_BURST)
+            with m.Else():
+                m.d.comb += self.bus.cti.eq(CycleType.END_OF_BURST)
+        if hasattr(self.bus, 'bte'):
+            m.d.comb += self.bus.bte.eq(BurstTypeExt.LINEAR)
+
+        m.d.sync += [
+            idle.eq(0),
+            fresh.eq(0)
+        ]
+        with m.If(bus_done):
+            bus_error = self.bus.err if hasattr(self.bus, 'err') else 0
+            with m.If(more & ~bus_error):
+                m.d.sync += [
+                    bus_pc.eq(fetch_pc),
+                    fetch_pc.eq(fetch_pc + 4),
+                    fresh.eq(1)
+                ]
+            with m.Else():
+                m.d.sync += [
+                    busy.eq(0),
+                    stale.eq(0),
+                    idle.eq(1)
+                ]
+            if hasattr(self.bus, 'err'):
+                # do not prefetch after an error
+                with m.If(push & self.bus.err):
+                    m.d.sync += stop.eq(1)
+        with m.Elif(start):
+            m.d.sync += [
+                busy.eq(1),
+                bus_pc.eq(start_pc),
+                fetch_pc.eq(start_pc + 4)
+            ]
+        with m.Elif(drop):
+            m.d.sync += busy.eq(0)
+
+        # ----------------------------------------------------------------------
+        # Queue
+        with m.If(push):
+            m.d.sync += [
+                buf_data[wr_ptr].eq(self.bus.dat_r),
+                wr_ptr.eq(Mux(wr_ptr == self.depth - 1, 0, wr_ptr + 1))
+            ]
+            if hasattr(self.bus, 'err'):
+                m.d.sync += buf_error[wr_ptr].eq(self.bus.err)
+            else:
+                m.d.sync += buf_error[wr_ptr].eq(0)
+        with m.If(pop):
+            m.d.sync += rd_ptr.eq(Mux(rd_ptr == self.depth - 1, 0, rd_ptr + 1))
+        with m.If(pop | direct):
+            m.d.sync += head_pc.eq(head_pc + 4)
+        with m.If(push & ~pop):
+            m.d.sync += count.eq(count + 1)
+        with m.Elif(pop & ~push):
+            m.d.sync += count.eq(count - 1)
+
+        # ----------------------------------------------------------------------
+        # Flush, and start again
+        with m.If(restart):
+            m.d.sync += [
+                head_pc.eq(restart_pc),
+                rd_ptr.eq(0),
+                wr_ptr.eq(0),
+                count.eq(0),
+                stop.eq(0)
+            ]
+            # the bus is busy (or idle for a cycle): start after the current access
+            with m.If(~start):
+                m.d.sync += fetch_pc.eq(restart_pc)
+            with m.If(busy & ~bus_done & ~drop):
+                m.d.sync += stale.eq(1)
+
+        return m
@@ -0,0 +1,174 @@
+from amaranth import Array
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Elaboratable
+from amaranth.build import Platform
+from amaranth_soc.wishbone.bus import Interface
+from amaranth_soc.wishbone.bus import CycleType
+from amaranth_soc.wishbone.bus import BurstTypeExt
+from typing import List
+
+
+class StoreBuffer(Elaboratable):
+    """Posted writes for the LSU.
+
+    Sits between the LSU and the memory port (or the D-cache). A store is acknowledged in
+    the same cycle it is accepted in the queue, and written to the bus in the background,
+    in program order. When the queue is full, the store waits.
+
+    Other accesses (loads, fetches) go to the bus between two stores. After a load, a waiting
+    store goes first, so a stream of loads (fetches) does not starve the queue:
+    - A load to an address in the queue is answered from the youngest store to that word, if
+      it writes all the requested bytes. Otherwise, the load waits until the word is written.
+    - A load to an I/O window waits until all the stores have been written.
+    - With `bypass` (AMO, LR/SC), the access waits until the queue is empty, and it is not
+      posted.
+
+    `empty` is used to order the stores with fence (and to write back the D-cache after the
+    queue). Bus errors of posted stores are not reported: the store has already retired.
+    """
+    def __init__(self, depth: int = 4, io: List = [], features: List[str] = ['err']) -> None:
+        if depth not in (2, 4, 8):
+            raise ValueError(f'Invalid store buffer depth: {depth}. Valid options: 2, 4, 8')
+        for start, addr_width in io:
+            if start & ((1 << (addr_width + 2)) - 1):
+                raise ValueError(f'I/O window {start:#010x} is not aligned to its size ({1 << (addr_width + 2)} bytes)')
+        # config
+        self.depth = depth
+        self.io    = io
+        # IO
+        self.cpu    = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='sbuffer_cpu')
+        self.bus    = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='sbuffer')
+        self.bypass = Signal()  # input
+        self.empty  = Signal()  # output
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        buf_adr   = Array(Signal(30, name=f'buf_adr{n}') for n in range(self.depth))
+        buf_data  = Array(Signal(32, name=f'buf_data{n}') for n in range(self.depth))
+        buf_sel   = Array(Signal(4, name=f'buf_sel{n}') for n in range(self.depth))
+        rd_ptr    = Signal(range(self.depth))
+        wr_ptr    = Signal(range(self.depth))
+        count     = Signal(range(self.depth + 1))
+        io        = Signal()
+        store     = Signal()  # posted
+        direct    = Signal()  # load, or atomic access
+        hit       = Signal()
+        hit_data  = Signal(32)
+        hit_sel   = Signal(4)
+        forward   = Signal()
+        go        = Signal()
+        drain     = Signal()
+        draining  = Signal()  # a store is on the bus
+        turn      = Signal()  # a load was done with stores waiting: write one before the next load
+        push      = Signal()
+        pop       = Signal()
+        bus_done  = Signal()
+
+        m.d.comb += [
+            store.eq(self.cpu.cyc & self.cpu.stb & self.cpu.we & ~self.bypass),
+            direct.eq(self.cpu.cyc & ~(self.cpu.stb & self.cpu.we & ~self.bypass)),
+            self.empty.eq(count == 0),
+            bus_done.eq(self.bus.ack)
+        ]
+        if hasattr(self.bus, 'err'):
+            m.d.comb += bus_done.eq(self.bus.ack | self.bus.err)
+
+        # I/O windows
+        for start, addr_width in self.io:
+            with m.If(self.cpu.adr[addr_width:] == (start >> (addr_width + 2))):
+                m.d.comb += io.eq(1)
+
+        # Search the queue, from the oldest to the youngest store
+        for n in range(self.depth):
+            idx = Signal(range(self.depth), name=f'idx{n}')
+            m.d.comb += idx.eq(rd_ptr + n)
+            with m.If((n < count) & (buf_adr[idx] == self.cpu.adr)):
+                m.d.comb += [
+                    hit.eq(1),
+                    hit_data.eq(buf_data[idx]),
+                    hit_sel.eq(buf_sel[idx])
+                ]
+
+        # ----------------------------------------------------------------------
+        # Loads/atomic accesses: wait for the stores they depend on, or forward the data
+        with m.If(self.bypass | io):
+            m.d.comb += go.eq(direct & ~draining & self.empty)
+        with m.Else():
+            m.d.comb += [
+                forward.eq(direct & hit & ((self.cpu.sel & ~hit_sel) == 0)),
+                go.eq(direct & ~draining & ~hit & ~turn)
+            ]
+        with m.If(go & bus_done & ~self.empty):
+            m.d.sync += turn.eq(1)
+        with m.Elif(pop):
+            m.d.sync += turn.eq(0)
+
+        # ----------------------------------------------------------------------
+        # Stores: write the oldest one when the bus is not used by a load
+        m.d.comb += [
+            drain.eq(~self.empty & (draining | ~go)),
+            push.eq(store & (count != self.depth)),
+            pop.eq(drain & bus_done)
+        ]
+        with m.If(drain & ~bus_done):
+            m.d.sync += draining.eq(1)
+        with m.Else():
+            m.d.sync += draining.eq(0)
+
+        with m.If(go):
+            m.d.comb += [
+                self.bus.adr.eq(self.cpu.adr),
+                self.bus.dat_w.eq(self.cpu.dat_w),
+                self.bus.sel.eq(self.cpu.sel),
+                self.bus.we.eq(self.cpu.we),
+                self.bus.cyc.eq(self.cpu.cyc),
+                self.bus.stb.eq(self.cpu.stb),
+                self.cpu.dat_r.eq(self.bus.dat_r),
+                self.cpu.ack.eq(self.bus.ack)
+            ]
+            if hasattr(self.bus, 'err'):
+                m.d.comb += self.cpu.err.eq(self.bus.err)
+            if hasattr(self.bus, 'lock'):
+                m.d.comb += self.bus.lock.eq(self.cpu.lock)
+        with m.Elif(drain):
+            m.d.comb += [
+                self.bus.adr.eq(buf_adr[rd_ptr]),
+                self.bus.dat_w.eq(buf_data[rd_ptr]),
+                self.bus.sel.eq(buf_sel[rd_ptr]),
+                self.bus.we.eq(1),
+                self.bus.cyc.eq(1),
+                self.bus.stb.eq(1)
+            ]
+        # single accesses
+        if hasattr(self.bus, 'cti'):
+            m.d.comb += self.bus.cti.eq(CycleType.CLASSIC)
+        if hasattr(self.bus, 'bte'):
+            m.d.comb += self.bus.bte.eq(BurstTypeExt.LINEAR)
+
+        with m.If(forward):
+            m.d.comb += [
+                self.cpu.dat_r.eq(hit_data),
+                self.cpu.ack.eq(1)
+            ]
+        with m.If(push):
+            m.d.comb += self.cpu.ack.eq(1)
+
+        # ----------------------------------------------------------------------
+        # Queue
+        with m.If(push):
+            m.d.sync += [
+                buf_adr[wr_ptr].eq(self.cpu.adr),
+                buf_data[wr_ptr].eq(self.cpu.dat_w),
+                buf_sel[wr_ptr].eq(self.cpu.sel),
+                wr_ptr.eq(wr_ptr + 1)
+            ]
+        with m.If(pop):
+            m.d.sync += rd_ptr.eq(rd_ptr + 1)
+        with m.If(push & ~pop):
+            m.d.sync += count.eq(count + 1)
+        with m.Elif(~push & pop):
+            m.d.sync += count.eq(count - 1)
+
+        return m
@@ -0,0 +1,103 @@
+from amaranth import Mux
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Memory
+from amaranth import Elaboratable
+from amaranth.utils import log2_int
+from amaranth.build import Platform
+from amaranth_soc.wishbone.bus import Interface
+from altair.gateware.core.isa import Funct5
+from altair.gateware.core.amo import AMOUnit
+from altair.gateware.core.lrsc import LRSC
+from typing import List
+
+
+class TightlyCoupledMemory(Elaboratable):
+    """Tightly-coupled memory (scratchpad) of the core.
+
+    Sits between the core and the Wishbone port: accesses to the window [address, address + size)
+    are answered by a local memory in the same cycle (no wait states), and the rest are passed
+    through to `bus`. The memory is private: the other masters of the interconnect do not see it.
+
+    With the `lock` feature, LR/SC to the TCM use a local reservation. With `amo`, near-memory
+    AMOs (`op` sideband) are executed by a local AMO unit.
+    """
+    def __init__(self,
+                 address: int = 0,
+                 size: int = 4096,
+                 init: List[int] = [],
+                 amo: bool = False,
+                 features: List[str] = ['err']
+                 ) -> None:
+        # ----------------------------------------------------------------------
+        # checks
+        if not isinstance(size, int) or size < 4 or (size & (size - 1)):
+            raise ValueError(f'TCM size must be a power of 2, greater or equal than 4: {size}')
+        if address & (size - 1):
+            raise ValueError(f'TCM address {address:#010x} is not aligned to its size ({size} bytes)')
+        if len(init) > size // 4:
+            raise ValueError(f'TCM image ({len(init)} words) does not fit in the TCM ({size // 4} words)')
+        # ----------------------------------------------------------------------
+        # config
+        self.address    = address
+        self.size       = size
+        self.amo        = amo
+        self.features   = features
+        self.addr_width = log2_int(size) - 2  # words
+        self._mem       = Memory(width=32, depth=size // 4, init=init, name='tcm_mem')
+        # ----------------------------------------------------------------------
+        # IO
+        self.cpu = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='tcm_cpu')
+        self.bus = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='tcm_bus')
+        if self.amo:
+            self.op = Signal(Funct5)  # input
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        hit   = Signal()
+        local = Interface(addr_width=30, data_width=32, granularity=8, features=self.features, name='tcm')
+        port  = Interface(addr_width=30, data_width=32, granularity=8, features=self.features, name='tcm_mem')
+        slave = port
+        m.d.comb += hit.eq(self.cpu.adr[self.addr_width:] == (self.address >> (self.addr_width + 2)))
+
+        with m.If(hit):
+            m.d.comb += self.cpu.connect(local)
+        with m.Else():
+            m.d.comb += self.cpu.connect(self.bus)
+
+        # ----------------------------------------------------------------------
+        # Atomics
+        amo = 0
+        if self.amo:
+            amounit = m.submodules.amo = AMOUnit(features=self.features)
+            m.d.comb += [
+                amounit.op.eq(self.op),
+                amounit.bus.connect(port)
+            ]
+            slave = amounit.cpu
+            amo   = self.op != Funct5.SC
+        m.d.comb += local.connect(slave)
+        if hasattr(local, 'lock'):
+            lrsc = m.submodules.lrsc = LRSC(1)
+            lrsc.tap_bus(m=m, idx=0, master=local, slave=slave, amo=amo)
+
+        # ----------------------------------------------------------------------
+        # Memory
+        # Asynchronous read: the access is acknowledged in the same cycle
+        rp = m.submodules.tcm_rp = self._mem.read_port(domain='comb')
+        wp = m.submodules.tcm_wp = self._mem.write_port(granularity=8)
+
+        access = port.cyc & port.stb
+        m.d.comb += [
+            rp.addr.eq(port.adr),
+            port.dat_r.eq(rp.data),
+
+            wp.addr.eq(port.adr),
+            wp.data.eq(port.dat_w),
+            wp.en.eq(Mux(access & port.we, port.sel, 0)),
+
+            port.ack.eq(access)
+        ]
+
+        return m
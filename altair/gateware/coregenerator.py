@@ -1,3 +1,5 @@
+from amaranth import Cat
+from amaranth import Const
 from amaranth import Signal
 from amaranth import Module
 from amaranth import Elaboratable
@@ -6,16 +8,34 @@ from amaranth_soc.memory import MemoryMap
 from amaranth_soc.wishbone.bus import Decoder
 from amaranth_soc.wishbone.bus import Interface
 from altair.gateware.core import Core
+from altair.gateware.core import PipelinedCore
 from altair.gateware.core import LRSC
+from altair.gateware.core import AMOUnit
+from altair.gateware.core import Popcount
+from altair.gateware.core import CRC32
+from altair.gateware.core.isa import Funct5
 from altair.gateware.platform import CoreInterrupts
 from altair.gateware.platform import PLIC
 from altair.gateware.platform import ROM
 from altair.gateware.platform import XBAR
+from altair.gateware.platform import SharedBus
+from altair.gateware.platform import DMA
 from altair.boot.generate import generate_and_load
+from altair.boot.generate import load_elf
 from typing import List
 
 
 class CoreGenerator(Elaboratable):
+    MICROARCH = {
+        'fsm':       Core,
+        'pipelined': PipelinedCore
+    }
+    INTERCONNECT = ['crossbar', 'registered', 'shared']
+    ACCELERATOR  = {
+        'popcount': Popcount,
+        'crc32':    CRC32
+    }
+
     class SlavePort:
         def __init__(self, *, addr_start: int, addr_width: int, features: List[str], ifname: str) -> None:
             """Create the memory interface (bus): address width for words and a granularity of 8, enabling
@@ -32,42 +52,164 @@ class CoreGenerator(Elaboratable):
     def __init__(self,
                  # Core
                  reset_address: int = 0x8000_0000,
+                 microarch: str = 'fsm',
                  enable_rv32m: bool = False,
                  enable_rv32a: bool = False,
+                 enable_rv32c: bool = False,
+                 enable_zba: bool = False,
+                 enable_zbb: bool = False,
                  enable_extra_csr: bool = False,
                  enable_user_mode: bool = False,
+                 hpm_counters: int = 0,
+                 mul_latency: int = 4,
+                 mul_iterative: bool = False,
+                 div_mode: str = 'radix2',
+                 div_early_termination: bool = False,
+                 enable_misaligned_access: bool = False,
+                 enable_near_memory_amo: bool = False,
+                 enable_icache: bool = False,
+                 icache_size: int = 4096,
+                 icache_nwords: int = 4,
+                 icache_nways: int = 1,
+                 icache_replacement: str = 'lru',
+                 enable_prefetch: bool = False,
+                 prefetch_depth: int = 2,
+                 enable_dcache: bool = False,
+                 dcache_size: int = 4096,
+                 dcache_nwords: int = 4,
+                 dcache_nways: int = 1,
+                 dcache_replacement: str = 'lru',
+                 dcache_uncached: list = [],
+                 enable_store_buffer: bool = False,
+                 store_buffer_depth: int = 4,
+                 enable_tcm: bool = False,
+                 tcm_address: int = 0x0,
+                 tcm_size: int = 4096,
+                 tcm_elf: str = '',
+                 accelerator: str = '',
+                 enable_branch_predictor: bool = False,
+                 bp_btb_entries: int = 32,
+                 bp_bht_entries: int = 256,
+                 bp_history: int = 0,
+                 bp_ras_depth: int = 4,
                  enable_triggers: bool = False,
                  ntriggers: int = 4,
                  debug_enable: bool = False,
                  # SoC
                  ncores: int = 1,
                  coreint_address: int = 0x2000_0000,
+                 coreint_clk_div: int = 10,
+                 coreint_rtc: bool = False,
+                 coreint_compare: str = 'parallel',
+                 coreint_fast_compare: bool = False,
                  plic_address: int = 0x3000_0000,
                  plic_nint: int = 16,
+                 plic_priority_bits: int = 3,
+                 plic_pipeline: int = 0,
+                 enable_dma: bool = False,
+                 dma_address: int = 0x3100_0000,
+                 dma_channels: int = 2,
+                 dma_burst: int = 4,
+                 lrsc_granule: int = 4,
+                 lrsc_timeout: int = 0,
+                 interconnect: str = 'crossbar',
+                 arbitration: dict = {},
                  rom: list = [],
+                 rom_elf: str = '',
                  mport: list = [],
                  io: list = [],
                  # build
                  build_path: str = 'build/'
                  ) -> None:
         # ----------------------------------------------------------------------
-        rom_img = generate_and_load(path=build_path, start=rom[0], target=mport[0], size=1 << rom[1])
-        self._features = ['err']
+        if microarch not in CoreGenerator.MICROARCH:
+            raise ValueError(f'Invalid microarchitecture: {microarch}. Valid options: {list(CoreGenerator.MICROARCH)}')
+        if interconnect not in CoreGenerator.INTERCONNECT:
+            raise ValueError(f'Invalid interconnect: {interconnect}. Valid options: {CoreGenerator.INTERCONNECT}')
+        if accelerator and accelerator not in CoreGenerator.ACCELERATOR:
+            raise ValueError(f'Invalid accelerator: {accelerator}. Valid options: {list(CoreGenerator.ACCELERATOR)}')
+        # ----------------------------------------------------------------------
+        if rom_elf:
+            # firmware in the ROM
+            rom_img = load_elf(elffile=rom_elf, start=rom[0], size=1 << rom[1])
+        else:
+            rom_img = generate_and_load(path=build_path, start=rom[0], target=mport[0], size=1 << rom[1])
+        tcm_img = []
+        if enable_tcm and tcm_elf:
+            tcm_img = load_elf(elffile=tcm_elf, start=tcm_address, size=tcm_size // 4)
+        self._near_amo     = enable_near_memory_amo
+        self._lrsc_granule = lrsc_granule
+        self._lrsc_timeout = lrsc_timeout
+        self._interconnect = interconnect
+        self._arbitration  = arbitration
+        self._features = ['err', 'cti', 'bte']
         if enable_rv32a:
-            self._features = ['err', 'lock']
+            self._features = ['err', 'cti', 'bte', 'lock']
+        # D-cache: IO, core interrupts and PLIC are never cached. Plus an optional window [start, addr_width]
+        uncached = [io, [coreint_address, CoreInterrupts.ADDR_WIDTH], [plic_address, PLIC.ADDR_WIDTH]]
+        if enable_dma:
+            uncached.append([dma_address, DMA.ADDR_WIDTH])
+        if dcache_uncached:
+            uncached.append(dcache_uncached)
         # Instantiate
-        self._cores = [Core(reset_address=reset_address,
-                            enable_rv32m=enable_rv32m,
-                            enable_rv32a=enable_rv32a,
-                            enable_extra_csr=enable_extra_csr,
-                            enable_user_mode=enable_user_mode,
-                            enable_triggers=enable_triggers,
-                            ntriggers=ntriggers,
-                            debug_enable=debug_enable,
-                            hartid=idx) for idx in range(ncores)]
-        self._coreint = CoreInterrupts(ncores=ncores)
-        self._plic    = PLIC(ncores=ncores, ninterrupts=plic_nint)
-        self._rom     = ROM(addr_width=rom[1], rom_img=rom_img)
+        core_cls    = CoreGenerator.MICROARCH[microarch]
+        self._cores = [core_cls(reset_address=reset_address,
+                                enable_rv32m=enable_rv32m,
+                                enable_rv32a=enable_rv32a,
+                                enable_rv32c=enable_rv32c,
+                                enable_zba=enable_zba,
+                                enable_zbb=enable_zbb,
+                                enable_extra_csr=enable_extra_csr,
+                                enable_user_mode=enable_user_mode,
+                                hpm_counters=hpm_counters,
+                                mul_latency=mul_latency,
+                                mul_iterative=mul_iterative,
+                                div_mode=div_mode,
+                                div_early_termination=div_early_termination,
+                                enable_misaligned_access=enable_misaligned_access,
+                                enable_near_memory_amo=enable_near_memory_amo,
+                                enable_icache=enable_icache,
+                                icache_size=icache_size,
+                                icache_nwords=icache_nwords,
+                                icache_nways=icache_nways,
+                                icache_replacement=icache_replacement,
+                                enable_prefetch=enable_prefetch,
+                                prefetch_depth=prefetch_depth,
+                                enable_dcache=enable_dcache,
+                                dcache_size=dcache_size,
+                                dcache_nwords=dcache_nwords,
+                                dcache_nways=dcache_nways,
+                                dcache_replacement=dcache_replacement,
+                                dcache_uncached=uncached,
+                                enable_store_buffer=enable_store_buffer,
+                                store_buffer_depth=store_buffer_depth,
+                                enable_tcm=enable_tcm,
+                                tcm_address=tcm_address,
+                                tcm_size=tcm_size,
+                                tcm_init=tcm_img,
+                                enable_accelerator=bool(accelerator),
+                                enable_branch_predictor=enable_branch_predictor,
+                                bp_btb_entries=bp_btb_entries,
+                                bp_bht_entries=bp_bht_entries,
+                                bp_history=bp_history,
+                                bp_ras_depth=bp_ras_depth,
+                                enable_triggers=enable_triggers,
+                                ntriggers=ntriggers,
+                                debug_enable=debug_enable,
+                                hartid=idx) for idx in range(ncores)]
+        # Accelerator: one per core, in the custom-0..3 opcodes
+        self._accelerators = []
+        if accelerator:
+            self._accelerators = [CoreGenerator.ACCELERATOR[accelerator]() for _ in range(ncores)]
+        self._coreint = CoreInterrupts(ncores=ncores,
+                                       clk_div=coreint_clk_div,
+                                       rtc=coreint_rtc,
+                                       compare=coreint_compare,
+                                       fast_compare=coreint_fast_compare)
+        # PLIC: the external interrupts, followed by the DMA channels
+        plic_sources  = plic_nint + (dma_channels if enable_dma else 0)
+        self._plic    = PLIC(ncores=ncores, ninterrupts=plic_sources, priority_bits=plic_priority_bits, pipeline=plic_pipeline)
+        self._rom     = ROM(addr_width=rom[1], rom_img=rom_img, features=[f for f in self._features if f in ROM.FEATURES])
         # Internal Slave ports
         self._coreint_port = CoreGenerator.SlavePort(addr_start=coreint_address, addr_width=CoreInterrupts.ADDR_WIDTH, features=self._features, ifname='coreint')
         self._plic_port    = CoreGenerator.SlavePort(addr_start=plic_address, addr_width=PLIC.ADDR_WIDTH, features=self._features, ifname='plic')
@@ -76,16 +218,42 @@ class CoreGenerator(Elaboratable):
         self.mport      = CoreGenerator.SlavePort(addr_start=mport[0], addr_width=mport[1], features=self._features, ifname='mport')
         self.io         = CoreGenerator.SlavePort(addr_start=io[0], addr_width=io[1], features=self._features, ifname='io')
         self.interrupts = Signal(plic_nint)
+        # DMA: registers (slave) and bus (master)
+        self._dma = None
+        if enable_dma:
+            self._dma      = DMA(nchannels=dma_channels, burst=dma_burst, features=self._features)
+            self._dma_port = CoreGenerator.SlavePort(addr_start=dma_address, addr_width=DMA.ADDR_WIDTH, features=self._features, ifname='dma')
+        self._slaves = [self.mport, self.io, self._coreint_port, self._plic_port, self._rom_port]
+        if self._dma is not None:
+            self._slaves.append(self._dma_port)
+        self._rtc       = coreint_rtc
+        if self._rtc:
+            self.rtc = Signal()  # input: mtime tick
+        # Arbitration: per slave for the crossbar, 'shared' for the shared bus
+        valid_ports = ['shared'] if interconnect == 'shared' else [slave.name for slave in self._slaves]
+        for name in arbitration:
+            if name not in valid_ports:
+                raise ValueError(f'Invalid arbitration port: {name}. Valid options: {valid_ports}')
+        # TCM: the slaves in the window are hidden by the TCM
+        if enable_tcm:
+            for port in self._slaves:
+                port_end = port.addr_start + (4 << port.addr_width)
+                if tcm_address < port_end and port.addr_start < tcm_address + tcm_size:
+                    raise ValueError(f'TCM window [{tcm_address:#010x}, {tcm_address + tcm_size:#010x}) overlaps the {port.name} port')
 
     def port_list(self) -> list:
         mport = [getattr(self.mport.interface, name) for name, _, _ in self.mport.interface.layout]
         io    = [getattr(self.io.interface, name) for name, _, _ in self.io.interface.layout]
 
-        return [
+        ports = [
             *mport,
             *io,
             self.interrupts
         ]
+        if self._rtc:
+            ports.append(self.rtc)
+
+        return ports
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
@@ -93,6 +261,9 @@ class CoreGenerator(Elaboratable):
         # Register
         for idx, core in enumerate(self._cores):
             setattr(m.submodules, f'core_{idx}', core)  # get a proper name in the trace
+        for idx, (core, accelerator) in enumerate(zip(self._cores, self._accelerators)):
+            setattr(m.submodules, f'accelerator_{idx}', accelerator)
+            m.d.comb += core.accelerator.connect(accelerator.port)
         m.submodules.coreint = self._coreint
         m.submodules.rom     = self._rom
         m.submodules.plic    = self._plic
@@ -109,28 +280,71 @@ class CoreGenerator(Elaboratable):
         m.d.comb += [
             self._coreint_port.interface.connect(self._coreint.wbport, exclude=self._features),
             self._plic_port.interface.connect(self._plic.wbport, exclude=self._features),
-            self._rom_port.interface.connect(self._rom.wbport, exclude=self._features)
+            self._rom_port.interface.connect(self._rom.wbport, exclude=[f for f in self._features if f not in ROM.FEATURES])
         ]
-        # Connect IO for external interrupts to the PLIC
-        m.d.comb += self._plic.interrupts.eq(self.interrupts)
+        # Connect IO for external interrupts to the PLIC. The DMA channels go after them
+        interrupts = self.interrupts
+        if self._dma is not None:
+            m.submodules.dma = self._dma
+            m.d.comb += self._dma_port.interface.connect(self._dma.wbport, exclude=self._features)
+            interrupts = Cat(self.interrupts, self._dma.interrupt)
+        m.d.comb += self._plic.interrupts.eq(interrupts)
+        if self._rtc:
+            m.d.comb += self._coreint.rtc.eq(self.rtc)
         # ------------------------------------------------------------
         # build the interconnect
         masters = [core.wbport for core in self._cores]
-        slaves  = [self.mport, self.io, self._coreint_port, self._plic_port, self._rom_port]
+        slaves  = self._slaves
+        amo_ops = [core.amo_op for core in self._cores] if self._near_amo else None
+        if self._dma is not None:
+            masters.append(self._dma.bus)
+            if amo_ops is not None:
+                amo_ops.append(Const(0, Funct5))  # the DMA never locks the bus: no AMOs
 
         if len(masters) == 1:
             master  = masters[0]
             decoder = m.submodules.decoder = Decoder(addr_width=30, data_width=32, granularity=8, features=self._features)
             for slave in slaves:
                 decoder.add(slave.interface, addr=slave.addr_start)
-            m.d.comb += master.connect(decoder.bus)
+            target = decoder.bus
+            amo    = 0
+            if self._near_amo:
+                # single master: the AMO unit goes before the decoder
+                amounit = m.submodules.amo = AMOUnit(features=self._features)
+                m.d.comb += [
+                    amounit.op.eq(self._cores[0].amo_op),
+                    amounit.bus.connect(decoder.bus)
+                ]
+                target = amounit.cpu
+                amo    = amounit.op != Funct5.SC
+            m.d.comb += master.connect(target)
 
             # LRSC module
             if 'lock' in self._features:
-                lrsc = m.submodules.lrsc = LRSC(1)
-                lrsc.tap_bus(m=m, idx=0, master=master, slave=decoder.bus)
+                lrsc = m.submodules.lrsc = LRSC(1, granule=self._lrsc_granule, timeout=self._lrsc_timeout)
+                lrsc.tap_bus(m=m, idx=0, master=master, slave=target, amo=amo)
+        elif self._interconnect == 'shared':
+            # shared bus: a single arbiter (and AMO unit) for all the slaves
+            interconnect = m.submodules.bus = SharedBus(masters=masters,
+                                                        slaves=slaves,
+                                                        features=self._features,
+                                                        amo=amo_ops,
+                                                        lrsc_granule=self._lrsc_granule,
+                                                        lrsc_timeout=self._lrsc_timeout,
+                                                        arbitration=self._arbitration.get('shared', {}))
         else:
-            # crossbar
-            m.submodules.xbar = XBAR(masters=masters, slaves=slaves, features=self._features)
+            # crossbar. With near-memory AMOs, the AMO units go after the arbiters (one per slave)
+            interconnect = m.submodules.xbar = XBAR(masters=masters,
+                                                    slaves=slaves,
+                                                    features=self._features,
+                                                    amo=amo_ops,
+                                                    lrsc_granule=self._lrsc_granule,
+                                                    lrsc_timeout=self._lrsc_timeout,
+                                                    registered=self._interconnect == 'registered',
+                                                    arbitration=self._arbitration)
+        if len(masters) > 1:
+            # cycles waiting for the grant
+            for idx, core in enumerate(self._cores):
+                m.d.comb += core.bus_wait.eq(interconnect.waiting[idx])
 
         return m
@@ -2,3 +2,5 @@ from altair.gateware.platform.coreint import CoreInterrupts as CoreInterrupts
 from altair.gateware.platform.plic import PLIC as PLIC
 from altair.gateware.platform.rom import ROM as ROM
 from altair.gateware.platform.xbar import XBAR as XBAR
+from altair.gateware.platform.xbar import SharedBus as SharedBus
+from altair.gateware.platform.dma import DMA as DMA
@@ -1,4 +1,6 @@
 from amaranth import Cat
+from amaranth import Mux
+from amaranth import Array
 from amaranth import Signal
 from amaranth import Module
 from amaranth import Elaboratable
@@ -9,6 +11,23 @@ from amaranth_soc.csr.wishbone import WishboneCSRBridge
 
 
 class CoreInterrupts(Elaboratable):
+    """Software and timer interrupts (msip, mtimecmp, mtime) of the cores.
+
+    mtime increments every `clk_div` cycles, or with the (asynchronous) `rtc` tick input.
+
+    Compare (mtime >= mtimecmp):
+    - 'parallel': a 64-bit comparator per core.
+    - 'pipelined': two 32-bit comparators per core, and a register stage (one cycle more).
+    - 'multiplexed': a single comparator, checking one core per cycle (up to `ncores` cycles
+      of latency).
+    With `fast_compare`, only the lower 32 bits are compared, with wrap-around: mtimecmp must be
+    within 2^31 ticks of mtime (mtimecmp[63:32] is ignored), and the timer interrupt is off until
+    the first write to mtimecmp.
+
+    Writing mtimecmp clears the timer interrupt of the core until the next compare.
+    """
+    COMPARE = ['parallel', 'pipelined', 'multiplexed']
+
     # the addressing is done by words...
     # for (1 msip + 2 mtimecmp) reg/core x 256 cores + 2 xtime = 770 registers -> 1024 regs (empty space...)
     ADDR_WIDTH    = 10  # 2^n words
@@ -19,11 +38,18 @@ class CoreInterrupts(Elaboratable):
     BASE_MTIMECMP = BASE_MSIP     + (MAX_NCORES * SIZE_MSIP)
     BASE_MTIME    = BASE_MTIMECMP + (MAX_NCORES * SIZE_MTIMECMP)
 
-    def __init__(self, ncores: int = 1) -> None:
+    def __init__(self, ncores: int = 1, clk_div: int = 10, rtc: bool = False, compare: str = 'parallel', fast_compare: bool = False) -> None:
+        if not isinstance(clk_div, int) or clk_div < 1:
+            raise ValueError(f'Invalid mtime clock divider: {clk_div}. Must be an integer, greater or equal than 1')
+        if compare not in CoreInterrupts.COMPARE:
+            raise ValueError(f'Invalid mtimecmp compare: {compare}. Valid options: {CoreInterrupts.COMPARE}')
         # ----------------------------------------------------------------------
         # config
-        self._ncores  = ncores
-        self._clk_div = 10  # TODO make this a parameter.
+        self._ncores       = ncores
+        self._clk_div      = clk_div
+        self._rtc          = rtc
+        self._compare      = compare
+        self._fast_compare = fast_compare
         # ----------------------------------------------------------------------
         # control registers
         self._msip     = [Element(1, 'rw', name=f'msip{n}') for n in range(ncores)]
@@ -44,6 +70,8 @@ class CoreInterrupts(Elaboratable):
         self.wbport             = self._bridge.wb_bus
         self.timer_interrupt    = Signal(ncores)
         self.software_interrupt = Signal(ncores)
+        if self._rtc:
+            self.rtc = Signal()  # input: mtime tick (asynchronous)
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
@@ -68,32 +96,80 @@ class CoreInterrupts(Elaboratable):
 
         # ------------------------------------------------------------
         # Timer
-        clk_div = Signal(range(self._clk_div), reset=self._clk_div - 1)
         time    = Signal(64)
         timecmp = [Signal(64, reset=-1) for _ in range(self._ncores)]
+        tick    = Signal()
+        armed   = [Signal(name=f'armed{n}') for n in range(self._ncores)]  # fast compare: mtimecmp written
+        stages  = [[match] for match in ti_matches]  # compare registers, per core
 
-        # clk div + timer
-        m.d.sync += clk_div.eq(clk_div - 1)
-        with m.If(clk_div == 0):
-            m.d.sync += [
-                clk_div.eq(clk_div.reset),
-                time.eq(time + 1)
-            ]
+        if self._rtc:
+            # synchronize, and increment on the rising edge
+            rtc_sync = Signal(3)
+            m.d.sync += rtc_sync.eq(Cat(self.rtc, rtc_sync[:2]))
+            m.d.comb += tick.eq(rtc_sync[1] & ~rtc_sync[2])
+        else:
+            clk_div = Signal(range(self._clk_div), reset=self._clk_div - 1)
+            m.d.sync += clk_div.eq(clk_div - 1)
+            with m.If(clk_div == 0):
+                m.d.sync += clk_div.eq(clk_div.reset)
+                m.d.comb += tick.eq(1)
+
+        with m.If(tick):
+            m.d.sync += time.eq(time + 1)
 
         # compare
-        for cmp, match in zip(timecmp, ti_matches):
-            m.d.sync += match.eq(time >= cmp)
+        def expired(cmp, armed):
+            if self._fast_compare:
+                return armed & ((time[:32] - cmp[:32])[31] == 0)
+            return time >= cmp
+
+        if self._compare == 'multiplexed':
+            idx = Signal(range(self._ncores))
+            hit = Signal()
+            m.d.sync += idx.eq(Mux(idx == self._ncores - 1, 0, idx + 1))
+            m.d.comb += hit.eq(expired(Array(timecmp)[idx], Array(armed)[idx]))
+            for n, match in enumerate(ti_matches):
+                with m.If(idx == n):
+                    m.d.sync += match.eq(hit)
+        elif self._compare == 'pipelined':
+            for n, (cmp, match) in enumerate(zip(timecmp, ti_matches)):
+                if self._fast_compare:
+                    lo_ge = Signal(name=f'lo_ge{n}')
+                    m.d.sync += [
+                        lo_ge.eq(expired(cmp, armed[n])),
+                        match.eq(lo_ge)
+                    ]
+                    stages[n].append(lo_ge)
+                else:
+                    hi_gt = Signal(name=f'hi_gt{n}')
+                    hi_eq = Signal(name=f'hi_eq{n}')
+                    lo_ge = Signal(name=f'lo_ge{n}')
+                    m.d.sync += [
+                        hi_gt.eq(time[32:] > cmp[32:]),
+                        hi_eq.eq(time[32:] == cmp[32:]),
+                        lo_ge.eq(time[:32] >= cmp[:32]),
+                        match.eq(hi_gt | (hi_eq & lo_ge))
+                    ]
+                    stages[n] += [hi_gt, hi_eq]
+        else:
+            for cmp, flag, match in zip(timecmp, armed, ti_matches):
+                m.d.sync += match.eq(expired(cmp, flag))
 
         # Bus handling: read
         m.d.comb += self._mtime.r_data.eq(time)
         for rcmp, cmp in zip(self._mtimecmp, timecmp):
             m.d.comb += rcmp.r_data.eq(cmp)
 
-        # Bus handling: write
+        # Bus handling: write. Clear the compare until the new value is checked
         with m.If(self._mtime.w_stb):
             m.d.sync += time.eq(self._mtime.w_data)
-        for rcmp, cmp in zip(self._mtimecmp, timecmp):
+            m.d.sync += [register.eq(0) for stage in stages for register in stage]
+        for rcmp, cmp, flag, stage in zip(self._mtimecmp, timecmp, armed, stages):
             with m.If(rcmp.w_stb):
-                m.d.sync += cmp.eq(rcmp.w_data)
+                m.d.sync += [
+                    cmp.eq(rcmp.w_data),
+                    flag.eq(1)
+                ]
+                m.d.sync += [register.eq(0) for register in stage]
 
         return m
@@ -0,0 +1,266 @@
+from amaranth import Cat
+from amaranth import Mux
+from amaranth import Array
+from amaranth import Signal
+from amaranth import Module
+from amaranth import Elaboratable
+from amaranth.build import Platform
+from amaranth_soc.csr.bus import Element
+from amaranth_soc.csr.bus import Multiplexer
+from amaranth_soc.csr.wishbone import WishboneCSRBridge
+from amaranth_soc.wishbone.bus import Interface
+from amaranth_soc.wishbone.bus import CycleType
+from amaranth_soc.wishbone.bus import BurstTypeExt
+from typing import List
+
+
+class DMA(Elaboratable):
+    """Descriptor-based DMA controller.
+
+    A descriptor is 4 words in memory: source, destination (byte addresses, word aligned),
+    number of words, and the address of the next descriptor (0: last). A channel is started
+    writing the address of its first descriptor, and then the start bit of the control register.
+    The channel follows the chain, and sets `done` after the last descriptor (`error` with a bus
+    error). The interrupt of the channel is `(done | error) & irq_enable`: write 1 to the status
+    bits to clear them.
+
+    The copies are done in bursts of up to `burst` words (read burst to a buffer, then write
+    burst). The channels take turns after each burst. An abort takes effect at the end of the
+    current burst, and the results of that burst are dropped, even if the channel is started again.
+
+    Registers (words), for each channel at `4 * channel`:
+    - 0: control. Write: start (bit 0), irq enable (bit 1), abort (bit 2). Read: busy, irq enable.
+    - 1: address of the first descriptor.
+    - 2: status: busy, done (write 1 to clear), error (write 1 to clear).
+    - 3: words left in the current descriptor.
+    """
+    ADDR_WIDTH   = 6  # 2^n words
+    SIZE         = 4  # words per channel
+    MAX_CHANNELS = 16
+
+    def __init__(self, nchannels: int = 1, burst: int = 4, features: List[str] = ['err', 'cti', 'bte']) -> None:
+        if not isinstance(nchannels, int) or not 0 < nchannels <= DMA.MAX_CHANNELS:
+            raise ValueError(f'Invalid number of DMA channels: {nchannels}. Must be between 1 and {DMA.MAX_CHANNELS}')
+        if not isinstance(burst, int) or not 0 < burst <= 16:
+            raise ValueError(f'Invalid DMA burst length: {burst}. Must be between 1 and 16 words')
+        # ----------------------------------------------------------------------
+        # config
+        self._nchannels = nchannels
+        self._burst     = burst
+        # ----------------------------------------------------------------------
+        # Control registers
+        self._control    = [Element(3, 'rw', name=f'control{n}') for n in range(nchannels)]
+        self._descriptor = [Element(32, 'rw', name=f'descriptor{n}') for n in range(nchannels)]
+        self._status     = [Element(3, 'rw', name=f'status{n}') for n in range(nchannels)]
+        self._remaining  = [Element(32, 'r', name=f'remaining{n}') for n in range(nchannels)]
+        # ----------------------------------------------------------------------
+        # Add the registers to the mux. Create the bridge
+        self._mux = Multiplexer(addr_width=DMA.ADDR_WIDTH, data_width=32)
+        for idx in range(nchannels):
+            base = idx * DMA.SIZE
+            self._mux.add(self._control[idx], addr=base)
+            self._mux.add(self._descriptor[idx], addr=base + 1)
+            self._mux.add(self._status[idx], addr=base + 2)
+            self._mux.add(self._remaining[idx], addr=base + 3)
+        self._bridge = WishboneCSRBridge(self._mux.bus, data_width=32)
+        # ----------------------------------------------------------------------
+        # IO
+        self.wbport    = self._bridge.wb_bus  # slave: registers
+        self.bus       = Interface(addr_width=30, data_width=32, granularity=8, features=features, name='dma')  # master
+        self.interrupt = Signal(nchannels)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        m.submodules.mux    = self._mux
+        m.submodules.bridge = self._bridge
+
+        nch = self._nchannels
+        # ------------------------------------------------------------
+        # Channel state
+        busy       = Array(Signal(name=f'busy{n}') for n in range(nch))
+        done       = Array(Signal(name=f'done{n}') for n in range(nch))
+        error      = Array(Signal(name=f'error{n}') for n in range(nch))
+        irq_enable = Array(Signal(name=f'irq_enable{n}') for n in range(nch))
+        loaded     = Array(Signal(name=f'loaded{n}') for n in range(nch))  # descriptor fetched
+        gen        = Array(Signal(name=f'gen{n}') for n in range(nch))  # toggled with each start
+        descriptor = Array(Signal(30, name=f'descriptor{n}') for n in range(nch))
+        src        = Array(Signal(30, name=f'src{n}') for n in range(nch))
+        dst        = Array(Signal(30, name=f'dst{n}') for n in range(nch))
+        count      = Array(Signal(32, name=f'count{n}') for n in range(nch))
+        next_desc  = Array(Signal(30, name=f'next{n}') for n in range(nch))
+        first      = [Signal(32, name=f'first{n}') for n in range(nch)]  # first descriptor (register)
+
+        # ------------------------------------------------------------
+        # Engine
+        ch      = Signal(range(nch))
+        next_ch = Signal(range(nch))
+        pending = Signal()
+        length  = Signal(range(self._burst + 1))
+        beat    = Signal(range(max(self._burst, 4) + 1))  # descriptor: 4 words
+        last    = Signal()
+        r_gen   = Signal()  # generation of the channel when it was dispatched
+        live    = Signal()  # the channel was not aborted (or restarted) since it was dispatched
+        buffer  = Array(Signal(32, name=f'buffer{n}') for n in range(self._burst))
+
+        m.d.comb += live.eq(busy[ch] & (gen[ch] == r_gen))
+
+        # round-robin: the next busy channel after the current one
+        for offset in reversed(range(1, nch + 1)):
+            idx = (ch + offset) % nch if nch > 1 else 0
+            with m.If(busy[idx]):
+                m.d.comb += [
+                    next_ch.eq(idx),
+                    pending.eq(1)
+                ]
+
+        bus       = self.bus
+        bus_error = 0
+        if hasattr(bus, 'err'):
+            bus_error = bus.err
+
+        def burst(address, nbeats):
+            m.d.comb += [
+                bus.adr.eq(address + beat),
+                bus.sel.eq(0b1111),
+                bus.cyc.eq(1),
+                bus.stb.eq(1),
+                last.eq(beat == nbeats - 1)
+            ]
+            if hasattr(bus, 'cti'):
+                with m.If(nbeats == 1):
+                    m.d.comb += bus.cti.eq(CycleType.CLASSIC)
+                with m.Elif(last):
+                    m.d.comb += bus.cti.eq(CycleType.END_OF_BURST)
+                with m.Else():
+                    m.d.comb += bus.cti.eq(CycleType.INCR_BURST)
+            if hasattr(bus, 'bte'):
+                m.d.comb += bus.bte.eq(BurstTypeExt.LINEAR)
+            with m.If(bus.ack):
+                m.d.sync += beat.eq(beat + 1)
+
+        with m.FSM(name='dma'):
+            with m.State('IDLE'):
+                with m.If(pending):
+                    m.d.sync += ch.eq(next_ch)
+                    m.next = 'DISPATCH'
+            with m.State('DISPATCH'):
+                m.d.sync += [
+                    beat.eq(0),
+                    r_gen.eq(gen[ch])
+                ]
+                with m.If(~busy[ch]):
+                    # aborted
+                    m.next = 'IDLE'
+                with m.Elif(~loaded[ch]):
+                    m.next = 'FETCH'
+                with m.Elif(count[ch] != 0):
+                    m.d.sync += length.eq(Mux(count[ch] > self._burst, self._burst, count[ch]))
+                    m.next = 'READ'
+                with m.Elif(next_desc[ch] != 0):
+                    m.d.sync += [
+                        descriptor[ch].eq(next_desc[ch]),
+                        loaded[ch].eq(0)
+                    ]
+                    m.next = 'IDLE'
+                with m.Else():
+                    m.d.sync += [
+                        busy[ch].eq(0),
+                        done[ch].eq(1)
+                    ]
+                    m.next = 'IDLE'
+            with m.State('FETCH'):
+                burst(descriptor[ch], 4)
+                with m.If(bus.ack):
+                    # drop the descriptor of an aborted channel
+                    with m.If(live):
+                        with m.Switch(beat):
+                            with m.Case(0):
+                                m.d.sync += src[ch].eq(bus.dat_r[2:])
+                            with m.Case(1):
+                                m.d.sync += dst[ch].eq(bus.dat_r[2:])
+                            with m.Case(2):
+                                m.d.sync += count[ch].eq(bus.dat_r)
+                            with m.Case(3):
+                                m.d.sync += next_desc[ch].eq(bus.dat_r[2:])
+                        with m.If(last):
+                            m.d.sync += loaded[ch].eq(1)
+                    with m.If(last):
+                        m.next = 'DISPATCH'
+                with m.Elif(bus_error):
+                    m.next = 'ERROR'
+            with m.State('READ'):
+                burst(src[ch], length)
+                with m.If(bus.ack):
+                    m.d.sync += buffer[beat].eq(bus.dat_r)
+                    with m.If(last):
+                        m.d.sync += beat.eq(0)
+                        with m.If(live):
+                            m.next = 'WRITE'
+                        with m.Else():
+                            m.next = 'IDLE'
+                with m.Elif(bus_error):
+                    m.next = 'ERROR'
+            with m.State('WRITE'):
+                burst(dst[ch], length)
+                m.d.comb += [
+                    bus.we.eq(1),
+                    bus.dat_w.eq(buffer[beat])
+                ]
+                with m.If(bus.ack & last):
+                    with m.If(live):
+                        m.d.sync += [
+                            src[ch].eq(src[ch] + length),
+                            dst[ch].eq(dst[ch] + length),
+                            count[ch].eq(count[ch] - length)
+                        ]
+                    m.next = 'IDLE'
+                with m.Elif(bus_error):
+                    m.next = 'ERROR'
+            with m.State('ERROR'):
+                with m.If(live):
+                    m.d.sync += [
+                        busy[ch].eq(0),
+                        error[ch].eq(1)
+                    ]
+                m.next = 'IDLE'
+
+        # ------------------------------------------------------------
+        # Interrupts
+        m.d.comb += self.interrupt.eq(Cat((done[n] | error[n]) & irq_enable[n] for n in range(nch)))
+
+        # ------------------------------------------------------------
+        # Bus: read
+        for n in range(nch):
+            m.d.comb += [
+                self._control[n].r_data.eq(Cat(busy[n], irq_enable[n])),
+                self._descriptor[n].r_data.eq(first[n]),
+                self._status[n].r_data.eq(Cat(busy[n], done[n], error[n])),
+                self._remaining[n].r_data.eq(count[n])
+            ]
+        # ------------------------------------------------------------
+        # Bus: write. Start only an idle channel
+        for n in range(nch):
+            control = self._control[n]
+            status  = self._status[n]
+            with m.If(self._descriptor[n].w_stb):
+                m.d.sync += first[n].eq(self._descriptor[n].w_data)
+            with m.If(control.w_stb):
+                m.d.sync += irq_enable[n].eq(control.w_data[1])
+                with m.If(control.w_data[0] & ~busy[n]):
+                    m.d.sync += [
+                        busy[n].eq(1),
+                        done[n].eq(0),
+                        error[n].eq(0),
+                        loaded[n].eq(0),
+                        gen[n].eq(~gen[n]),
+                        descriptor[n].eq(first[n][2:])
+                    ]
+                with m.Elif(control.w_data[2]):
+                    m.d.sync += busy[n].eq(0)
+            with m.If(status.w_stb):
+                with m.If(status.w_data[1]):
+                    m.d.sync += done[n].eq(0)
+                with m.If(status.w_data[2]):
+                    m.d.sync += error[n].eq(0)
+
+        return m
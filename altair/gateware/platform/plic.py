@@ -1,52 +1,77 @@
 from amaranth import Cat
+from amaranth import Mux
+from amaranth import Const
 from amaranth import Signal
 from amaranth import Module
 from amaranth import Elaboratable
-from amaranth.lib.coding import PriorityEncoder
 from amaranth.build import Platform
 from amaranth_soc.csr.bus import Element
 from amaranth_soc.csr.bus import Multiplexer
 from amaranth_soc.csr.wishbone import WishboneCSRBridge
-from amaranth_soc.event import Monitor
-from amaranth_soc.event import Source
-from amaranth_soc.event import EventMap
 
 
 class PLIC(Elaboratable):
+    """Platform-level interrupt controller.
+
+    Sources are numbered from 1 (`interrupts[0]` is the source 1), and the ID 0 means "no
+    interrupt". Each source has a priority (0: never interrupts), and each context (core) has
+    an enable bit per source and a priority threshold. A context is interrupted when its
+    highest priority pending and enabled source has a priority greater than the threshold.
+
+    The sources are level triggered. Reading the claim register of a context returns the
+    highest priority source (lowest ID on ties) and clears its pending bit. The source is
+    not pending again until its ID is written to the claim register (complete).
+
+    The highest priority source is found with a tree of comparators. With `pipeline` > 0, the
+    tree is registered every `pipeline` levels.
+    """
     # the addressing is done by words...
-    # for 4 types/core x 256 cores x 1 reg/type = 1024 registers (word)
-    ADDR_WIDTH   = 10 # 2^n words
-    SIZE         = 1  # word
-    MAX_NCORES   = 256
-    BASE_PENDING = 0
-    BASE_ENABLE  = BASE_PENDING + (MAX_NCORES * SIZE)
-    BASE_SOURCE  = BASE_ENABLE  + (MAX_NCORES * SIZE)
-    BASE_CLEAR   = BASE_SOURCE  + (MAX_NCORES * SIZE)
+    # 1024 priorities + 32 pending + 256 x 32 enables + 256 thresholds + 256 claims = 9760 words
+    ADDR_WIDTH     = 14  # 2^n words
+    MAX_NCORES     = 256
+    MAX_SOURCES    = 1024  # including the source 0
+    NGROUPS        = MAX_SOURCES // 32
+    BASE_PRIORITY  = 0
+    BASE_PENDING   = BASE_PRIORITY  + MAX_SOURCES
+    BASE_ENABLE    = BASE_PENDING   + NGROUPS
+    BASE_THRESHOLD = BASE_ENABLE    + (MAX_NCORES * NGROUPS)
+    BASE_CLAIM     = BASE_THRESHOLD + MAX_NCORES
 
-    def __init__(self, ncores: int = 1, ninterrupts: int = 2) -> None:
-        if not isinstance(ninterrupts, int) or ninterrupts > 32:
-            raise ValueError(f'ninterrupts must be an integer, not greater than 32: {ninterrupts}')
+    def __init__(self, ncores: int = 1, ninterrupts: int = 2, priority_bits: int = 3, pipeline: int = 0) -> None:
+        if not isinstance(ninterrupts, int) or not 0 < ninterrupts < PLIC.MAX_SOURCES:
+            raise ValueError(f'ninterrupts must be an integer, between 1 and {PLIC.MAX_SOURCES - 1}: {ninterrupts}')
+        if not isinstance(priority_bits, int) or not 0 < priority_bits <= 32:
+            raise ValueError(f'priority_bits must be an integer, between 1 and 32: {priority_bits}')
+        if not isinstance(pipeline, int) or pipeline < 0:
+            raise ValueError(f'pipeline must be a positive integer, or 0 (combinational): {pipeline}')
         # ----------------------------------------------------------------------
         # config
-        self._ncores      = ncores
-        self._ninterrupts = ninterrupts
+        self._ncores        = ncores
+        self._ninterrupts   = ninterrupts
+        self._priority_bits = priority_bits
+        self._pipeline      = pipeline
+        self._ngroups       = (ninterrupts + 1 + 31) // 32
         # ----------------------------------------------------------------------
         # Control registers
-        self._pending   = [Element(ninterrupts, 'r', name=f'pending{n}') for n in range(ncores)]
-        self._enable    = [Element(ninterrupts, 'rw', name=f'enable{n}') for n in range(ncores)]
-        self._source_id = [Element(32, 'r', name=f'source{n}') for n in range(ncores)]  # Mmm, this could be 5, not 32?
-        self._clear     = [Element(ninterrupts, 'rw', name=f'clear{n}') for n in range(ncores)]
+        self._priority  = [Element(priority_bits, 'rw', name=f'priority{s}') for s in range(1, ninterrupts + 1)]
+        self._pending   = [Element(32, 'r', name=f'pending{g}') for g in range(self._ngroups)]
+        self._enable    = [[Element(32, 'rw', name=f'enable{n}_{g}') for g in range(self._ngroups)] for n in range(ncores)]
+        self._threshold = [Element(priority_bits, 'rw', name=f'threshold{n}') for n in range(ncores)]
+        self._claim     = [Element(32, 'rw', name=f'claim{n}') for n in range(ncores)]
         # ----------------------------------------------------------------------
         # Add the registers to the mux. Create the bridge
         self._mux = Multiplexer(addr_width=PLIC.ADDR_WIDTH, data_width=32)
+        for idx, reg in enumerate(self._priority):
+            self._mux.add(reg, addr=PLIC.BASE_PRIORITY + idx + 1)
         for idx, reg in enumerate(self._pending):
-            self._mux.add(reg, addr=PLIC.BASE_PENDING + (idx * PLIC.SIZE))
-        for idx, reg in enumerate(self._enable):
-            self._mux.add(reg, addr=PLIC.BASE_ENABLE + (idx * PLIC.SIZE))
-        for idx, reg in enumerate(self._source_id):
-            self._mux.add(reg, addr=PLIC.BASE_SOURCE + (idx * PLIC.SIZE))
-        for idx, reg in enumerate(self._clear):
-            self._mux.add(reg, addr=PLIC.BASE_CLEAR + (idx * PLIC.SIZE))
+            self._mux.add(reg, addr=PLIC.BASE_PENDING + idx)
+        for idx, regs in enumerate(self._enable):
+            for group, reg in enumerate(regs):
+                self._mux.add(reg, addr=PLIC.BASE_ENABLE + (idx * PLIC.NGROUPS) + group)
+        for idx, reg in enumerate(self._threshold):
+            self._mux.add(reg, addr=PLIC.BASE_THRESHOLD + idx)
+        for idx, reg in enumerate(self._claim):
+            self._mux.add(reg, addr=PLIC.BASE_CLAIM + idx)
         self._bridge = WishboneCSRBridge(self._mux.bus, data_width=32)
         # ----------------------------------------------------------------------
         # IO
@@ -54,58 +79,109 @@ class PLIC(Elaboratable):
         self.interrupts     = Signal(ninterrupts)
         self.core_interrupt = Signal(ncores)
 
+    def _max_priority(self, m: Module, leaves: list, name: str):
+        # (priority, ID) of the highest priority leaf. On ties, the left one (lowest ID) wins.
+        level = 0
+        while len(leaves) > 1:
+            nodes = []
+            for idx, ((pa, ia), (pb, ib)) in enumerate(zip(leaves[0::2], leaves[1::2])):
+                p = Signal(self._priority_bits, name=f'{name}_l{level}_prio{idx}')
+                i = Signal(range(self._ninterrupts + 1), name=f'{name}_l{level}_id{idx}')
+                m.d.comb += [
+                    p.eq(Mux(pb > pa, pb, pa)),
+                    i.eq(Mux(pb > pa, ib, ia))
+                ]
+                nodes.append((p, i))
+            if len(leaves) & 1:
+                nodes.append(leaves[-1])
+            level += 1
+            if self._pipeline and level % self._pipeline == 0:
+                registered = []
+                for idx, (p, i) in enumerate(nodes):
+                    rp = Signal(self._priority_bits, name=f'{name}_r{level}_prio{idx}')
+                    ri = Signal(range(self._ninterrupts + 1), name=f'{name}_r{level}_id{idx}')
+                    m.d.sync += [
+                        rp.eq(p),
+                        ri.eq(i)
+                    ]
+                    registered.append((rp, ri))
+                nodes = registered
+            leaves = nodes
+
+        return leaves[0]
+
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
         m.submodules.mux    = self._mux
         m.submodules.bridge = self._bridge
 
-        # ------------------------------------------------------------
-        # create the sources, and create the maps
-        interrurp_src = [[Source(trigger='level', name=f'intsrc{i}{j}') for j in range(self._ninterrupts)] for i in range(self._ncores)]
-        event_maps    = [EventMap() for _ in range(self._ncores)]
-
-        for intsrc, eventmap in zip(interrurp_src, event_maps):
-            for src in intsrc:
-                eventmap.add(src)
-
-        # ------------------------------------------------------------
-        # create the monitors
-        monitors = [Monitor(event_map=eventmap, trigger='level') for eventmap in event_maps]
-        m.submodules += monitors
-
-        # ------------------------------------------------------------
-        # create the encoders
-        prioenc = [PriorityEncoder(self._ninterrupts) for _ in range(self._ncores)]
-        m.submodules += prioenc
+        nsources   = self._ninterrupts + 1  # plus the source 0
+        pending    = Signal(32 * self._ngroups)
+        in_service = Signal(nsources)
+        priority   = [Signal(self._priority_bits, name=f'prio{s}') for s in range(1, nsources)]
+        enable     = [Signal(32 * self._ngroups, name=f'enable{n}') for n in range(self._ncores)]
+        threshold  = [Signal(self._priority_bits, name=f'threshold{n}') for n in range(self._ncores)]
+        claim_id   = Signal(range(nsources))  # 0: no claim
+        complete   = Signal()
+        done_id    = Signal(32)
 
         # ------------------------------------------------------------
-        # connect the interrupts (IO)
-        for intsrc in interrurp_src:
-            for idx, src in enumerate(intsrc):
-                m.d.comb += src.i.eq(self.interrupts[idx])
-
-        m.d.comb += self.core_interrupt.eq(Cat([monitor.src.i for monitor in monitors]))
+        # Gateways: a source is pending until claimed, and blocked until completed
+        for s in range(1, nsources):
+            with m.If(claim_id == s):
+                m.d.sync += [
+                    pending[s].eq(0),
+                    in_service[s].eq(1)
+                ]
+            with m.Elif(complete & (done_id == s)):
+                m.d.sync += in_service[s].eq(0)
+            with m.Elif(self.interrupts[s - 1] & ~in_service[s]):
+                m.d.sync += pending[s].eq(1)
 
         # ------------------------------------------------------------
-        # connect the monitor to encoder
-        for encoder, monitor in zip(prioenc, monitors):
-            m.d.sync += encoder.i.eq(monitor.pending & monitor.enable)
+        # Highest priority source, for each context
+        for n in range(self._ncores):
+            leaves = [(Mux(pending[s] & enable[n][s], priority[s - 1], 0), Const(s, range(nsources))) for s in range(1, nsources)]
+            best_prio, best_id = self._max_priority(m, leaves, name=f'ctx{n}')
+            # The tree can be late (pipeline): the source must be still pending
+            valid = Signal(name=f'valid{n}')
+            m.d.comb += [
+                valid.eq((best_prio != 0) & pending.bit_select(best_id, 1)),
+                self.core_interrupt[n].eq(valid & (best_prio > threshold[n])),
+                self._claim[n].r_data.eq(Mux(valid, best_id, 0))
+            ]
+            # claim (read), complete (write)
+            with m.If(self._claim[n].r_stb):
+                m.d.comb += claim_id.eq(self._claim[n].r_data)
+            with m.If(self._claim[n].w_stb):
+                m.d.comb += [
+                    complete.eq(1),
+                    done_id.eq(self._claim[n].w_data)
+                ]
 
         # ------------------------------------------------------------
         # Bus: read
-        for pending, enable, src_id, clear, monitor, encoder in zip(self._pending, self._enable, self._source_id, self._clear, monitors, prioenc):
-            m.d.comb += [
-                pending.r_data.eq(monitor.pending),
-                enable.r_data.eq(monitor.enable),
-                clear.r_data.eq(monitor.clear),
-                src_id.r_data.eq(encoder.o)
-            ]
+        for group, reg in enumerate(self._pending):
+            m.d.comb += reg.r_data.eq(pending[32 * group:32 * (group + 1)])
+        for regs, en in zip(self._enable, enable):
+            for group, reg in enumerate(regs):
+                m.d.comb += reg.r_data.eq(en[32 * group:32 * (group + 1)])
+        for reg, prio in zip(self._priority, priority):
+            m.d.comb += reg.r_data.eq(prio)
+        for reg, thr in zip(self._threshold, threshold):
+            m.d.comb += reg.r_data.eq(thr)
         # ------------------------------------------------------------
-        # Bus: write
-        for enable, clear, monitor in zip(self._enable, self._clear, monitors):
-            with m.If(enable.w_stb):
-                m.d.sync += monitor.enable.eq(enable.w_data)
-            with m.If(clear.w_stb):
-                m.d.comb += monitor.clear.eq(clear.w_data)  # TODO move to sync
+        # Bus: write. The source 0 is never enabled, and the IDs above ninterrupts do not exist
+        mask = Cat(Const(0, 1), Const(-1, self._ninterrupts))
+        for regs, en in zip(self._enable, enable):
+            for group, reg in enumerate(regs):
+                with m.If(reg.w_stb):
+                    m.d.sync += en[32 * group:32 * (group + 1)].eq(reg.w_data & mask[32 * group:32 * (group + 1)])
+        for reg, prio in zip(self._priority, priority):
+            with m.If(reg.w_stb):
+                m.d.sync += prio.eq(reg.w_data)
+        for reg, thr in zip(self._threshold, threshold):
+            with m.If(reg.w_stb):
+                m.d.sync += thr.eq(reg.w_data)
 
         return m
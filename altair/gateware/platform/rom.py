@@ -1,27 +1,59 @@
+from amaranth import Cat
+from amaranth import Mux
+from amaranth import Signal
 from amaranth import Module
 from amaranth import Memory
 from amaranth import Elaboratable
 from amaranth.build import Platform
 from amaranth_soc.wishbone import Interface
+from amaranth_soc.wishbone.bus import CycleType
+from amaranth_soc.wishbone.bus import BurstTypeExt
+from typing import List
 
 
 class ROM(Elaboratable):
-    def __init__(self, addr_width: int, rom_img) -> None:
+    """Read-only memory.
+
+    Classic cycles are answered in the next cycle. With the `cti` feature, incrementing bursts
+    (linear or wrapped, with `bte`) are answered without wait states: the next word of the
+    burst is read while the current one is acknowledged, so the ROM acknowledges every cycle
+    until the end of the burst.
+    """
+    FEATURES = ['cti', 'bte']
+
+    def __init__(self, addr_width: int, rom_img, features: List[str] = []) -> None:
         # addr_width: size need to address words.
         self._rom = Memory(width=32, depth=1 << addr_width, init=rom_img, name='rom_mem')
         # ----------------------------------------------------------------------
         # IO
-        self.wbport = Interface(addr_width=addr_width, data_width=32, name='rom')
+        self.wbport = Interface(addr_width=addr_width, data_width=32, features=features, name='rom')
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
         rom_rp = m.submodules.rom_rp = self._rom.read_port(transparent=False)
 
+        request = self.wbport.cyc & self.wbport.stb
+        ack     = Signal()
+        burst   = 0
+        if hasattr(self.wbport, 'cti'):
+            burst = self.wbport.cti == CycleType.INCR_BURST
+
+        # Next address of the burst
+        adr      = self.wbport.adr
+        next_adr = Signal.like(adr)
+        m.d.comb += next_adr.eq(adr + 1)
+        if hasattr(self.wbport, 'bte'):
+            for bte, nbits in [(BurstTypeExt.WRAP_4, 2), (BurstTypeExt.WRAP_8, 3), (BurstTypeExt.WRAP_16, 4)]:
+                with m.If(self.wbport.bte == bte):
+                    m.d.comb += next_adr.eq(Cat((adr + 1)[:nbits], adr[nbits:]))
+
+        # In a burst, read the next word while the current one is acknowledged
         m.d.comb += [
-            rom_rp.addr.eq(self.wbport.adr),
-            rom_rp.en.eq(self.wbport.cyc & self.wbport.stb),
-            self.wbport.dat_r.eq(rom_rp.data)
+            rom_rp.addr.eq(Mux(self.wbport.ack & burst, next_adr, adr)),
+            rom_rp.en.eq(self.wbport.cyc & (~self.wbport.ack | burst)),
+            self.wbport.dat_r.eq(rom_rp.data),
+            self.wbport.ack.eq(ack & request)  # the master can insert wait states in a burst
         ]
-        m.d.sync += self.wbport.ack.eq(self.wbport.cyc & ~self.wbport.ack)
+        m.d.sync += ack.eq(request & (~self.wbport.ack | burst))
 
         return m
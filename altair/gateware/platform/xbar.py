@@ -1,5 +1,8 @@
 from amaranth import Cat
+from amaranth import Mux
 from amaranth import Repl
+from amaranth import Array
+from amaranth import Const
 from amaranth import Signal
 from amaranth import Module
 from amaranth import Elaboratable
@@ -10,13 +13,29 @@ from amaranth_soc.wishbone.bus import Interface
 from amaranth_soc.wishbone.bus import CycleType
 from amaranth_soc.wishbone.bus import BurstTypeExt
 from altair.gateware.core.lrsc import LRSC
+from altair.gateware.core.amo import AMOUnit
+from altair.gateware.core.isa import Funct5
 
 
 class _Arbiter(Arbiter):
     """Clone the arbiter from Amaranth SoC, and add the grant as an output port
     Wishbone bus arbiter.
 
-    A round-robin arbiter for initiators accessing a shared Wishbone bus.
+    An arbiter for initiators accessing a shared Wishbone bus. The grant is kept while the
+    owner holds the bus (``cyc`` and ``stb``, or ``lock``), and the next owner is selected
+    with the policy:
+    - round-robin: the next initiator requesting the bus.
+    - priority: the lowest initiator requesting the bus.
+    - weighted: round-robin, but initiator ``n`` keeps the bus for ``weights[n]``
+      consecutive transactions. Between two of them, the bus is held for the owner up to
+      ``hold`` cycles with ``cyc`` low, as the initiators drop ``cyc`` after each access.
+      An initiator doing back-to-back accesses (the pipelined core) needs ``max_burst``.
+
+    With ``max_burst`` > 0, the owner is also released after ``max_burst`` consecutive
+    transactions (at the end of a burst) even if it keeps ``cyc`` and ``stb``. A locked
+    sequence is never released.
+
+    ``waiting`` flags the initiators requesting the bus without the grant.
 
     Parameters
     ----------
@@ -34,19 +53,42 @@ class _Arbiter(Arbiter):
     bus : :class:`Interface`
         Shared Wishbone bus.
     """
-    def __init__(self, *,nmasters, addr_width, data_width, granularity=None, features=...):
-        self.grant = Signal(range(nmasters))
+    POLICIES = ['round-robin', 'priority', 'weighted']
+
+    def __init__(self, *,nmasters, addr_width, data_width, granularity=None, features=...,
+                 policy='round-robin', weights=None, hold=4, max_burst=0):
+        if policy not in _Arbiter.POLICIES:
+            raise ValueError(f'Invalid arbitration policy: {policy}. Valid options: {_Arbiter.POLICIES}')
+        if weights is None:
+            weights = [1] * nmasters
+        if len(weights) != nmasters or any(not isinstance(w, int) or w < 1 for w in weights):
+            raise ValueError(f'Invalid arbitration weights: {weights}. Must be a positive integer for each of the {nmasters} masters')
+        if hold < 0:
+            raise ValueError(f'Invalid hold time: {hold}. Must be positive, or 0 (no hold)')
+        if max_burst < 0:
+            raise ValueError(f'Invalid maximum burst length: {max_burst}. Must be positive, or 0 (no limit)')
+        self.policy    = policy
+        self.weights   = weights
+        self.hold      = hold
+        self.max_burst = max_burst
+        self.grant     = Signal(range(nmasters))
+        self.waiting   = Signal(nmasters)
         super().__init__(addr_width=addr_width, data_width=data_width,
                          granularity=granularity, features=features)
 
     def elaborate(self, platform):
         m = Module()
 
-        requests = Signal(len(self._intrs))
-        grant    = Signal(range(len(self._intrs)))
+        requests   = Signal(len(self._intrs))
+        grant      = Signal(range(len(self._intrs)))
+        next_grant = Signal.like(grant)
+        release    = Signal()
+        credit     = Signal(range(max(self.weights) + 1), reset=self.weights[0])  # weighted: transactions left for the owner
+        gap        = Signal(range(self.hold + 1), reset=self.hold)                  # weighted: cycles left to hold the bus for the owner
         m.d.comb += [
             self.grant.eq(grant),  # I need this...
-            requests.eq(Cat(intr_bus.cyc for intr_bus in self._intrs))
+            requests.eq(Cat(intr_bus.cyc for intr_bus in self._intrs)),
+            self.waiting.eq(requests & ~(1 << grant))
         ]
 
         bus_busy = self.bus.cyc
@@ -57,16 +99,61 @@ class _Arbiter(Arbiter):
             # peripheral.
             bus_busy &= self.bus.lock | self.bus.stb
 
-        with m.If(~bus_busy):
+        m.d.comb += release.eq(~bus_busy)
+
+        # End of a transaction: the last beat of a burst (or a classic cycle), not locked
+        last = self.bus.ack
+        if hasattr(self.bus, "cti"):
+            last &= (self.bus.cti == CycleType.CLASSIC) | (self.bus.cti == CycleType.END_OF_BURST)
+        if hasattr(self.bus, "lock"):
+            last &= ~self.bus.lock
+
+        # Limit the number of consecutive transactions. The release only depends on the
+        # registered count: not on the next grant.
+        if self.max_burst:
+            count = Signal(range(self.max_burst))
+            with m.If(last & (count == self.max_burst - 1)):
+                m.d.comb += release.eq(1)
+            with m.If(next_grant != grant):
+                m.d.sync += count.eq(0)
+            with m.Elif(last):
+                m.d.sync += count.eq(Mux(count == self.max_burst - 1, 0, count + 1))
+
+        def round_robin():
             with m.Switch(grant):
                 for i in range(len(requests)):
                     with m.Case(i):
                         for pred in reversed(range(i)):
                             with m.If(requests[pred]):
-                                m.d.sync += grant.eq(pred)
+                                m.d.comb += next_grant.eq(pred)
                         for succ in reversed(range(i + 1, len(requests))):
                             with m.If(requests[succ]):
-                                m.d.sync += grant.eq(succ)
+                                m.d.comb += next_grant.eq(succ)
+
+        m.d.comb += next_grant.eq(grant)
+        with m.If(release):
+            if self.policy == 'priority':
+                for i in reversed(range(len(requests))):
+                    with m.If(requests[i]):
+                        m.d.comb += next_grant.eq(i)
+            elif self.policy == 'weighted':
+                with m.If((credit == 0) | (~requests.bit_select(grant, 1) & (gap == 0))):
+                    round_robin()
+            else:
+                round_robin()
+        m.d.sync += grant.eq(next_grant)
+
+        if self.policy == 'weighted':
+            weights = Array(Const(w) for w in self.weights)
+            with m.If(next_grant != grant):
+                m.d.sync += credit.eq(weights[next_grant])
+            with m.Elif(last & (credit != 0)):
+                m.d.sync += credit.eq(credit - 1)
+            # hold the bus for an owner with credit between two transactions
+            with m.If((next_grant != grant) | requests.bit_select(grant, 1)):
+                m.d.sync += gap.eq(self.hold)
+            with m.Elif(gap != 0):
+                m.d.sync += gap.eq(gap - 1)
 
         with m.Switch(grant):
             for i, intr_bus in enumerate(self._intrs):
@@ -103,10 +190,91 @@ class _Arbiter(Arbiter):
         return m
 
 
+class _RegisterSlice(Elaboratable):
+    """Register slice for a Wishbone port.
+
+    The request is registered before it goes to the slave, and the response (data, ack, err)
+    is registered before it goes back to the master: the slice breaks the combinational path
+    in both directions, and adds two cycles to each access. Bursts are done as single
+    (classic) accesses.
+    """
+    def __init__(self, *, addr_width, features) -> None:
+        self.cpu = Interface(addr_width=addr_width, data_width=32, granularity=8, features=features, name='slice_cpu')
+        self.bus = Interface(addr_width=addr_width, data_width=32, granularity=8, features=features, name='slice')
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        r_dat_r = Signal(32)
+        r_err   = Signal()
+        r_abort = Signal()  # the master left the cycle: drop the response
+        error   = Signal()
+        if hasattr(self.bus, 'err'):
+            m.d.comb += error.eq(self.bus.err)
+
+        with m.FSM(name='slice'):
+            with m.State('IDLE'):
+                with m.If(self.cpu.cyc & self.cpu.stb):
+                    m.d.sync += [
+                        self.bus.adr.eq(self.cpu.adr),
+                        self.bus.dat_w.eq(self.cpu.dat_w),
+                        self.bus.sel.eq(self.cpu.sel),
+                        self.bus.we.eq(self.cpu.we),
+                        r_abort.eq(0)
+                    ]
+                    if hasattr(self.bus, 'lock'):
+                        m.d.sync += self.bus.lock.eq(self.cpu.lock)
+                    m.next = 'REQUEST'
+            with m.State('REQUEST'):
+                m.d.comb += [
+                    self.bus.cyc.eq(1),
+                    self.bus.stb.eq(1)
+                ]
+                with m.If(~self.cpu.cyc):
+                    m.d.sync += r_abort.eq(1)
+                with m.If(self.bus.ack | error):
+                    m.d.sync += [
+                        r_dat_r.eq(self.bus.dat_r),
+                        r_err.eq(error)
+                    ]
+                    m.next = 'RESPONSE'
+            with m.State('RESPONSE'):
+                with m.If(self.cpu.cyc & ~r_abort):
+                    m.d.comb += [
+                        self.cpu.dat_r.eq(r_dat_r),
+                        self.cpu.ack.eq(~r_err)
+                    ]
+                    if hasattr(self.cpu, 'err'):
+                        m.d.comb += self.cpu.err.eq(r_err)
+                m.next = 'IDLE'
+
+        # single accesses
+        if hasattr(self.bus, 'cti'):
+            m.d.comb += self.bus.cti.eq(CycleType.CLASSIC)
+        if hasattr(self.bus, 'bte'):
+            m.d.comb += self.bus.bte.eq(BurstTypeExt.LINEAR)
+
+        return m
+
+
 class XBAR(Elaboratable):
-    def __init__(self, *, masters, slaves, features) -> None:
-        self.masters = masters
-        self.slaves  = slaves
+    """Crossbar: an address decoder for each master, and an arbiter for each slave, so masters
+    accessing different slaves do not wait for each other.
+
+    With `registered`, a register slice is inserted between each arbiter and its slave. The
+    paths from the masters (decode, arbitration) and from the slave end in a register.
+
+    `arbitration` selects the arbitration policy for each slave (by name): a dictionary with
+    the arguments of the arbiter (policy, weights, hold, max_burst). `waiting` flags the masters
+    waiting for the grant of a slave.
+    """
+    def __init__(self, *, masters, slaves, features, amo=None, lrsc_granule=4, lrsc_timeout=0, registered=False, arbitration={}) -> None:
+        # amo: AMO operation (sideband) of each master, for near-memory AMOs
+        self.masters    = masters
+        self.slaves     = slaves
+        self.amo        = amo
+        self.registered = registered
+        self.waiting    = Signal(len(masters))  # output
 
         # create the matrix
         access = [[Interface(addr_width=slave.addr_width,
@@ -126,15 +294,24 @@ class XBAR(Elaboratable):
                 decoder.add(bus, addr=slave.addr_start)
 
         # Arbiters for each column/slave
-        self.arbiters = [_Arbiter(nmasters=len(self.masters), addr_width=slave.addr_width, data_width=32, granularity=8, features=features) for slave in slaves]
+        self.arbiters = [_Arbiter(nmasters=len(self.masters),
+                                  addr_width=slave.addr_width,
+                                  data_width=32,
+                                  granularity=8,
+                                  features=features,
+                                  **arbitration.get(slave.name, {})) for slave in slaves]
         for column, arbiter in zip(zip(*access), self.arbiters):
             for bus in column:
                 arbiter.add(bus)
 
-        if 'lock' in features:
-            nmasters     = len(masters)
-            self.atomics = True
-            self.lrsc    = [LRSC(nmasters=nmasters) for _ in slaves]
+        self.atomics = 'lock' in features
+        if self.atomics:
+            nmasters  = len(masters)
+            self.lrsc = [LRSC(nmasters=nmasters, granule=lrsc_granule, timeout=lrsc_timeout) for _ in slaves]
+        if self.amo is not None:
+            self.amounits = [AMOUnit(addr_width=slave.addr_width, features=features) for slave in slaves]
+        if self.registered:
+            self.slices = [_RegisterSlice(addr_width=slave.addr_width, features=features) for slave in slaves]
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
@@ -144,15 +321,93 @@ class XBAR(Elaboratable):
             setattr(m.submodules, f'decoder_{idx}', decoder)  # get a proper name in the trace
             m.d.comb += master.connect(decoder.bus)
 
-        # connect arbiter <-> slave
-        for idx, (arbiter, slave) in enumerate(zip(self.arbiters, self.slaves)):
+        # a master waits for one slave at a time
+        waiting = 0
+        for arbiter in self.arbiters:
+            waiting |= arbiter.waiting
+        m.d.comb += self.waiting.eq(waiting)
+
+        # connect arbiter <-> slave. With register slices: arbiter <-> slice <-> slave.
+        # With near-memory AMOs: arbiter <-> AMO unit <-> (slice <->) slave
+        targets = [slave.interface for slave in self.slaves]
+        if self.registered:
+            for idx, (regslice, slave) in enumerate(zip(self.slices, self.slaves)):
+                setattr(m.submodules, f'slice_{slave.name}', regslice)
+                m.d.comb += regslice.bus.connect(slave.interface)
+                targets[idx] = regslice.cpu
+        if self.amo is not None:
+            ops = Array(self.amo)
+            for idx, (amounit, arbiter, slave) in enumerate(zip(self.amounits, self.arbiters, self.slaves)):
+                setattr(m.submodules, f'amo_{slave.name}', amounit)
+                m.d.comb += [
+                    amounit.op.eq(ops[arbiter.grant]),
+                    amounit.bus.connect(targets[idx])
+                ]
+                targets[idx] = amounit.cpu
+
+        for idx, (arbiter, slave, target) in enumerate(zip(self.arbiters, self.slaves, targets)):
             setattr(m.submodules, f'arbiter_{idx}_{slave.name}', arbiter)  # get a proper name in the trace
-            m.d.comb += arbiter.bus.connect(slave.interface)
+            m.d.comb += arbiter.bus.connect(target)
 
         if self.atomics:
-            for lrsc, slave, arbiter in zip(self.lrsc, self.slaves, self.arbiters):
+            for idx, (lrsc, slave, arbiter, target) in enumerate(zip(self.lrsc, self.slaves, self.arbiters, targets)):
                 setattr(m.submodules, f'lrsc_{slave.name}', lrsc)
                 # do the connection
-                lrsc.tap_bus(m=m, idx=arbiter.grant, master=arbiter.bus, slave=slave.interface)
+                amo = 0 if self.amo is None else (self.amounits[idx].op != Funct5.SC)
+                lrsc.tap_bus(m=m, idx=arbiter.grant, master=arbiter.bus, slave=target, amo=amo)
+
+        return m
+
+
+class SharedBus(Elaboratable):
+    """Shared bus: a single arbiter for all the masters, followed by the address decoder.
+
+    Only one master accesses the slaves at a time, but it needs a single arbiter, LR/SC
+    module and AMO unit for all the slaves: smaller than the crossbar. `arbitration` has the
+    arguments of the arbiter (policy, weights, hold, max_burst).
+    """
+    def __init__(self, *, masters, slaves, features, amo=None, lrsc_granule=4, lrsc_timeout=0, arbitration={}) -> None:
+        # amo: AMO operation (sideband) of each master, for near-memory AMOs
+        self.masters = masters
+        self.slaves  = slaves
+        self.amo     = amo
+
+        self.arbiter = _Arbiter(nmasters=len(masters), addr_width=30, data_width=32, granularity=8, features=features, **arbitration)
+        self.waiting = self.arbiter.waiting  # output
+        for master in masters:
+            self.arbiter.add(master)
+
+        self.decoder = Decoder(addr_width=30, data_width=32, granularity=8, features=features)
+        for slave in slaves:
+            self.decoder.add(slave.interface, addr=slave.addr_start)
+
+        self.atomics = 'lock' in features
+        if self.atomics:
+            self.lrsc = LRSC(nmasters=len(masters), granule=lrsc_granule, timeout=lrsc_timeout)
+        if self.amo is not None:
+            self.amounit = AMOUnit(features=features)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+
+        m.submodules.arbiter = self.arbiter
+        m.submodules.decoder = self.decoder
+
+        # arbiter <-> (AMO unit <->) decoder
+        target = self.decoder.bus
+        amo    = 0
+        if self.amo is not None:
+            m.submodules.amo = self.amounit
+            m.d.comb += [
+                self.amounit.op.eq(Array(self.amo)[self.arbiter.grant]),
+                self.amounit.bus.connect(self.decoder.bus)
+            ]
+            target = self.amounit.cpu
+            amo    = self.amounit.op != Funct5.SC
+        m.d.comb += self.arbiter.bus.connect(target)
+
+        if self.atomics:
+            m.submodules.lrsc = self.lrsc
+            self.lrsc.tap_bus(m=m, idx=self.arbiter.grant, master=self.arbiter.bus, slave=target, amo=amo)
 
         return m
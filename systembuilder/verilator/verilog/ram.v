@@ -83,11 +83,12 @@ module ram #(
 
     always @(posedge clk) begin
         dwbs_dat_r <= 32'hx;
+        // writes use the current address: d_addr points to the next beat during a burst
         if (dwbs_we && d_valid && dwbs_ack) begin
-            if (dwbs_sel[0]) mem[d_addr + 0] <= dwbs_dat_w[0+:8];
-            if (dwbs_sel[1]) mem[d_addr + 1] <= dwbs_dat_w[8+:8];
-            if (dwbs_sel[2]) mem[d_addr + 2] <= dwbs_dat_w[16+:8];
-            if (dwbs_sel[3]) mem[d_addr + 3] <= dwbs_dat_w[24+:8];
+            if (dwbs_sel[0]) mem[_d_addr + 0] <= dwbs_dat_w[0+:8];
+            if (dwbs_sel[1]) mem[_d_addr + 1] <= dwbs_dat_w[8+:8];
+            if (dwbs_sel[2]) mem[_d_addr + 2] <= dwbs_dat_w[16+:8];
+            if (dwbs_sel[3]) mem[_d_addr + 3] <= dwbs_dat_w[24+:8];
         end else begin
             dwbs_dat_r[7:0]    <= mem[d_addr + 0];
             dwbs_dat_r[15:8]   <= mem[d_addr + 1];
@@ -13,6 +13,8 @@ module top (
     output wire        io__we,
     output wire        io__cyc,
     output wire        io__stb,
+    output wire [2:0]  io__cti,
+    output wire [1:0]  io__bte,
     input wire [31:0]  io__dat_r,
     input wire         io__ack,
     input wire         io__err,
@@ -28,6 +30,8 @@ module top (
     wire                     mport__we;
     wire                     mport__cyc;
     wire                     mport__stb;
+    wire [2:0]               mport__cti;
+    wire [1:0]               mport__bte;
     wire [31:0]              mport__dat_r;
     wire                     mport__ack;
     wire                     mport__err;
@@ -39,6 +43,8 @@ module top (
                      .mport__cyc         (mport__cyc),
                      .mport__stb         (mport__stb),
                      .mport__we          (mport__we),
+                     .mport__cti         (mport__cti),
+                     .mport__bte         (mport__bte),
                      .interrupts         (interrupts),
                      .io__adr            (io__addr),
                      .io__dat_w          (io__dat_w),
@@ -46,6 +52,8 @@ module top (
                      .io__cyc            (io__cyc),
                      .io__stb            (io__stb),
                      .io__we             (io__we),
+                     .io__cti            (io__cti),
+                     .io__bte            (io__bte),
                      // Inputs
                      .clk                (clk),
                      .rst                (rst),
@@ -73,8 +81,8 @@ module top (
                     .dwbs_sel          (mport__sel),
                     .dwbs_cyc          (mport__cyc),
                     .dwbs_stb          (mport__stb),
-                    .dwbs_cti          (0),
-                    .dwbs_bte          (0),
+                    .dwbs_cti          (mport__cti),
+                    .dwbs_bte          (mport__bte),
                     .dwbs_we           (mport__we)
                     );
     //--------------------------------------------------------------------------